@@ -23,28 +23,264 @@ Background concurrency
 """
 
 # Standard Library
-from asyncio import Semaphore, TimeoutError, wait_for
-from random import random, randrange
+from asyncio import (
+    Future,
+    Task,
+    TimeoutError,
+    ensure_future,
+    get_event_loop,
+    shield,
+    sleep,
+    wait_for,
+)
+from collections import defaultdict, deque
+from functools import lru_cache
+from heapq import heappop, heappush
+from itertools import count
+from math import ceil
+import time
+from typing import Deque, Dict, List, Optional, Tuple
 
 # Third Party
 from fastapi import HTTPException, status
 
+# Internal
+from .position_authentication import AdaptiveLimiter
+from ..config import get_concurrency_settings
+
+# --------------------------------------------------------------------------------------------
+
+Client = Tuple[str, str, Optional[str]]
+"""(source_app, client_id, user_id)"""
+
+
+class _TokenBucket:
+    """Token bucket of a client, the tokens can be reserved in advance"""
+
+    def __init__(self, rate: float, burst: float):
+        """
+        :param rate: tokens added every second
+        :param burst: max number of tokens
+        """
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def reserve(self) -> float:
+        """
+        Reserve a token
+
+        :return: seconds to wait before the token is available
+        """
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return max(0.0, -self.tokens / self.rate)
+
+    def cancel(self) -> None:
+        """Give back a reserved token"""
+        self.tokens += 1
+
+
+class _AdmissionController:
+    """
+    Admission of the requests that add a background task.
+    A client is identified by its app, its client_id and its user_id. Every client is
+    limited by its own token bucket, then the clients wait for a free slot of the
+    semaphore in a weighted fair queue, so a noisy client can't starve the others,
+    not even the other clients of its app. The slot is reserved when the request is
+    admitted and used by its background task, so a burst can't exceed the semaphore.
+    The Retry-After of a rejected request is computed from its position
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        burst: float,
+        weights: Dict[str, float],
+        timeout: float,
+        max_retry_after: int,
+    ):
+        """
+        :param rate: requests per second admitted for every client of weight 1
+        :param burst: requests admitted at once for every client of weight 1
+        :param weights: weight of the clients of every app, 1 if not present
+        :param timeout: max seconds a request waits to be admitted
+        :param max_retry_after: max seconds suggested to a rejected client
+        """
+        self.rate = rate
+        self.burst = burst
+        self.weights = weights
+        self.timeout = timeout
+        self.max_retry_after = max_retry_after
+        self._buckets: Dict[Client, _TokenBucket] = {}
+        self._tags: Dict[Client, float] = {}
+        self._virtual_time = 0.0
+        self._heap: List[Tuple[float, int, Client, Future]] = []
+        self._sequence = count()
+        self._dispatcher: Optional[Task] = None
+        self._admissions: Deque[float] = deque(maxlen=100)
+        self.admitted: Dict[Client, int] = defaultdict(int)
+        self.throttled: Dict[Client, int] = defaultdict(int)
+        self.rejected: Dict[Client, int] = defaultdict(int)
+
+    def weight(self, client: Client) -> float:
+        """Weight of a client, the one of its app"""
+        return self.weights.get(client[0], 1.0)
+
+    def throughput(self) -> float:
+        """Requests admitted every second recently"""
+        if len(self._admissions) < 2:
+            return 1.0
+        elapsed = self._admissions[-1] - self._admissions[0]
+        return (len(self._admissions) - 1) / elapsed if elapsed > 0 else 1.0
+
+    def _reject(self, client: Client, seconds: float) -> HTTPException:
+        """Build the answer for a rejected request"""
+        return HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            headers={
+                "Retry-After": str(min(self.max_retry_after, max(1, ceil(seconds))))
+            },
+        )
+
+    def _admit(self, client: Client) -> None:
+        """Count an admitted request"""
+        self.admitted[client] += 1
+        self._admissions.append(time.monotonic())
+
+    async def admit(
+        self,
+        source_app: str,
+        client_id: str,
+        user_id: Optional[str],
+        semaphore: AdaptiveLimiter,
+    ) -> None:
+        """
+        Wait until the request of a client can add its background task and reserve
+        a slot of the semaphore for it
+
+        :param source_app: app that made the request
+        :param client_id: client_id expressed by the token
+        :param user_id: user_id expressed by the token
+        :param semaphore: limiter of the background tasks
+        """
+        client = (source_app, client_id, user_id)
+        weight = self.weight(client)
+
+        # Limit the rate of the client
+        bucket = self._buckets.get(client)
+        if bucket is None:
+            bucket = self._buckets[client] = _TokenBucket(
+                self.rate * weight, self.burst * weight
+            )
+        delay = bucket.reserve()
+        if delay > self.timeout:
+            bucket.cancel()
+            self.throttled[client] += 1
+            raise self._reject(client, delay)
+        if delay:
+            await sleep(delay)
+
+        if not self._heap and not semaphore.locked():
+            await semaphore.reserve(self.timeout)
+            self._admit(client)
+            return
+
+        # Wait for a free slot in the weighted fair queue
+        tag = max(self._virtual_time, self._tags.get(client, 0.0)) + 1 / weight
+        self._tags[client] = tag
+        future = get_event_loop().create_future()
+        heappush(self._heap, (tag, next(self._sequence), client, future))
+        if self._dispatcher is None:
+            self._dispatcher = ensure_future(self._dispatch(semaphore))
+
+        try:
+            await wait_for(shield(future), self.timeout)
+        except TimeoutError:
+            if future.done():
+                return
+            future.cancel()
+            position = sum(
+                1
+                for waiting_tag, _, _, waiting in self._heap
+                if waiting_tag < tag and not waiting.done()
+            )
+            self.rejected[client] += 1
+            raise self._reject(client, (position + 1) / self.throughput())
+
+    async def _dispatch(self, semaphore: AdaptiveLimiter) -> None:
+        """Admit the waiting requests in order of virtual finish time"""
+        try:
+            while self._heap:
+                if self._heap[0][3].done():
+                    heappop(self._heap)
+                    continue
+
+                # Reserve a free slot for the next request
+                await semaphore.reserve(self.timeout)
+
+                while self._heap:
+                    tag, _, client, future = heappop(self._heap)
+                    if not future.done():
+                        self._virtual_time = tag
+                        future.set_result(None)
+                        self._admit(client)
+                        break
+                else:
+                    # Every request left the queue meanwhile
+                    semaphore.release_reservation()
+        finally:
+            self._dispatcher = None
+
+    def stats(self) -> dict:
+        """Counters of every client"""
+        return {
+            "waiting": sum(1 for _, _, _, future in self._heap if not future.done()),
+            "throughput": self.throughput(),
+            "clients": {
+                "/".join(str(part) for part in client): {
+                    "weight": self.weight(client),
+                    "admitted": self.admitted[client],
+                    "throttled": self.throttled[client],
+                    "rejected": self.rejected[client],
+                }
+                for client in self._buckets
+            },
+        }
+
+
+@lru_cache(maxsize=1)
+def _get_admission_controller() -> _AdmissionController:
+    """Instantiate a singleton _AdmissionController"""
+    settings = get_concurrency_settings()
+    return _AdmissionController(
+        rate=settings.admission_rate,
+        burst=settings.admission_burst,
+        weights=settings.admission_weights,
+        timeout=settings.admission_timeout,
+        max_retry_after=settings.admission_max_retry_after,
+    )
+
+
+ADMISSION = _get_admission_controller()
+"""Admission controller Singleton"""
+
 # --------------------------------------------------------------------------------------------
 
 
-async def frequency_limiter(sem: Semaphore) -> None:
+async def frequency_limiter(
+    sem: AdaptiveLimiter, source_app: str, client_id: str, user_id: Optional[str]
+) -> None:
     """
     Function that must be used only inside router module
     to wait some time before answer to the client and let the background task to start
 
     :param sem: semaphore to store iot or user data
+    :param source_app: app that made the request
+    :param client_id: client_id expressed by the token
+    :param user_id: user_id expressed by the token
     """
-    try:
-        await wait_for(sem.acquire(), 1)
-        sem.release()
-
-    except TimeoutError:
-        raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            headers={"Retry-After": str(randrange(1, 29) * random() + 1)},
-        )
+    await ADMISSION.admit(source_app, client_id, user_id, sem)
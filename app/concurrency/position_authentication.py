@@ -23,31 +23,385 @@ Position Authentication concurrency
 """
 
 # Standard Library
-from asyncio import Lock, Semaphore
+from asyncio import (
+    CancelledError,
+    Future,
+    Task,
+    TimerHandle,
+    current_task,
+    get_event_loop,
+)
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
 from functools import lru_cache
+from math import ceil
+import time
+from typing import AsyncIterator, Deque, Dict, Tuple
+
+# Third Party
+from fastapi import HTTPException, status
+
+# Internal
+from ..config import get_concurrency_settings
+
+# --------------------------------------------------------------------------------------------
+
+
+class AdaptiveLimiter:
+    """
+    Semaphore whose limit follows the latency of the work it protects (AIMD).
+    The limit grows by one every limit calls while the latency stays close to the
+    minimum observed recently, and it's cut by a factor when the latency rises
+    or the work fails, once for all the works started before the previous cut.
+    The latency is measured per position, so a long journey doesn't look like congestion.
+    A slot can be reserved in advance for a work that starts later in another task
+    """
+
+    def __init__(
+        self,
+        initial: int,
+        min_limit: int,
+        max_limit: int,
+        tolerance: float,
+        backoff: float,
+        window: int,
+    ):
+        """
+        :param initial: starting limit
+        :param min_limit: lowest limit
+        :param max_limit: highest limit
+        :param tolerance: ratio between latency and minimum latency considered congestion
+        :param backoff: factor applied to the limit in case of congestion
+        :param window: number of latencies considered to find the minimum one
+        """
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.in_flight = 0
+        self._waiters: Deque[Future] = deque()
+        self._started: Dict[Task, float] = {}
+        self._units: Dict[Task, int] = {}
+        self._reservations: Deque[Tuple[float, TimerHandle]] = deque()
+        self._latencies: Deque[float] = deque(maxlen=window)
+        self._last_decrease = 0.0
+        self.latency = 0.0
+        self.queue_delay = 0.0
+        self.increases = 0
+        self.decreases = 0
+
+    def locked(self) -> bool:
+        """True if acquire would wait"""
+        return self.in_flight >= int(self.limit) or any(
+            not waiter.done() for waiter in self._waiters
+        )
+
+    async def acquire(self) -> bool:
+        """Wait for a free slot"""
+        if not self.locked():
+            self.in_flight += 1
+            self._observe_delay(0.0)
+            return True
+
+        start = time.monotonic()
+        future = get_event_loop().create_future()
+        self._waiters.append(future)
+        try:
+            await future
+        except CancelledError:
+            if future.cancelled():
+                # The future may be already dropped by _wake_up
+                if future in self._waiters:
+                    self._waiters.remove(future)
+            else:
+                # The slot was already handed over
+                self.release()
+            raise
+
+        self._observe_delay(time.monotonic() - start)
+        return True
+
+    def release(self) -> None:
+        """Free a slot"""
+        self.in_flight -= 1
+        self._wake_up()
+
+    async def reserve(self, ttl: float) -> None:
+        """
+        Wait for a free slot and keep it for the next work entering the limiter
+
+        :param ttl: seconds after which the slot is freed if no work used it
+        """
+        await self.acquire()
+        loop = get_event_loop()
+        deadline = loop.time() + ttl
+        self._reservations.append(
+            (deadline, loop.call_at(deadline, self._expire_reservation, deadline))
+        )
+
+    def release_reservation(self) -> None:
+        """Free a reserved slot no work will use"""
+        if self._reservations:
+            self._reservations.pop()[1].cancel()
+            self.release()
+
+    def _expire_reservation(self, deadline: float) -> None:
+        """
+        Free a reserved slot no work used in time
+
+        :param deadline: loop time at which the reservation expired
+        """
+        for reservation in self._reservations:
+            if reservation[0] == deadline:
+                self._reservations.remove(reservation)
+                self.release()
+                return
+
+    def _wake_up(self) -> None:
+        """Hand the free slots to the waiters"""
+        while self._waiters and self.in_flight < int(self.limit):
+            future = self._waiters.popleft()
+            if not future.done():
+                self.in_flight += 1
+                future.set_result(None)
+
+    def _observe_delay(self, seconds: float) -> None:
+        """Moving average of the time spent waiting for a slot"""
+        self.queue_delay += 0.1 * (seconds - self.queue_delay)
+
+    def _observe(
+        self, start: float, latency: float, failed: bool, saturated: bool
+    ) -> None:
+        """
+        Adapt the limit to the latency of a work
+
+        :param start: when the work started
+        :param latency: seconds the slot was held for every position
+        :param failed: True if the work raised an error
+        :param saturated: True if at least half of the limit was in use
+        """
+        self.latency = latency
+        self._latencies.append(latency)
+        if failed or latency > min(self._latencies) * self.tolerance:
+            # The works started before the previous cut don't reflect it
+            if start > self._last_decrease:
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+                self._last_decrease = time.monotonic()
+                self.decreases += 1
+
+        elif saturated and self.limit < self.max_limit:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self.increases += 1
+            self._wake_up()
+
+    def weigh(self, positions: int) -> None:
+        """
+        Declare how many positions the slot of the current task serves, call this
+        method only inside the slot
+
+        :param positions: number of positions, the latency is divided by it
+        """
+        self._units[current_task()] = max(1, positions)
+
+    async def __aenter__(self) -> None:
+        if self._reservations:
+            # The slot is already held
+            self._reservations.popleft()[1].cancel()
+        else:
+            await self.acquire()
+        self._started[current_task()] = time.monotonic()
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        task = current_task()
+        start = self._started.pop(task)
+        positions = self._units.pop(task, 1)
+        saturated = self.in_flight * 2 >= self.limit
+        self.release()
+        if exc_type is not CancelledError:
+            self._observe(
+                start,
+                (time.monotonic() - start) / positions,
+                exc_type is not None,
+                saturated,
+            )
+
+    def stats(self) -> dict:
+        """Current limit and counters of the limiter"""
+        return {
+            "limit": int(self.limit),
+            "in_flight": self.in_flight,
+            "reserved": len(self._reservations),
+            "waiting": sum(1 for waiter in self._waiters if not waiter.done()),
+            "queue_delay": self.queue_delay,
+            "latency": self.latency,
+            "min_latency": min(self._latencies) if self._latencies else 0.0,
+            "increases": self.increases,
+            "decreases": self.decreases,
+        }
+
 
 # --------------------------------------------------------------------------------------------
 
 
 @lru_cache(maxsize=1)
-def store_semaphore() -> Semaphore:
+def store_semaphore() -> AdaptiveLimiter:
     """Synchronize the position to store in order to avoid starvation"""
-    return Semaphore(25)
+    settings = get_concurrency_settings()
+    return AdaptiveLimiter(
+        initial=settings.store_limit,
+        min_limit=settings.store_limit_min,
+        max_limit=settings.store_limit_max,
+        tolerance=settings.adaptive_tolerance,
+        backoff=settings.adaptive_backoff,
+        window=settings.adaptive_window,
+    )
 
 
 # --------------------------------------------------------------------------------------------
 
 
 @lru_cache(maxsize=1)
-def position_auth() -> Semaphore:
+def position_auth() -> AdaptiveLimiter:
     """Synchronize position authorization requests to prevent starvation"""
-    return Semaphore(10)
+    settings = get_concurrency_settings()
+    return AdaptiveLimiter(
+        initial=settings.position_auth_limit,
+        min_limit=settings.position_auth_limit_min,
+        max_limit=settings.position_auth_limit_max,
+        tolerance=settings.adaptive_tolerance,
+        backoff=settings.adaptive_backoff,
+        window=settings.adaptive_window,
+    )
 
 
 # --------------------------------------------------------------------------------------------
 
 
+class PositionTestPool:
+    """
+    Bounded pool of the tests on the position authentication.
+    The waiting tests are queued by client and the free slots are handed
+    to the clients in round robin, so that a client can't starve the others
+    """
+
+    def __init__(self, size: int, max_queue: int):
+        """
+        :param size: number of tests running concurrently
+        :param max_queue: max number of tests waiting for a slot
+        """
+        self.size = size
+        self.max_queue = max_queue
+        self.running = 0
+        self.waiting = 0
+        self._queues: "OrderedDict[str, Deque[Future]]" = OrderedDict()
+        self.served = 0
+        self.rejected = 0
+        self.busy_time = 0.0
+        self.wait_time = 0.0
+
+    def retry_after(self) -> int:
+        """Seconds a rejected client should wait before retrying"""
+        service_time = self.busy_time / self.served if self.served else 1.0
+        return max(1, ceil(service_time * (self.waiting / self.size + 1)))
+
+    async def acquire(self, client: str) -> float:
+        """
+        Wait for a free slot
+
+        :param client: client that requested the test
+        :return: seconds waited in queue
+        """
+        if self.running < self.size and not self.waiting:
+            self.running += 1
+            return 0.0
+
+        if self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many tests in queue",
+                headers={"Retry-After": str(self.retry_after())},
+            )
+
+        start = time.monotonic()
+        future = get_event_loop().create_future()
+        queue = self._queues.setdefault(client, deque())
+        queue.append(future)
+        self.waiting += 1
+
+        try:
+            await future
+        except CancelledError:
+            if future.cancelled():
+                # Leave the queue, unless release already dropped the future
+                if future in queue:
+                    queue.remove(future)
+                    self.waiting -= 1
+                if not queue and self._queues.get(client) is queue:
+                    del self._queues[client]
+            else:
+                # The slot was already handed over
+                self.release()
+            raise
+
+        waited = time.monotonic() - start
+        self.wait_time += waited
+        return waited
+
+    def release(self) -> None:
+        """Hand the slot to the next client in queue or free it"""
+        while self._queues:
+            client, queue = next(iter(self._queues.items()))
+            future = queue.popleft()
+            if queue:
+                self._queues.move_to_end(client)
+            else:
+                del self._queues[client]
+            self.waiting -= 1
+
+            # Skip the waiters cancelled that didn't leave the queue yet
+            if not future.done():
+                future.set_result(None)
+                return
+
+        self.running -= 1
+
+    @asynccontextmanager
+    async def slot(self, client: str) -> AsyncIterator[float]:
+        """
+        Run a test inside a slot of the pool
+
+        :param client: client that requested the test
+        :return: seconds waited in queue
+        """
+        waited = await self.acquire(client)
+        start = time.monotonic()
+        try:
+            yield waited
+        finally:
+            self.served += 1
+            self.busy_time += time.monotonic() - start
+            self.release()
+
+    def stats(self) -> dict:
+        """Counters of the pool"""
+        return {
+            "size": self.size,
+            "running": self.running,
+            "waiting": self.waiting,
+            "clients_waiting": len(self._queues),
+            "served": self.served,
+            "rejected": self.rejected,
+            "mean_wait_time": self.wait_time / self.served if self.served else 0.0,
+            "mean_busy_time": self.busy_time / self.served if self.served else 0.0,
+        }
+
+
 @lru_cache(maxsize=1)
-def position_test_lock() -> Lock:
-    """Lock to prevent more than one test on the position authentication"""
-    return Lock()
+def position_test_pool() -> PositionTestPool:
+    """Pool to bound and share fairly the tests on the position authentication"""
+    settings = get_concurrency_settings()
+    return PositionTestPool(
+        size=settings.test_pool_size, max_queue=settings.test_pool_max_queue
+    )
@@ -0,0 +1,284 @@
+"""
+Payload validation concurrency
+
+:author: Angelo Cutaia
+:copyright: Copyright 2021, LINKS Foundation
+:version: 1.0.0
+
+..
+
+    Copyright 2021 LINKS Foundation
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+        https://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+# Standard Library
+from asyncio import (
+    Task,
+    ensure_future,
+    get_running_loop,
+    sleep,
+    wrap_future,
+)
+from concurrent.futures import Future, ProcessPoolExecutor
+from functools import lru_cache
+from multiprocessing import get_context
+import time
+from typing import Any, List, Optional, Set, Type, TypeVar, Union
+
+# Third Party
+from fastapi import HTTPException, status
+import orjson
+from pydantic import BaseModel, ValidationError
+
+# Internal
+from ..config import get_concurrency_settings
+
+# --------------------------------------------------------------------------------------------
+
+Model = TypeVar("Model", bound=BaseModel)
+
+
+def _parse(model: Type[Model], body: bytes) -> Union[Model, List[dict]]:
+    """
+    Parse and validate a body
+
+    :param model: model of the body
+    :param body: body of the request
+    :return: the validated model or the errors in the format of FastAPI
+    """
+    try:
+        return model.parse_obj(orjson.loads(body))
+    except orjson.JSONDecodeError as exc:
+        return [
+            {
+                "loc": ["body", exc.pos],
+                "msg": "Expecting value",
+                "type": "value_error.jsondecode",
+            }
+        ]
+    except ValidationError as exc:
+        return [{**error, "loc": ["body", *error["loc"]]} for error in exc.errors()]
+
+
+class _Fields(tuple):
+    """Model class followed by the values of its fields"""
+
+
+def _compact(value: Any) -> Any:
+    """
+    :param value: validated value
+    :return: the value with every model replaced by its class and the values of its fields
+    """
+    if isinstance(value, BaseModel):
+        return _Fields(
+            (
+                type(value),
+                *(_compact(getattr(value, name)) for name in value.__fields__),
+            )
+        )
+    if isinstance(value, list):
+        return [_compact(element) for element in value]
+    if isinstance(value, tuple):
+        return tuple(_compact(element) for element in value)
+    if isinstance(value, dict):
+        return {key: _compact(element) for key, element in value.items()}
+    return value
+
+
+def _rebuild(value: Any) -> Any:
+    """
+    Rebuild the models of a value built by _compact without validating them again
+
+    :param value: value built by _compact
+    :return: the validated value
+    """
+    if isinstance(value, _Fields):
+        model = value[0]
+        return model.construct(
+            **{
+                name: _rebuild(element)
+                for name, element in zip(model.__fields__, value[1:])
+            }
+        )
+    if isinstance(value, list):
+        return [_rebuild(element) for element in value]
+    if isinstance(value, tuple):
+        return tuple(_rebuild(element) for element in value)
+    if isinstance(value, dict):
+        return {key: _rebuild(element) for key, element in value.items()}
+    return value
+
+
+def _parse_compact(model: Type[Model], body: bytes) -> Union[_Fields, List[dict]]:
+    """
+    Parse and validate a body in a process of the pool
+
+    :param model: model of the body
+    :param body: body of the request
+    :return: the fields of the validated model or the errors in the format of FastAPI
+    """
+    result = _parse(model, body)
+    return result if isinstance(result, list) else _compact(result)
+
+
+class _Validator:
+    """
+    Validation of the bodies of the requests. The large ones are validated in a
+    pool of processes, so that the event loop keeps serving the other requests
+    while they're parsed. A body is offloaded if it's larger than the threshold or
+    if validating it in the event loop would push the lag of the loop over the target,
+    according to the lag measured and to the time spent validating every byte.
+    The pool sends back only the fields of the validated model
+    """
+
+    def __init__(
+        self,
+        processes: int,
+        threshold: int,
+        min_offload: int,
+        lag_target: float,
+        lag_interval: float,
+    ):
+        """
+        :param processes: size of the pool, 0 to validate every body in the event loop
+        :param threshold: size in bytes of the bodies always validated in the pool
+        :param min_offload: size in bytes of the bodies never validated in the pool
+        :param lag_target: seconds the event loop can lag
+        :param lag_interval: seconds between two measures of the lag
+        """
+        self.processes = processes
+        self.threshold = threshold
+        self.min_offload = min_offload
+        self.lag_target = lag_target
+        self.lag_interval = lag_interval
+        self.executor: Optional[ProcessPoolExecutor] = None
+        self.task: Optional[Task] = None
+        self._pending: Set[Future] = set()
+        self.seconds_per_byte = 0.0
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self.inline = 0
+        self.offloaded = 0
+
+    def start(self) -> None:
+        """
+        Create the pool and start measuring the lag of the event loop, call this
+        method only inside the startup event. The processes are spawned, not forked,
+        since the worker already runs threads
+        """
+        if self.processes and self.executor is None:
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.processes, mp_context=get_context("spawn")
+            )
+        if self.task is None:
+            self.task = ensure_future(self._monitor())
+
+    async def _monitor(self) -> None:
+        """Measure the lag of the event loop forever"""
+        loop = get_running_loop()
+        while True:
+            start = loop.time()
+            await sleep(self.lag_interval)
+            lag = max(0.0, loop.time() - start - self.lag_interval)
+            self.lag += 0.2 * (lag - self.lag)
+            self.max_lag = max(self.max_lag, lag)
+
+    def _offload(self, size: int) -> bool:
+        """
+        :param size: size in bytes of the body
+        :return: True if the body must be validated in the pool
+        """
+        if self.executor is None or size < self.min_offload:
+            return False
+        if size >= self.threshold:
+            return True
+        return size * self.seconds_per_byte > self.lag_target - self.lag
+
+    async def validate(self, model: Type[Model], body: bytes) -> Model:
+        """
+        Validate a body in the event loop or in the pool
+
+        :param model: model of the body
+        :param body: body of the request
+        :return: the validated model
+        """
+        if not self._offload(len(body)):
+            self.inline += 1
+            start = time.perf_counter()
+            result = _parse(model, body)
+            if body:
+                self.seconds_per_byte += 0.1 * (
+                    (time.perf_counter() - start) / len(body) - self.seconds_per_byte
+                )
+        else:
+            self.offloaded += 1
+            future = self.executor.submit(_parse_compact, model, body)
+            self._pending.add(future)
+            future.add_done_callback(self._pending.discard)
+            result = await wrap_future(future)
+            if isinstance(result, _Fields):
+                result = _rebuild(result)
+
+        if isinstance(result, list):
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=result
+            )
+        return result
+
+    def close(self) -> None:
+        """Stop measuring the lag and the processes of the pool"""
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        if self.executor is not None:
+            # shutdown(cancel_futures=True) isn't available on Python 3.8
+            for future in list(self._pending):
+                future.cancel()
+            self.executor.shutdown()
+            self.executor = None
+
+    def stats(self) -> dict:
+        """Counters of the validations and lag of the event loop"""
+        return {
+            "processes": self.processes,
+            "threshold": self.threshold,
+            "inline": self.inline,
+            "offloaded": self.offloaded,
+            "loop_lag": self.lag,
+            "max_loop_lag": self.max_lag,
+            "lag_target": self.lag_target,
+        }
+
+
+# --------------------------------------------------------------------------------------------
+
+
+@lru_cache(maxsize=1)
+def _get_validator() -> _Validator:
+    """Instantiate a singleton _Validator"""
+    settings = get_concurrency_settings()
+    return _Validator(
+        processes=settings.validation_processes,
+        threshold=settings.validation_threshold,
+        min_offload=settings.validation_min_offload,
+        lag_target=settings.validation_lag_target,
+        lag_interval=settings.validation_lag_interval,
+    )
+
+
+# --------------------------------------------------------------------------------------------
+
+
+VALIDATOR = _get_validator()
+"""Validator Singleton"""
@@ -0,0 +1,377 @@
+"""
+Durable work queue
+
+:author: Angelo Cutaia
+:copyright: Copyright 2021, LINKS Foundation
+:version: 1.0.0
+
+..
+
+    Copyright 2021 LINKS Foundation
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+        https://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+# Standard Library
+from asyncio import (
+    CancelledError,
+    Event,
+    Task,
+    TimeoutError,
+    ensure_future,
+    get_running_loop,
+    sleep,
+    wait_for,
+)
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
+import sqlite3
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+import zlib
+
+# Third Party
+import orjson
+
+# Internal
+from ..config import get_concurrency_settings
+from ..internals.logger import get_logger
+
+# --------------------------------------------------------------------------------------------
+
+Handler = Callable[[dict, bytes], Awaitable[None]]
+"""Coroutine function that processes the metadata and the body of an item"""
+
+Item = Tuple[int, str, dict, bytes, int]
+"""(id, kind, metadata, body, attempts)"""
+
+
+class _WorkQueue:
+    """
+    Work queue stored in SQLite and shared by the workers of the host.
+    An item is leased by a consumer and deleted only once processed, so the items
+    of a worker that restarts or is killed are replayed when their lease expires.
+    The lease is renewed while the item is processed, and a failed item is released
+    after a delay that doubles at every attempt.
+    Every query runs in a dedicated writer thread, so a busy database never blocks
+    the event loop
+    """
+
+    def __init__(
+        self,
+        path: str,
+        consumers: int,
+        lease: float,
+        max_attempts: int,
+        poll_interval: float,
+        max_poll_interval: float,
+        retry_backoff: float,
+    ):
+        """
+        :param path: path of the SQLite database
+        :param consumers: number of consumers of every worker
+        :param lease: seconds an item is reserved to the consumer that took it
+        :param max_attempts: number of times an item is tried before being dropped
+        :param poll_interval: seconds an idle consumer first waits for the items of the other workers
+        :param max_poll_interval: seconds an idle consumer waits at most, the wait doubles
+            every time the queue is found empty
+        :param retry_backoff: seconds a failed item waits before its second attempt,
+            doubled at every attempt up to the lease
+        """
+        self.path = path
+        self.consumers = consumers
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.retry_backoff = retry_backoff
+        self.connection: Optional[sqlite3.Connection] = None
+        self.tasks: List[Task] = []
+        self._wakeup = Event()
+        self._writer: Optional[ThreadPoolExecutor] = None
+        self._depth = (0, 0)
+        self._depth_time = 0.0
+        self.enqueued = 0
+        self.completed = 0
+        self.replayed = 0
+        self.dropped = 0
+
+    def open(self) -> None:
+        """Open the database and create the queue if needed"""
+        if self.connection is not None:
+            return
+        self.connection = sqlite3.connect(
+            self.path, isolation_level=None, check_same_thread=False, timeout=30
+        )
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS work ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "kind TEXT NOT NULL, "
+            "metadata BLOB NOT NULL, "
+            "body BLOB NOT NULL, "
+            "attempts INTEGER NOT NULL DEFAULT 0, "
+            "leased_until REAL NOT NULL DEFAULT 0)"
+        )
+
+    def close(self) -> None:
+        """Close the database, the items left are kept for the next startup"""
+        if self._writer is not None:
+            self._writer.shutdown()
+            self._writer = None
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    async def _run(self, query: Callable[..., Any], *args: Any) -> Any:
+        """Run a query in the writer thread"""
+        if self._writer is None:
+            self._writer = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="work_queue"
+            )
+        return await get_running_loop().run_in_executor(
+            self._writer, partial(query, *args)
+        )
+
+    def _put(self, kind: str, metadata: bytes, body: bytes) -> int:
+        """Insert an item"""
+        self.open()
+        return self.connection.execute(
+            "INSERT INTO work (kind, metadata, body) VALUES (?, ?, ?)",
+            (kind, metadata, zlib.compress(body, 1)),
+        ).lastrowid
+
+    async def put(self, kind: str, metadata: dict, body: bytes) -> int:
+        """
+        Append an item to the queue
+
+        :param kind: name of the handler of the item
+        :param metadata: information about the request
+        :param body: body of the request
+        :return: id of the item
+        """
+        item_id = await self._run(self._put, kind, orjson.dumps(metadata), body)
+        self.enqueued += 1
+        self._wakeup.set()
+        return item_id
+
+    def _take(self) -> Optional[tuple]:
+        """Lease the oldest available item, writing only if there is one"""
+        self.open()
+        now = time.time()
+        row = self.connection.execute(
+            "SELECT id FROM work WHERE leased_until <= ? ORDER BY id LIMIT 1", (now,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        # Another worker may have leased it in the meantime
+        return self.connection.execute(
+            "UPDATE work SET leased_until = ?, attempts = attempts + 1 "
+            "WHERE id = ? AND leased_until <= ? "
+            "RETURNING id, kind, metadata, body, attempts",
+            (now + self.lease, row[0], now),
+        ).fetchone()
+
+    async def take(self) -> Optional[Item]:
+        """
+        Lease the oldest item not leased or whose lease is expired
+
+        :return: the item or None if the queue is empty
+        """
+        row = await self._run(self._take)
+        if row is None:
+            return None
+
+        item_id, kind, metadata, body, attempts = row
+        if attempts > 1:
+            self.replayed += 1
+        return item_id, kind, orjson.loads(metadata), zlib.decompress(body), attempts
+
+    def _ack(self, item_id: int) -> None:
+        """Delete an item"""
+        self.connection.execute("DELETE FROM work WHERE id = ?", (item_id,))
+
+    async def ack(self, item_id: int) -> None:
+        """
+        Remove a processed item from the queue
+
+        :param item_id: id of the item
+        """
+        await self._run(self._ack, item_id)
+
+    def _renew(self, item_id: int) -> None:
+        """Extend the lease of an item"""
+        self.connection.execute(
+            "UPDATE work SET leased_until = ? WHERE id = ?",
+            (time.time() + self.lease, item_id),
+        )
+
+    def _retry(self, item_id: int, delay: float) -> None:
+        """Release an item after a delay"""
+        self.connection.execute(
+            "UPDATE work SET leased_until = ? WHERE id = ?",
+            (time.time() + delay, item_id),
+        )
+
+    async def _heartbeat(self, item_id: int) -> None:
+        """Renew the lease of an item while it's processed"""
+        while True:
+            await sleep(self.lease / 3)
+            await self._run(self._renew, item_id)
+
+    def _count(self) -> Tuple[int, int]:
+        """Count the items and the leased ones"""
+        self.open()
+        return self.connection.execute(
+            "SELECT COUNT(*), COALESCE(SUM(leased_until > ?), 0) FROM work",
+            (time.time(),),
+        ).fetchone()
+
+    async def depth(self) -> Tuple[int, int]:
+        """
+        :return: number of items in queue and how many of them are leased
+        """
+        self._depth = await self._run(self._count)
+        self._depth_time = time.monotonic()
+        return self._depth
+
+    def start(self, handlers: Dict[str, Handler]) -> None:
+        """
+        Start the consumers, call this method only inside the startup event.
+        The items left by a previous run are processed first
+
+        :param handlers: coroutine function that processes every kind of item
+        """
+        self.open()
+        self._wakeup = Event()
+        self.tasks = [
+            ensure_future(self._consume(handlers)) for _ in range(self.consumers)
+        ]
+
+    async def _consume(self, handlers: Dict[str, Handler]) -> None:
+        """Process the items of the queue forever"""
+        logger = get_logger()
+
+        poll_interval = self.poll_interval
+
+        while True:
+            item = await self.take()
+            if item is None:
+                # Wait for a new item of this worker or poll the ones of the others,
+                # less and less often while the queue stays empty
+                await self.depth()
+                self._wakeup.clear()
+                try:
+                    await wait_for(self._wakeup.wait(), poll_interval)
+                    poll_interval = self.poll_interval
+                except TimeoutError:
+                    poll_interval = min(poll_interval * 2, self.max_poll_interval)
+                continue
+            poll_interval = self.poll_interval
+
+            item_id, kind, metadata, body, attempts = item
+            if attempts > self.max_attempts or kind not in handlers:
+                self.dropped += 1
+                await self.ack(item_id)
+                await logger.warning(
+                    {
+                        "kind": kind,
+                        "metadata": metadata,
+                        "attempts": attempts,
+                        "error": "Work queue item dropped",
+                    }
+                )
+                continue
+
+            heartbeat = ensure_future(self._heartbeat(item_id))
+            try:
+                await handlers[kind](metadata, body)
+            except CancelledError:
+                # The item will be replayed when its lease expires
+                raise
+            except Exception as exc:
+                await self._run(
+                    self._retry,
+                    item_id,
+                    min(self.lease, self.retry_backoff * 2 ** (attempts - 1)),
+                )
+                await logger.warning(
+                    {
+                        "kind": kind,
+                        "metadata": metadata,
+                        "attempts": attempts,
+                        "error": f"Work queue item failed: {exc!r}",
+                    }
+                )
+                continue
+            finally:
+                heartbeat.cancel()
+
+            self.completed += 1
+            await self.ack(item_id)
+
+            # Keep the depth seen by stats fresh while there is a backlog
+            if time.monotonic() - self._depth_time >= self.poll_interval:
+                await self.depth()
+
+    async def stop(self) -> None:
+        """Stop the consumers and close the database"""
+        for task in self.tasks:
+            task.cancel()
+        for task in self.tasks:
+            try:
+                await task
+            except CancelledError:
+                pass
+        self.tasks = []
+        self.close()
+
+    def stats(self) -> dict:
+        """Counters of the queue, the depth is the one last seen by the consumers"""
+        depth, leased = self._depth
+        return {
+            "depth": depth,
+            "leased": leased,
+            "consumers": len(self.tasks),
+            "enqueued": self.enqueued,
+            "completed": self.completed,
+            "replayed": self.replayed,
+            "dropped": self.dropped,
+        }
+
+
+# --------------------------------------------------------------------------------------------
+
+
+@lru_cache(maxsize=1)
+def _get_work_queue() -> _WorkQueue:
+    """Instantiate a singleton _WorkQueue"""
+    settings = get_concurrency_settings()
+    return _WorkQueue(
+        path=settings.work_queue_path,
+        consumers=settings.work_queue_consumers,
+        lease=settings.work_queue_lease,
+        max_attempts=settings.work_queue_max_attempts,
+        poll_interval=settings.work_queue_poll_interval,
+        max_poll_interval=settings.work_queue_max_poll_interval,
+        retry_backoff=settings.work_queue_retry_backoff,
+    )
+
+
+# --------------------------------------------------------------------------------------------
+
+
+WORK_QUEUE = _get_work_queue()
+"""Work queue Singleton"""
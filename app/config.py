@@ -26,7 +26,7 @@ App Settings
 from functools import lru_cache
 
 # Third Party
-from typing import Tuple
+from typing import Dict, List, Tuple
 
 from pydantic import BaseSettings
 from pydantic.env_settings import SettingsSourceCallable
@@ -69,6 +69,10 @@ class KeycloakSettings(BaseSettings):
     password: str
     grant_type: str
     client_secret: str
+    token_refresh_ratio: float = 0.75
+    token_refresh_jitter: float = 0.1
+    token_expiry_margin: float = 10
+    token_retry: float = 5
 
     class Config:
         secrets_dir = "/run/secrets"
@@ -100,6 +104,49 @@ class UbloxApiSettings(BaseSettings):
     ublox_api_galileo_uri: str
     window: int
     window_step: int
+    ublox_api_connection_limit: int = 10
+    ublox_api_keep_alive: int = 30
+    ublox_api_dns_cache: int = 300
+    lookup_cache_size: int = 100000
+    lookup_cache_ttl: int = 86400
+    lookup_cache_negative_ttl: int = 30
+    window_cache_size: int = 10000
+    batch_lookup_threshold: int = 50
+    batch_lookup_size: int = 200
+    journey_concurrency: int = 8
+    latency_window: int = 1000
+    latency_min_samples: int = 20
+    latency_refresh: int = 50
+    hedge_requests: bool = False
+    hedge_percentile: float = 95
+    hedge_delay: float = 1.0
+    breaker_window: int = 20
+    breaker_min_calls: int = 10
+    breaker_failure_rate: float = 0.5
+    breaker_slow_call: float = 3.0
+    breaker_open_time: float = 30
+    breaker_probes: int = 1
+    reference_backend: str = "ublox_api"
+    reference_store_path: str = "reference_store"
+    reference_store_refresh: int = 60
+    prefetch: bool = False
+    prefetch_interval: float = 5
+    prefetch_horizon: int = 180
+    prefetch_step: int = 1000
+    prefetch_budget: int = 20
+    sampled_source_apps: List[str] = []
+    sample_threshold: int = 500
+    sample_size: int = 200
+    sample_strata: int = 10
+    sample_suspicion_factor: float = 2
+    sample_z: float = 1.96
+    aggregate_lookups: bool = False
+    aggregate_window: float = 0.005
+    aggregate_max_size: int = 100
+    shared_cache: bool = False
+    shared_cache_slots: int = 65536
+    shared_cache_slot_size: int = 128
+    shared_cache_probe: int = 8
 
     class Config:
         env_file = ".env"
@@ -113,6 +160,123 @@ def get_ublox_api_settings() -> UbloxApiSettings:
 # -------------------------------------------------------------------
 
 
+class TimeoutSettings(BaseSettings):
+    timeout_percentile: float = 99
+    timeout_factor: float = 3
+    ublox_api_timeout: float = 6
+    ublox_api_timeout_min: float = 1
+    ublox_api_timeout_max: float = 20
+    anonengine_store_timeout: float = 2
+    anonengine_store_timeout_min: float = 0.5
+    anonengine_store_timeout_max: float = 10
+    anonengine_extract_timeout: float = 20
+    anonengine_extract_timeout_min: float = 2
+    anonengine_extract_timeout_max: float = 60
+    ipt_anonymizer_store_timeout: float = 6
+    ipt_anonymizer_store_timeout_min: float = 1
+    ipt_anonymizer_store_timeout_max: float = 20
+    ipt_anonymizer_extract_timeout: float = 20
+    ipt_anonymizer_extract_timeout_min: float = 2
+    ipt_anonymizer_extract_timeout_max: float = 60
+    iota_get_timeout: float = 20
+    iota_get_timeout_min: float = 2
+    iota_get_timeout_max: float = 60
+    iota_store_timeout: float = 1
+    iota_store_timeout_min: float = 0.5
+    iota_store_timeout_max: float = 5
+
+    class Config:
+        env_file = ".env"
+
+
+@lru_cache(maxsize=1)
+def get_timeout_settings() -> TimeoutSettings:
+    return TimeoutSettings()
+
+
+# -------------------------------------------------------------------
+
+
+class JourneySettings(BaseSettings):
+    journey_session_ttl: int = 3600
+    journey_max_sessions: int = 1000
+    journey_max_chunk_size: int = 1000
+    journey_max_pending_chunks: int = 4
+    journey_store_path: str = "journeys.sqlite"
+    journey_lease: float = 60
+    journey_poll_interval: float = 0.1
+    journey_max_retry_after: int = 30
+
+    class Config:
+        env_file = ".env"
+
+
+@lru_cache(maxsize=1)
+def get_journey_settings() -> JourneySettings:
+    return JourneySettings()
+
+
+# -------------------------------------------------------------------
+
+
+class IotSettings(BaseSettings):
+    iot_max_batch_size: int = 1000
+
+    class Config:
+        env_file = ".env"
+
+
+@lru_cache(maxsize=1)
+def get_iot_settings() -> IotSettings:
+    return IotSettings()
+
+
+# -------------------------------------------------------------------
+
+
+class ConcurrencySettings(BaseSettings):
+    store_limit: int = 25
+    store_limit_min: int = 5
+    store_limit_max: int = 100
+    position_auth_limit: int = 10
+    position_auth_limit_min: int = 2
+    position_auth_limit_max: int = 40
+    adaptive_tolerance: float = 2
+    adaptive_backoff: float = 0.9
+    adaptive_window: int = 100
+    test_pool_size: int = 4
+    test_pool_max_queue: int = 32
+    work_queue: bool = False
+    work_queue_path: str = "work_queue.sqlite"
+    work_queue_consumers: int = 4
+    work_queue_lease: float = 600
+    work_queue_max_attempts: int = 3
+    work_queue_poll_interval: float = 1
+    work_queue_max_poll_interval: float = 10
+    work_queue_retry_backoff: float = 5
+    admission_rate: float = 20
+    admission_burst: float = 40
+    admission_weights: Dict[str, float] = {}
+    admission_timeout: float = 1
+    admission_max_retry_after: int = 30
+    validation_processes: int = 2
+    validation_threshold: int = 262144
+    validation_min_offload: int = 16384
+    validation_lag_target: float = 0.05
+    validation_lag_interval: float = 0.5
+
+    class Config:
+        env_file = ".env"
+
+
+@lru_cache(maxsize=1)
+def get_concurrency_settings() -> ConcurrencySettings:
+    return ConcurrencySettings()
+
+
+# -------------------------------------------------------------------
+
+
 class IptAnonymizerSettings(BaseSettings):
     store_user_data_url: str
     store_iot_data_url: str
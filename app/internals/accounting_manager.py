@@ -25,6 +25,7 @@ Accounting Manager package
 # Standard Library
 from asyncio import TimeoutError
 from datetime import datetime
+from typing import Optional, Tuple
 
 # Third Party
 from aiohttp import ClientError
@@ -34,6 +35,7 @@ import orjson
 # Internal
 from .logger import get_logger
 from .sessions.accounting_manager import get_accounting_session
+from .timeout_policy import TIMEOUTS
 from ..models.accounting_manager import AccountingManager, Data, Obj
 from ..config import get_accounting_manager_settings
 
@@ -54,14 +56,15 @@ async def get_iota_user(user: str) -> dict:
 
     try:
         async with get_accounting_session() as session:
-            async with session.get(
-                f"{settings.accounting_ip}{settings.accounting_get_uri}",
-                params={"user": user},
-                timeout=20,
-            ) as resp:
-                return await resp.json(
-                    encoding="utf-8", loads=orjson.loads, content_type=None
-                )
+            with TIMEOUTS.deadline("iota_get") as timeout:
+                async with session.get(
+                    f"{settings.accounting_ip}{settings.accounting_get_uri}",
+                    params={"user": user},
+                    timeout=timeout,
+                ) as resp:
+                    return await resp.json(
+                        encoding="utf-8", loads=orjson.loads, content_type=None
+                    )
 
     except (TimeoutError, ClientError) as exc:
         # Something went wrong during the connection
@@ -89,6 +92,8 @@ async def store_in_iota(
     msg_total_position: int,
     msg_error: bool = False,
     msg_error_description: str = "",
+    msg_unsampled_position: Optional[int] = None,
+    msg_authentic_ratio: Optional[Tuple[float, float, float]] = None,
 ) -> None:
     """
     Store info inside IoTa
@@ -105,37 +110,46 @@ async def store_in_iota(
     :param msg_total_position: total number of position
     :param msg_error: error during the parsing
     :param msg_error_description: description of the error
+    :param msg_unsampled_position: number of positions not verified, if the journey was sampled
+    :param msg_authentic_ratio: estimated ratio of authentic positions and its confidence bounds
     """
     # Get Logger
     logger = get_logger()
 
     settings = get_accounting_manager_settings()
+    ratio, ratio_low, ratio_high = msg_authentic_ratio or (None, None, None)
 
     try:
         async with get_accounting_session() as session:
-            async with session.post(
-                f"{settings.accounting_ip}{settings.accounting_store_uri}",
-                json=AccountingManager(
-                    target=f"{source_app}-{datetime.now().date()}",
-                    data=Data(
-                        AppObj=Obj(
-                            client_id=client_id,
-                            user_id=user_id,
-                            msg_id=msg_id,
-                            msg_size=msg_size,
-                            msg_time=msg_time,
-                            msg_malicious_position=msg_malicious_position,
-                            msg_authenticated_position=msg_authenticated_position,
-                            msg_unknown_position=msg_unknown_position,
-                            msg_total_position=msg_total_position,
-                            msg_error=msg_error,
-                            msg_error_description=msg_error_description,
-                        )
-                    ),
-                ).dict(),
-                timeout=1,
-            ):
-                pass
+            with TIMEOUTS.deadline("iota_store") as timeout:
+                async with session.post(
+                    f"{settings.accounting_ip}{settings.accounting_store_uri}",
+                    json=AccountingManager(
+                        target=f"{source_app}-{datetime.now().date()}",
+                        data=Data(
+                            AppObj=Obj(
+                                client_id=client_id,
+                                user_id=user_id,
+                                msg_id=msg_id,
+                                msg_size=msg_size,
+                                msg_time=msg_time,
+                                msg_malicious_position=msg_malicious_position,
+                                msg_authenticated_position=msg_authenticated_position,
+                                msg_unknown_position=msg_unknown_position,
+                                msg_total_position=msg_total_position,
+                                msg_error=msg_error,
+                                msg_error_description=msg_error_description,
+                                msg_sampled=msg_unsampled_position is not None,
+                                msg_unsampled_position=msg_unsampled_position or 0,
+                                msg_authentic_ratio=ratio,
+                                msg_authentic_ratio_low=ratio_low,
+                                msg_authentic_ratio_high=ratio_high,
+                            )
+                        ),
+                    ).dict(),
+                    timeout=timeout,
+                ):
+                    pass
 
     except (TimeoutError, ClientError) as exc:
         # Something went wrong during the connection
@@ -147,3 +161,37 @@ async def store_in_iota(
         )
     finally:
         return
+
+
+async def store_error_in_iota(
+    exc: HTTPException,
+    source_app: str,
+    client_id: str,
+    user_id: str,
+    msg_id: str,
+    msg_time: float,
+) -> None:
+    """
+    Store in IoTa the error occurred while contacting Ublox-Api
+
+    :param exc: error occurred
+    :param source_app: App that generated the data
+    :param client_id: client_id expressed by the token
+    :param user_id: user_id expressed by the token
+    :param msg_id: uuid4
+    :param msg_time: when the message was received
+    """
+    await store_in_iota(
+        source_app=f"{source_app}_error",
+        client_id=client_id,
+        user_id=user_id,
+        msg_id=msg_id,
+        msg_size=0,
+        msg_time=msg_time,
+        msg_malicious_position=0,
+        msg_authenticated_position=0,
+        msg_unknown_position=0,
+        msg_total_position=0,
+        msg_error=True,
+        msg_error_description=exc.detail,
+    )
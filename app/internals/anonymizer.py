@@ -34,6 +34,7 @@ import orjson
 # Internal
 from .logger import get_logger
 from .sessions.anonymizer import get_anonengine_session
+from .timeout_policy import TIMEOUTS
 from ..config import get_anonymizer_settings
 
 # --------------------------------------------------------------------------------------------
@@ -52,10 +53,11 @@ async def store_in_the_anonengine(data: dict) -> None:
     try:
         # Store data
         async with get_anonengine_session() as session:
-            async with session.post(
-                anonymizer_settings.store_data_url, json=data, timeout=2.0
-            ):
-                pass
+            with TIMEOUTS.deadline("anonengine_store") as timeout:
+                async with session.post(
+                    anonymizer_settings.store_data_url, json=data, timeout=timeout
+                ):
+                    pass
 
     except (TimeoutError, ClientError) as exc:
         # Something went wrong during the connection
@@ -81,10 +83,11 @@ async def _extract(url: str) -> Any:
 
     try:
         async with get_anonengine_session() as session:
-            async with session.get(url, timeout=20) as resp:
-                return await resp.json(
-                    encoding="utf-8", loads=orjson.loads, content_type=None
-                )
+            with TIMEOUTS.deadline("anonengine_extract") as timeout:
+                async with session.get(url, timeout=timeout) as resp:
+                    return await resp.json(
+                        encoding="utf-8", loads=orjson.loads, content_type=None
+                    )
 
     except (TimeoutError, ClientError) as exc:
         # Something went wrong during the connection
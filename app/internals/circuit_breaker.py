@@ -0,0 +1,239 @@
+"""
+Circuit breaker package
+
+:author: Angelo Cutaia
+:copyright: Copyright 2021, LINKS Foundation
+:version: 1.0.0
+
+..
+
+    Copyright 2021 LINKS Foundation
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+        https://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+
+# Standard Library
+from asyncio import Task, current_task
+from collections import deque
+from functools import lru_cache
+import time
+from typing import Deque, Dict, Set
+
+# Internal
+from .logger import get_logger
+from ..config import get_ublox_api_settings
+
+# --------------------------------------------------------------------------------------------
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """The upstream is considered unavailable and it isn't contacted"""
+
+
+class _CircuitBreaker:
+    """
+    Track the outcome of the recent calls made to an upstream.
+    When too many of them fail or are too slow the circuit opens and the upstream
+    isn't contacted anymore until a probe made after a cool down succeeds.
+    The probes are the tasks allowed while half open, only their outcomes
+    close or open the circuit again
+    """
+
+    def __init__(
+        self,
+        name: str,
+        window: int,
+        min_calls: int,
+        failure_rate: float,
+        slow_call: float,
+        open_time: float,
+        probes: int,
+    ):
+        """
+        :param name: upstream identifier
+        :param window: number of recent outcomes considered
+        :param min_calls: number of outcomes needed before opening the circuit
+        :param failure_rate: rate of failed or slow calls that opens the circuit
+        :param slow_call: seconds after which a successful call is considered failed
+        :param open_time: seconds the circuit stays open before probing the upstream
+        :param probes: number of concurrent probes allowed while half open
+        """
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call = slow_call
+        self.open_time = open_time
+        self.probes = probes
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self._probes: Set[Task] = set()
+        self.outcomes: Deque[bool] = deque(maxlen=window)
+        self.opened = 0
+        self.rejected = 0
+
+    @property
+    def probes_in_flight(self) -> int:
+        """Number of probes waiting for their outcome"""
+        return len(self._probes)
+
+    async def allow(self) -> bool:
+        """
+        :return: True if the upstream can be contacted
+        """
+        transition = None
+        if self.state == OPEN:
+            if time.monotonic() - self.opened_at < self.open_time:
+                self.rejected += 1
+                return False
+            transition = self._transition(HALF_OPEN)
+
+        allowed = True
+        if self.state == HALF_OPEN:
+            if len(self._probes) >= self.probes:
+                self.rejected += 1
+                allowed = False
+            else:
+                self._probes.add(current_task())
+
+        # The state is already changed, concurrent callers see it during the await
+        if transition is not None:
+            await get_logger().warning(transition)
+        return allowed
+
+    async def record(self, success: bool, seconds: float) -> None:
+        """
+        Record the outcome of an allowed call, from the task that was allowed.
+        A call allowed before the circuit opened doesn't count once it's open
+
+        :param success: False if the call raised an error
+        :param seconds: latency of the call
+        """
+        success = success and seconds <= self.slow_call
+
+        probe = current_task() in self._probes
+        self._probes.discard(current_task())
+
+        transition = None
+        if probe and self.state == HALF_OPEN:
+            transition = self._transition(CLOSED if success else OPEN)
+        elif self.state == CLOSED:
+            self.outcomes.append(success)
+            if (
+                len(self.outcomes) >= self.min_calls
+                and self._current_failure_rate() >= self.failure_rate
+            ):
+                transition = self._transition(OPEN)
+
+        if transition is not None:
+            await get_logger().warning(transition)
+
+    def release(self) -> None:
+        """Forget an allowed call that was cancelled before its outcome"""
+        self._probes.discard(current_task())
+
+    def _transition(self, state: str) -> dict:
+        """
+        Change the state of the circuit without awaiting, so that concurrent callers
+        never run the same transition twice
+
+        :param state: new state of the circuit
+        :return: the record to log
+        """
+        transition = {
+            "upstream": self.name,
+            "circuit_breaker": f"{self.state} -> {state}",
+            "failure_rate": self._current_failure_rate(),
+        }
+
+        self.state = state
+        if state == OPEN:
+            self.opened += 1
+            self.opened_at = time.monotonic()
+        elif state == HALF_OPEN:
+            # The probes of a previous half open don't count anymore
+            self._probes.clear()
+        else:
+            self.outcomes.clear()
+
+        return transition
+
+    def _current_failure_rate(self) -> float:
+        """Rate of failed or slow calls among the recent ones"""
+        if not self.outcomes:
+            return 0.0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+    def stats(self) -> dict:
+        """State and counters of the circuit"""
+        return {
+            "state": self.state,
+            "failure_rate": self._current_failure_rate(),
+            "calls": len(self.outcomes),
+            "opened": self.opened,
+            "rejected": self.rejected,
+        }
+
+
+class _CircuitBreakers:
+    """Registry of the circuit breakers, one for every upstream url"""
+
+    def __init__(self):
+        self.breakers: Dict[str, _CircuitBreaker] = {}
+
+    def get(self, url: str) -> _CircuitBreaker:
+        """
+        :param url: url of the upstream
+        :return: the circuit breaker of the upstream
+        """
+        breaker = self.breakers.get(url)
+        if breaker is None:
+            settings = get_ublox_api_settings()
+            breaker = self.breakers[url] = _CircuitBreaker(
+                name=url,
+                window=settings.breaker_window,
+                min_calls=settings.breaker_min_calls,
+                failure_rate=settings.breaker_failure_rate,
+                slow_call=settings.breaker_slow_call,
+                open_time=settings.breaker_open_time,
+                probes=settings.breaker_probes,
+            )
+        return breaker
+
+    def clear(self) -> None:
+        """Drop every circuit breaker"""
+        self.breakers.clear()
+
+    def stats(self) -> dict:
+        """State of every circuit breaker"""
+        return {url: breaker.stats() for url, breaker in self.breakers.items()}
+
+
+# --------------------------------------------------------------------------------------------
+
+
+@lru_cache(maxsize=1)
+def _get_circuit_breakers() -> _CircuitBreakers:
+    """Instantiate a singleton _CircuitBreakers"""
+    return _CircuitBreakers()
+
+
+# --------------------------------------------------------------------------------------------
+
+
+CIRCUIT_BREAKERS = _get_circuit_breakers()
+"""Circuit breakers Singleton"""
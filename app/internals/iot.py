@@ -23,22 +23,34 @@ IoT utilities package
 """
 
 # Standard Library
-from asyncio import Semaphore
+from asyncio import Semaphore, Task, ensure_future, gather, shield
+from functools import partial
 import sys
 import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
 
 # Third Party
 from fastapi import HTTPException
 
 # Internal
-from .accounting_manager import store_in_iota
-from .ipt_anonymizer import store_in_the_anonymizer, SETTINGS
+from .accounting_manager import store_error_in_iota, store_in_iota
+from .ipt_anonymizer import (
+    store_in_the_anonymizer,
+    store_many_in_the_anonymizer,
+    SETTINGS,
+)
 from .keycloak import KEYCLOAK
 from .logger import get_logger
-from .sessions.ublox_api import get_ublox_api_session
+from .sessions.ublox_api import UBLOX_API_SESSIONS
 from .position_alteration_detection import haversine
 from .ublox_api import get_ublox_message, get_ublox_messages_list
-from ..concurrency.position_authentication import position_auth
+from ..concurrency.position_authentication import (
+    AdaptiveLimiter,
+    position_auth,
+    store_semaphore,
+)
+from ..config import get_ublox_api_settings
+from ..models.galileo.ublox_api import UbloxAPIWindow
 from ..models.iot_feed.iot import IotInput
 from ..models.security import Authenticity
 
@@ -46,6 +58,166 @@ from ..models.security import Authenticity
 # --------------------------------------------------------------------------------------------
 
 
+class SharedLookups:
+    """
+    Lookups of Ublox-Api shared by the observations with the same
+    region, svid and phenomenonTime
+    """
+
+    def __init__(self, ublox_token: str):
+        """
+        :param ublox_token: Token to use with UbloxApi
+        """
+        self.ublox_token = ublox_token
+        self._tasks: Dict[Tuple[str, str, int, int], Task] = {}
+        self.references = 0
+
+    @property
+    def lookups(self) -> int:
+        """Number of lookups made"""
+        return len(self._tasks)
+
+    async def _get(self, kind: str, svid: int, iot_time: int, location: str) -> Any:
+        """
+        :param kind: message or messages list
+        :param svid: satellite id
+        :param iot_time: phenomenonTime in ms
+        :param location: Sweden or Italy
+        :return: the answer of Ublox-Api, shared with the other observations
+        """
+        self.references += 1
+        key = (kind, location, svid, iot_time)
+        task = self._tasks.get(key)
+        if task is None:
+            request = (
+                get_ublox_message if kind == "message" else get_ublox_messages_list
+            )
+            task = self._tasks[key] = ensure_future(
+                request(
+                    svid,
+                    iot_time,
+                    self.ublox_token,
+                    location,
+                    UBLOX_API_SESSIONS.get(location),
+                )
+            )
+        return await shield(task)
+
+    async def message(self, svid: int, iot_time: int, location: str) -> Optional[bytes]:
+        """Raw data of a satellite at the phenomenonTime"""
+        return await self._get("message", svid, iot_time, location)
+
+    async def messages_list(
+        self, svid: int, iot_time: int, location: str
+    ) -> UbloxAPIWindow:
+        """Raw data of a satellite around the phenomenonTime"""
+        return await self._get("messages_list", svid, iot_time, location)
+
+
+async def authenticate_observation(
+    iot_input: IotInput,
+    lookups: SharedLookups,
+    on_error: Optional[Callable[[HTTPException], Awaitable[None]]] = None,
+) -> Tuple[Authenticity, Dict[str, int]]:
+    """
+    Contact Ublox-Api for the gnss data of an observation and compute its verdict
+
+    :param iot_input: data to validate
+    :param lookups: lookups of Ublox-Api shared with the other observations
+    :param on_error: coroutine handling the errors of Ublox-Api, if None they are raised
+    :return: authenticity of the observation and the number of gnss data verified,
+        authentic, not authentic and unknown
+    """
+    # Get Logger
+    logger = get_logger()
+    # Extract position location
+    location = haversine(
+        iot_input.result.Position.coordinate[0], iot_input.result.Position.coordinate[1]
+    )
+
+    # Initialize
+    counters = {"galileo_auth": 0, "authentic": 0, "not_authentic": 0, "unknown": 0}
+
+    # Calculate timestamp
+    iot_time = int(iot_input.phenomenonTime.timestamp() * 1000)
+
+    # Check the positions
+    for gnss in iot_input.result.gnss:
+        counters["galileo_auth"] += 1
+
+        try:
+            galileo_data = await lookups.message(gnss.svid, iot_time, location)
+        except HTTPException as exc:
+            if on_error is None:
+                raise exc
+            await on_error(exc)
+            galileo_data = None
+
+        if galileo_data is None:
+            counters["unknown"] += 1
+
+        elif galileo_data == gnss.raw_data:
+            counters["authentic"] += 1
+
+        else:
+            counters["not_authentic"] += 1
+            not_authentic = True
+            analyze = True
+
+            try:
+                # Remake the request
+                galileo_data_list = await lookups.messages_list(
+                    gnss.svid, iot_time, location
+                )
+            except HTTPException as exc:
+                if on_error is None:
+                    raise exc
+                await on_error(exc)
+                analyze = False
+
+            if analyze:
+                if gnss.raw_data in galileo_data_list.payloads:
+                    counters["authentic"] += 1
+                    counters["not_authentic"] -= 1
+                    not_authentic = False
+
+                if not_authentic:
+                    await logger.warning(
+                        {
+                            "message_timestamp": iot_time,
+                            "ublox_message": gnss.raw_data.hex(),
+                            "satellite_id": gnss.svid,
+                            "status": "Real Fake",
+                            "ublox_api_messages": [
+                                ublox_api.hex_dict() for ublox_api in galileo_data_list
+                            ],
+                        }
+                    )
+            break
+
+    if counters["not_authentic"] > 0:
+        authenticity = Authenticity.not_authentic
+    elif counters["authentic"] > 0:
+        authenticity = Authenticity.authentic
+    else:
+        authenticity = Authenticity.unknown
+
+    return authenticity, counters
+
+
+def iot_output(iot_input: IotInput, authenticity: Authenticity, gepid: str) -> dict:
+    """
+    :param iot_input: data validated
+    :param authenticity: verdict of the observation
+    :param gepid: uuid4 associated to the observation
+    :return: the observation to store, without its gnss data
+    """
+    output = iot_input.dict(exclude={"result": {"gnss"}})
+    output["result"].update({"authenticity": authenticity})
+    output.update({"observationGEPid": gepid})
+    return output
+
+
 async def end_to_end_position_authentication(
     iot_input: IotInput,
     timestamp: float,
@@ -73,127 +245,33 @@ async def end_to_end_position_authentication(
     logger = get_logger()
     # start analysis time
     start_analysis = time.time()
-    # Extract position location
-    location = haversine(
-        iot_input.result.Position.coordinate[0], iot_input.result.Position.coordinate[1]
-    )
-
-    # Initialize
-    galileo_auth_number = 0
-    authentic_number = 0
-    not_authentic_number = 0
-    unknown_number = 0
 
     # Get Ublox-APi token
     ublox_token = await KEYCLOAK.get_ublox_token()
 
-    # Get Ublox-Api session
-    async with get_ublox_api_session() as session:
-
-        # Calculate timestamp
-        iot_time = int(iot_input.phenomenonTime.timestamp() * 1000)
-
-        # Check the positions
-        for gnss in iot_input.result.gnss:
-            galileo_auth_number += 1
-
-            try:
-                galileo_data = await get_ublox_message(
-                    gnss.svid, iot_time, ublox_token, location, session
-                )
-            except HTTPException as exc:
-                if store:
-                    await store_in_iota(
-                        source_app=f"{source_app}_error",
-                        client_id=client_id,
-                        user_id=user_id,
-                        msg_id=obesrvation_gepid,
-                        msg_size=0,
-                        msg_time=timestamp,
-                        msg_malicious_position=0,
-                        msg_authenticated_position=0,
-                        msg_unknown_position=0,
-                        msg_total_position=0,
-                        msg_error=True,
-                        msg_error_description=exc.detail,
-                    )
-                    galileo_data = None
-                else:
-                    raise exc
-
-            if galileo_data is None:
-                unknown_number += 1
-
-            elif galileo_data == gnss.raw_data:
-                authentic_number += 1
-
-            else:
-                not_authentic_number += 1
-                not_authentic = True
-                analyze = True
-
-                try:
-                    # Remake the request
-                    galileo_data_list = await get_ublox_messages_list(
-                        gnss.svid, iot_time, ublox_token, location, session
-                    )
-                except HTTPException as exc:
-                    if store:
-                        await store_in_iota(
-                            source_app=f"{source_app}_error",
-                            client_id=client_id,
-                            user_id=user_id,
-                            msg_id=obesrvation_gepid,
-                            msg_size=0,
-                            msg_time=timestamp,
-                            msg_malicious_position=0,
-                            msg_authenticated_position=0,
-                            msg_unknown_position=0,
-                            msg_total_position=0,
-                            msg_error=True,
-                            msg_error_description=exc.detail,
-                        )
-                        analyze = False
-                    else:
-                        raise exc
-
-                if analyze:
-                    for data in galileo_data_list:
-                        if data.raw_data == gnss.raw_data:
-                            authentic_number += 1
-                            not_authentic_number -= 1
-                            not_authentic = False
-                            break
-
-                    if not_authentic:
-                        await logger.warning(
-                            {
-                                "message_timestamp": iot_time,
-                                "ublox_message": gnss.raw_data,
-                                "satellite_id": gnss.svid,
-                                "status": "Real Fake",
-                                "ublox_api_messages": [
-                                    ublox_api.dict() for ublox_api in galileo_data_list
-                                ],
-                            }
-                        )
-                break
-
-    if not_authentic_number > 0:
-        authenticity = Authenticity.not_authentic
-    elif authentic_number > 0:
-        authenticity = Authenticity.authentic
-    else:
-        authenticity = Authenticity.unknown
+    authenticity, counters = await authenticate_observation(
+        iot_input,
+        SharedLookups(ublox_token),
+        partial(
+            store_error_in_iota,
+            source_app=source_app,
+            client_id=client_id,
+            user_id=user_id,
+            msg_id=obesrvation_gepid,
+            msg_time=timestamp,
+        )
+        if store
+        else None,
+    )
 
     await logger.info(
         {
             "host": host,
             "observationGEPid": obesrvation_gepid,
-            "galileo_auth": galileo_auth_number,
-            "authentic": authentic_number,
-            "not_authentic": not_authentic_number,
-            "unknown": unknown_number,
+            "galileo_auth": counters["galileo_auth"],
+            "authentic": counters["authentic"],
+            "not_authentic": counters["not_authentic"],
+            "unknown": counters["unknown"],
             "analysis_time": f"{time.time() - start_analysis}",
             "request_procession_time": f"{time.time() - timestamp}",
         }
@@ -206,17 +284,13 @@ async def end_to_end_position_authentication(
             msg_id=obesrvation_gepid,
             msg_size=sys.getsizeof(iot_input.json()),
             msg_time=timestamp,
-            msg_malicious_position=not_authentic_number,
-            msg_authenticated_position=authentic_number,
-            msg_unknown_position=unknown_number,
-            msg_total_position=galileo_auth_number,
+            msg_malicious_position=counters["not_authentic"],
+            msg_authenticated_position=counters["authentic"],
+            msg_unknown_position=counters["unknown"],
+            msg_total_position=counters["galileo_auth"],
         )
 
-    iot_output = iot_input.dict(exclude={"result": {"gnss"}})
-    iot_output["result"].update({"authenticity": authenticity})
-    iot_output.update({"observationGEPid": obesrvation_gepid})
-
-    return iot_output
+    return iot_output(iot_input, authenticity, obesrvation_gepid)
 
 
 async def store_iot_data(
@@ -227,7 +301,7 @@ async def store_iot_data(
     source_app: str,
     client_id: str,
     user_id: str,
-    semaphore: Semaphore,
+    semaphore: AdaptiveLimiter,
 ) -> None:
     """
     Store IoT data in the anonymizer
@@ -241,20 +315,162 @@ async def store_iot_data(
     :param user_id: user_id expressed by the token
     :param semaphore: synchronize the requests and prevent starvation
     """
+    try:
+        await _store_iot_data(
+            iot_input=iot_input,
+            timestamp=timestamp,
+            host=host,
+            obesrvation_gepid=obesrvation_gepid,
+            source_app=source_app,
+            client_id=client_id,
+            user_id=user_id,
+            semaphore=semaphore,
+        )
+    finally:
+        return
+
+
+async def _store_iot_data(
+    iot_input: IotInput,
+    timestamp: float,
+    host: str,
+    obesrvation_gepid: str,
+    source_app: str,
+    client_id: str,
+    user_id: str,
+    semaphore: AdaptiveLimiter,
+) -> None:
+    """
+    Same as store_iot_data, but the errors are raised so that the caller can retry
+    """
+    async with semaphore:
+        async with position_auth():
+            iot_output = await end_to_end_position_authentication(
+                iot_input=iot_input,
+                timestamp=timestamp,
+                host=host,
+                obesrvation_gepid=obesrvation_gepid,
+                source_app=source_app,
+                client_id=client_id,
+                user_id=user_id,
+                store=True,
+            )
+
+        await store_in_the_anonymizer(iot_output, SETTINGS.store_iot_data_url)
+
+
+async def store_queued_iot_data(metadata: dict, body: bytes) -> None:
+    """
+    Store in the anonymizer IoT data taken from the work queue,
+    raising if it fails so that the item isn't acknowledged
+
+    :param metadata: timestamp, host, obesrvation_gepid, source_app, client_id
+        and user_id of the request
+    :param body: body of the request
+    """
+    await _store_iot_data(
+        iot_input=IotInput.parse_raw(body), semaphore=store_semaphore(), **metadata
+    )
+
+
+async def store_iot_batch(
+    iot_inputs: List[IotInput],
+    timestamp: float,
+    host: str,
+    batch_id: str,
+    obesrvation_gepids: List[str],
+    source_app: str,
+    client_id: str,
+    user_id: str,
+    semaphore: AdaptiveLimiter,
+) -> None:
+    """
+    Validate a batch of IoT data sharing the lookups of the observations, then store
+    it in the anonymizer and account it in IoTa with a single record
+
+    :param iot_inputs: data to validate
+    :param timestamp: when the request was received
+    :param host: who made the request
+    :param batch_id: uuid4 associated to the batch
+    :param obesrvation_gepids: uuid4 associated to every observation
+    :param source_app: app that made the request
+    :param client_id: client_id expressed by the token
+    :param user_id: user_id expressed by the token
+    :param semaphore: synchronize the requests and prevent starvation
+    """
+    # Get Logger
+    logger = get_logger()
+
     try:
         async with semaphore:
+            semaphore.weigh(len(iot_inputs))
             async with position_auth():
-                iot_output = await end_to_end_position_authentication(
-                    iot_input=iot_input,
-                    timestamp=timestamp,
-                    host=host,
-                    obesrvation_gepid=obesrvation_gepid,
+                position_auth().weigh(len(iot_inputs))
+                # start analysis time
+                start_analysis = time.time()
+
+                lookups = SharedLookups(await KEYCLOAK.get_ublox_token())
+                on_error = partial(
+                    store_error_in_iota,
                     source_app=source_app,
                     client_id=client_id,
                     user_id=user_id,
-                    store=True,
+                    msg_id=batch_id,
+                    msg_time=timestamp,
+                )
+                limit = Semaphore(get_ublox_api_settings().journey_concurrency)
+
+                async def authenticate(iot_input: IotInput):
+                    async with limit:
+                        return await authenticate_observation(
+                            iot_input, lookups, on_error
+                        )
+
+                results = await gather(
+                    *[authenticate(iot_input) for iot_input in iot_inputs]
                 )
 
-            await store_in_the_anonymizer(iot_output, SETTINGS.store_iot_data_url)
+            counters = {
+                name: sum(result[name] for _, result in results)
+                for name in ("galileo_auth", "authentic", "not_authentic", "unknown")
+            }
+            await logger.info(
+                {
+                    "host": host,
+                    "batch_id": batch_id,
+                    "observations": len(iot_inputs),
+                    "galileo_auth": counters["galileo_auth"],
+                    "authentic": counters["authentic"],
+                    "not_authentic": counters["not_authentic"],
+                    "unknown": counters["unknown"],
+                    "lookups": lookups.lookups,
+                    "analysis_time": f"{time.time() - start_analysis}",
+                    "request_procession_time": f"{time.time() - timestamp}",
+                }
+            )
+            await store_in_iota(
+                source_app=source_app,
+                client_id=client_id,
+                user_id=user_id,
+                msg_id=batch_id,
+                msg_size=sum(
+                    sys.getsizeof(iot_input.json()) for iot_input in iot_inputs
+                ),
+                msg_time=timestamp,
+                msg_malicious_position=counters["not_authentic"],
+                msg_authenticated_position=counters["authentic"],
+                msg_unknown_position=counters["unknown"],
+                msg_total_position=counters["galileo_auth"],
+            )
+
+            await store_many_in_the_anonymizer(
+                [
+                    iot_output(iot_input, authenticity, gepid)
+                    for iot_input, (authenticity, _), gepid in zip(
+                        iot_inputs, results, obesrvation_gepids
+                    )
+                ],
+                SETTINGS.store_iot_data_url,
+            )
     finally:
         return
@@ -24,6 +24,7 @@ IPT-anonymizer package
 
 # Standard Library
 from asyncio import TimeoutError
+from typing import List
 
 # Third Party
 from aiohttp import ClientError
@@ -33,6 +34,7 @@ import orjson
 # Internal
 from .logger import get_logger
 from .sessions.ipt_anonymizer import ipt_anonymizer_session
+from .timeout_policy import TIMEOUTS
 from ..config import get_ipt_anonymizer_settings
 
 # --------------------------------------------------------------------------------------------
@@ -56,8 +58,36 @@ async def store_in_the_anonymizer(data: dict, url: str) -> None:
     try:
         # Store data
         async with ipt_anonymizer_session() as session:
-            async with session.post(url=url, json=data, timeout=6):
-                pass
+            with TIMEOUTS.deadline("ipt_anonymizer_store") as timeout:
+                async with session.post(url=url, json=data, timeout=timeout):
+                    pass
+
+    except (TimeoutError, ClientError) as exc:
+        # IPT-anonymizer is in starvation
+        await logger.warning({"url": url, "error": repr(str(exc))})
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="IPT-anonymizer is in starvation or down",
+        )
+
+
+async def store_many_in_the_anonymizer(data: List[dict], url: str) -> None:
+    """
+    Store a batch of info in the IPT-anonymizer through the same connection
+
+    :param data: information to store
+    :param url: used to store iot or user data
+    """
+    # Get Logger
+    logger = get_logger()
+
+    try:
+        # Store data
+        async with ipt_anonymizer_session() as session:
+            for item in data:
+                with TIMEOUTS.deadline("ipt_anonymizer_store") as timeout:
+                    async with session.post(url=url, json=item, timeout=timeout):
+                        pass
 
     except (TimeoutError, ClientError) as exc:
         # IPT-anonymizer is in starvation
@@ -83,12 +113,15 @@ async def extract_user_info(info_requested: dict) -> tuple:
     try:
         # Extract data
         async with ipt_anonymizer_session() as session:
-            async with session.post(
-                url=SETTINGS.extract_user_data_url, json=info_requested, timeout=20
-            ) as resp:
-                return resp.status, await resp.json(
-                    encoding="utf-8", loads=orjson.loads, content_type=None
-                )
+            with TIMEOUTS.deadline("ipt_anonymizer_extract") as timeout:
+                async with session.post(
+                    url=SETTINGS.extract_user_data_url,
+                    json=info_requested,
+                    timeout=timeout,
+                ) as resp:
+                    return resp.status, await resp.json(
+                        encoding="utf-8", loads=orjson.loads, content_type=None
+                    )
 
     except (TimeoutError, ClientError) as exc:
         # IPT-anonymizer is in starvation
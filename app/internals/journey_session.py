@@ -0,0 +1,801 @@
+"""
+Journey session package
+
+:author: Angelo Cutaia
+:copyright: Copyright 2021, LINKS Foundation
+:version: 1.0.0
+
+..
+
+    Copyright 2021 LINKS Foundation
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+        https://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+
+# Standard Library
+from array import array
+from collections import defaultdict
+from asyncio import CancelledError, Task, ensure_future, get_running_loop, sleep
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
+from math import ceil
+import sqlite3
+import time
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+import zlib
+
+# Third Party
+from fastapi import HTTPException, status
+from fastuuid import uuid4
+import orjson
+from pydantic import parse_raw_as
+
+# Internal
+from .accounting_manager import store_error_in_iota, store_in_iota
+from .logger import get_logger
+from .user_feed import (
+    authenticate_positions,
+    dedup_ratio,
+    detect_meaconing,
+    forward_user_feed,
+    locate_positions,
+)
+from ..concurrency.position_authentication import AdaptiveLimiter, position_auth
+from ..config import get_journey_settings, get_ublox_api_settings
+from ..models.user_feed.position import PositionObject, PositionObjectInput
+from ..models.user_feed.response_class import JourneyStatus
+from ..models.user_feed.user import UserFeed, UserFeedHeader
+
+# --------------------------------------------------------------------------------------------
+
+
+def _dump_positions(positions: List[Any]) -> bytes:
+    """Serialize a list of positions"""
+    return zlib.compress(
+        b"[" + b",".join(position.json().encode() for position in positions) + b"]",
+        1,
+    )
+
+
+class _JourneySessions:
+    """
+    Journeys being uploaded in chunks, stored in SQLite and shared by the workers
+    of the host, so that every chunk can reach any worker.
+    Every chunk is authenticated in the background following the order of the trace:
+    the worker that leases the journey authenticates the chunks received so far,
+    carrying the meaconing reference between them, and keeps only the verdicts.
+    The sessions idle for too long are dropped without being stored
+    """
+
+    def __init__(
+        self,
+        path: str,
+        ttl: float,
+        max_sessions: int,
+        max_chunk_size: int,
+        max_pending_chunks: int,
+        lease: float,
+        poll_interval: float,
+        max_retry_after: int,
+    ):
+        """
+        :param path: path of the SQLite database
+        :param ttl: seconds a session can stay idle
+        :param max_sessions: max number of sessions open at the same time
+        :param max_chunk_size: max number of positions of a chunk
+        :param max_pending_chunks: max number of chunks of a session waiting to be authenticated
+        :param lease: seconds a journey is reserved to the worker authenticating its chunks
+        :param poll_interval: seconds between two checks of the chunks authenticated by
+            the other workers while finalizing a journey
+        :param max_retry_after: max seconds suggested to a rejected client
+        """
+        self.path = path
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.max_chunk_size = max_chunk_size
+        self.max_pending_chunks = max_pending_chunks
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.max_retry_after = max_retry_after
+        self.connection: Optional[sqlite3.Connection] = None
+        self._writer: Optional[ThreadPoolExecutor] = None
+        self._tasks: Set[Task] = set()
+        self.chunk_time = 1.0
+        self.open_sessions = 0
+        self.opened = 0
+        self.finalized = 0
+        self.expired = 0
+
+    # Queries, run in the writer thread
+
+    def _open_database(self) -> None:
+        """Open the database and create the tables if needed"""
+        if self.connection is not None:
+            return
+        self.connection = sqlite3.connect(
+            self.path, isolation_level=None, check_same_thread=False, timeout=30
+        )
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("PRAGMA foreign_keys=ON")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS journeys ("
+            "journey_id TEXT PRIMARY KEY, "
+            "header BLOB NOT NULL, "
+            "host TEXT NOT NULL, "
+            "source_app TEXT NOT NULL, "
+            "client_id TEXT NOT NULL, "
+            "user_id TEXT, "
+            "timestamp REAL NOT NULL, "
+            "last_activity REAL NOT NULL, "
+            "chunks INTEGER NOT NULL DEFAULT 0, "
+            "verified_chunks INTEGER NOT NULL DEFAULT 0, "
+            "positions INTEGER NOT NULL DEFAULT 0, "
+            "size INTEGER NOT NULL DEFAULT 0, "
+            "counters BLOB NOT NULL DEFAULT '{}', "
+            "fullbiasnano INTEGER NOT NULL DEFAULT 0, "
+            "timenano INTEGER NOT NULL DEFAULT 0, "
+            "closed INTEGER NOT NULL DEFAULT 0, "
+            "leased_until REAL NOT NULL DEFAULT 0)"
+        )
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            "journey_id TEXT NOT NULL REFERENCES journeys ON DELETE CASCADE, "
+            "chunk INTEGER NOT NULL, "
+            "positions BLOB NOT NULL, "
+            "PRIMARY KEY (journey_id, chunk))"
+        )
+
+    def _transaction(self, query: Callable[..., Any], *args: Any) -> Any:
+        """Run a query in a transaction holding the write lock of the database"""
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            result = query(*args)
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+        self.connection.execute("COMMIT")
+        return result
+
+    def _expire(self) -> None:
+        """Drop the sessions idle for too long and count the open ones"""
+        self.expired += self.connection.execute(
+            "DELETE FROM journeys WHERE last_activity < ?", (time.time() - self.ttl,)
+        ).rowcount
+        self.open_sessions = self.connection.execute(
+            "SELECT COUNT(*) FROM journeys"
+        ).fetchone()[0]
+
+    def _insert(
+        self,
+        header: bytes,
+        host: str,
+        source_app: str,
+        client_id: str,
+        user_id: Optional[str],
+    ) -> Optional[str]:
+        """Insert a journey if there is room for it"""
+        self._expire()
+        if self.open_sessions >= self.max_sessions:
+            return None
+
+        journey_id = str(uuid4())
+        now = time.time()
+        self.connection.execute(
+            "INSERT INTO journeys (journey_id, header, host, source_app, client_id, "
+            "user_id, timestamp, last_activity) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (journey_id, header, host, source_app, client_id, user_id, now, now),
+        )
+        self.open_sessions += 1
+        return journey_id
+
+    def _oldest_activity(self) -> float:
+        """Last activity of the session that will expire first"""
+        return self.connection.execute(
+            "SELECT COALESCE(MIN(last_activity), 0) FROM journeys"
+        ).fetchone()[0]
+
+    def _select(
+        self, journey_id: str, client_id: str, user_id: Optional[str]
+    ) -> Optional[tuple]:
+        """Progress of an open journey of the requester"""
+        return self.connection.execute(
+            "SELECT chunks, verified_chunks, positions, closed FROM journeys "
+            "WHERE journey_id = ? AND client_id = ? AND user_id IS ? AND closed = 0",
+            (journey_id, client_id, user_id),
+        ).fetchone()
+
+    def _get(
+        self, journey_id: str, client_id: str, user_id: Optional[str]
+    ) -> Optional[tuple]:
+        """Progress of an open journey of the requester, after dropping the idle ones"""
+        self._expire()
+        return self._select(journey_id, client_id, user_id)
+
+    def _append(
+        self,
+        journey_id: str,
+        client_id: str,
+        user_id: Optional[str],
+        chunk: int,
+        positions: bytes,
+        size: int,
+    ) -> Tuple[str, Optional[tuple]]:
+        """Store a chunk if it's the next one of the journey, in a transaction"""
+        self._expire()
+        row = self._select(journey_id, client_id, user_id)
+        if row is None:
+            return "not_found", None
+        chunks, verified_chunks, count, closed = row
+        if chunk < chunks:
+            return "duplicated", row
+        if chunk > chunks:
+            return "out_of_order", row
+        if chunks - verified_chunks >= self.max_pending_chunks:
+            return "busy", row
+
+        self.connection.execute(
+            "INSERT INTO chunks (journey_id, chunk, positions) VALUES (?, ?, ?)",
+            (journey_id, chunk, positions),
+        )
+        self.connection.execute(
+            "UPDATE journeys SET chunks = chunks + 1, size = size + ?, "
+            "last_activity = ? WHERE journey_id = ?",
+            (size, time.time(), journey_id),
+        )
+        return "appended", (chunks + 1, verified_chunks, count, closed)
+
+    def _close(self, journey_id: str, client_id: str, user_id: Optional[str]) -> bool:
+        """Mark an open journey of the requester as closed"""
+        self._expire()
+        return bool(
+            self.connection.execute(
+                "UPDATE journeys SET closed = 1, last_activity = ? "
+                "WHERE journey_id = ? AND client_id = ? AND user_id IS ? AND closed = 0",
+                (time.time(), journey_id, client_id, user_id),
+            ).rowcount
+        )
+
+    def _lease(self, journey_id: str) -> bool:
+        """Reserve a journey with chunks to authenticate, if nobody else did"""
+        now = time.time()
+        return bool(
+            self.connection.execute(
+                "UPDATE journeys SET leased_until = ? WHERE journey_id = ? "
+                "AND chunks > verified_chunks AND leased_until <= ?",
+                (now + self.lease, journey_id, now),
+            ).rowcount
+        )
+
+    def _release(self, journey_id: str) -> None:
+        """Free the lease of a journey"""
+        self.connection.execute(
+            "UPDATE journeys SET leased_until = 0 WHERE journey_id = ?", (journey_id,)
+        )
+
+    def _next_chunk(self, journey_id: str) -> Optional[tuple]:
+        """First chunk to authenticate with the state of the journey"""
+        return self.connection.execute(
+            "SELECT chunks.chunk, chunks.positions, source_app, client_id, user_id, "
+            "timestamp, fullbiasnano, timenano FROM journeys JOIN chunks "
+            "ON chunks.journey_id = journeys.journey_id "
+            "AND chunks.chunk = journeys.verified_chunks "
+            "WHERE journeys.journey_id = ?",
+            (journey_id,),
+        ).fetchone()
+
+    def _verified(
+        self,
+        journey_id: str,
+        chunk: int,
+        verdicts: bytes,
+        positions: int,
+        counters: Dict[str, int],
+        reference: array,
+    ) -> None:
+        """
+        Replace a chunk with its verdicts and carry the state of the journey,
+        in a transaction
+        """
+        row = self.connection.execute(
+            "SELECT counters FROM journeys WHERE journey_id = ? AND verified_chunks = ?",
+            (journey_id, chunk),
+        ).fetchone()
+        if row is None:
+            # Authenticated by another worker in the meantime
+            return
+
+        total = orjson.loads(row[0])
+        for name, value in counters.items():
+            total[name] = total.get(name, 0) + value
+        now = time.time()
+        self.connection.execute(
+            "UPDATE chunks SET positions = ? WHERE journey_id = ? AND chunk = ?",
+            (verdicts, journey_id, chunk),
+        )
+        self.connection.execute(
+            "UPDATE journeys SET verified_chunks = verified_chunks + 1, "
+            "positions = positions + ?, counters = ?, fullbiasnano = ?, timenano = ?, "
+            "last_activity = ?, leased_until = ? WHERE journey_id = ?",
+            (
+                positions,
+                orjson.dumps(total),
+                reference[0],
+                reference[1],
+                now,
+                now + self.lease,
+                journey_id,
+            ),
+        )
+
+    def _progress(self, journey_id: str) -> Optional[Tuple[int, int]]:
+        """Chunks received and authenticated of a journey"""
+        return self.connection.execute(
+            "SELECT chunks, verified_chunks FROM journeys WHERE journey_id = ?",
+            (journey_id,),
+        ).fetchone()
+
+    def _load(self, journey_id: str) -> Optional[tuple]:
+        """Whole journey with the verdicts of its positions"""
+        row = self.connection.execute(
+            "SELECT header, host, source_app, client_id, user_id, timestamp, chunks, "
+            "size, counters FROM journeys WHERE journey_id = ?",
+            (journey_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        chunks = self.connection.execute(
+            "SELECT positions FROM chunks WHERE journey_id = ? ORDER BY chunk",
+            (journey_id,),
+        ).fetchall()
+        return row, [positions for positions, in chunks]
+
+    def _delete(self, journey_id: str) -> None:
+        """Drop a journey and its chunks"""
+        self.connection.execute(
+            "DELETE FROM journeys WHERE journey_id = ?", (journey_id,)
+        )
+
+    def _execute(self, query: Callable[..., Any], *args: Any) -> Any:
+        """Run a query opening the database if needed"""
+        self._open_database()
+        return query(*args)
+
+    async def _run(self, query: Callable[..., Any], *args: Any) -> Any:
+        """Run a query in the writer thread"""
+        if self._writer is None:
+            self._writer = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="journey_sessions"
+            )
+        return await get_running_loop().run_in_executor(
+            self._writer, partial(self._execute, query, *args)
+        )
+
+    # API used by the routers
+
+    def _busy(self, seconds: float) -> HTTPException:
+        """Build the answer for a request rejected because the sessions are busy"""
+        return HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            headers={
+                "Retry-After": str(min(self.max_retry_after, max(1, ceil(seconds))))
+            },
+        )
+
+    @staticmethod
+    def _status(journey_id: str, row: tuple) -> JourneyStatus:
+        """Progress of the upload and of the authentication"""
+        chunks, verified_chunks, positions, closed = row
+        return JourneyStatus(
+            journey_id=journey_id,
+            chunks=chunks,
+            verified_chunks=verified_chunks,
+            positions=positions,
+            closed=bool(closed),
+        )
+
+    async def open(
+        self,
+        header: UserFeedHeader,
+        host: str,
+        source_app: str,
+        client_id: str,
+        user_id: Optional[str],
+    ) -> JourneyStatus:
+        """
+        Open the session of a new journey
+
+        :param header: data of the journey without the trace
+        :param host: who opened the journey
+        :param source_app: app that opened the journey
+        :param client_id: client_id expressed by the token
+        :param user_id: user_id expressed by the token
+        :return: the progress of the journey
+        """
+        journey_id = await self._run(
+            self._insert, header.json().encode(), host, source_app, client_id, user_id
+        )
+        if journey_id is None:
+            # A session is freed at the latest when the oldest one expires
+            oldest = await self._run(self._oldest_activity)
+            raise self._busy(oldest + self.ttl - time.time())
+
+        self.opened += 1
+        return self._status(journey_id, (0, 0, 0, False))
+
+    async def get(
+        self, journey_id: str, client_id: str, user_id: Optional[str]
+    ) -> JourneyStatus:
+        """
+        :param journey_id: uuid4 associated to the journey
+        :param client_id: client_id expressed by the token
+        :param user_id: user_id expressed by the token
+        :return: the progress of the journey opened by the same requester
+        """
+        row = await self._run(self._get, journey_id, client_id, user_id)
+        if row is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="Journey not found"
+            )
+        return self._status(journey_id, row)
+
+    async def append(
+        self,
+        journey_id: str,
+        client_id: str,
+        user_id: Optional[str],
+        chunk: int,
+        trace_information: List[PositionObjectInput],
+        size: int,
+    ) -> JourneyStatus:
+        """
+        Add a chunk of positions to a journey and authenticate it in the background.
+        A chunk already received is ignored, so an interrupted upload can be resumed
+
+        :param journey_id: uuid4 associated to the journey
+        :param client_id: client_id expressed by the token
+        :param user_id: user_id expressed by the token
+        :param chunk: index of the chunk in the journey
+        :param trace_information: positions of the chunk
+        :param size: size of the chunk
+        :return: the progress of the journey
+        """
+        if len(trace_information) > self.max_chunk_size:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"At most {self.max_chunk_size} positions for every chunk",
+            )
+
+        outcome, row = await self._run(
+            self._transaction,
+            self._append,
+            journey_id,
+            client_id,
+            user_id,
+            chunk,
+            _dump_positions(trace_information),
+            size,
+        )
+        if outcome == "not_found":
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="Journey not found"
+            )
+        if outcome == "out_of_order":
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Chunk {row[0]} expected",
+            )
+        if outcome == "busy":
+            # The oldest pending chunk must be authenticated first
+            raise self._busy(self.chunk_time)
+        if outcome == "appended":
+            self._spawn(self._drain(journey_id))
+
+        return self._status(journey_id, row)
+
+    async def close(
+        self, journey_id: str, client_id: str, user_id: Optional[str]
+    ) -> None:
+        """
+        Stop accepting chunks for a journey, then finalize it through finalize
+
+        :param journey_id: uuid4 associated to the journey
+        :param client_id: client_id expressed by the token
+        :param user_id: user_id expressed by the token
+        """
+        if not await self._run(self._close, journey_id, client_id, user_id):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="Journey not found"
+            )
+        self.open_sessions -= 1
+
+    # Background work
+
+    def _spawn(self, coroutine) -> None:
+        """Run a coroutine in the background, keeping track of it"""
+        task = ensure_future(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _drain(self, journey_id: str) -> None:
+        """
+        Authenticate the chunks received so far if no other worker is doing it.
+        After releasing the journey it's leased again if a chunk arrived meanwhile,
+        since the worker that received it found the journey leased
+        """
+        while await self._run(self._lease, journey_id):
+            try:
+                while True:
+                    row = await self._run(self._next_chunk, journey_id)
+                    if row is None:
+                        break
+                    start = time.monotonic()
+                    await self._authenticate(journey_id, *row)
+                    self.chunk_time += 0.1 * (
+                        time.monotonic() - start - self.chunk_time
+                    )
+            finally:
+                await self._run(self._release, journey_id)
+
+    async def _authenticate(
+        self,
+        journey_id: str,
+        chunk: int,
+        positions: bytes,
+        source_app: str,
+        client_id: str,
+        user_id: Optional[str],
+        timestamp: float,
+        fullbiasnano: int,
+        timenano: int,
+    ) -> None:
+        """
+        Authenticate a chunk carrying the meaconing reference of the previous ones
+        and replace it with the verdicts of its positions, without their GalileoAuth
+        """
+        trace_information = parse_raw_as(
+            List[PositionObjectInput], zlib.decompress(positions)
+        )
+        reference = array("q", [fullbiasnano, timenano])
+        counters: Dict[str, int] = {}
+        try:
+            async with position_auth():
+                position_auth().weigh(len(trace_information))
+                positions_to_verify, _ = locate_positions(
+                    trace_information,
+                    detect_meaconing(
+                        trace_information,
+                        get_ublox_api_settings().meaconing_threshold,
+                        reference,
+                    ),
+                )
+                counters = await authenticate_positions(
+                    positions_to_verify,
+                    partial(
+                        store_error_in_iota,
+                        source_app=source_app,
+                        client_id=client_id,
+                        user_id=user_id,
+                        msg_id=journey_id,
+                        msg_time=timestamp,
+                    ),
+                )
+        except CancelledError:
+            # The lease expires and another worker authenticates the chunk again
+            raise
+        except Exception as error:
+            # The positions of the chunk are stored as unknown
+            await get_logger().warning(
+                {"journey_id": journey_id, "chunk": chunk, "error": repr(error)}
+            )
+
+        await self._run(
+            self._transaction,
+            self._verified,
+            journey_id,
+            chunk,
+            _dump_positions(
+                [
+                    PositionObject.construct(
+                        authenticity=position.authenticity,
+                        lat=position.lat,
+                        lon=position.lon,
+                        partialDistance=position.partialDistance,
+                        time=position.time,
+                    )
+                    for position in trace_information
+                ]
+            ),
+            len(trace_information),
+            counters,
+            reference,
+        )
+
+    async def finalize(self, journey_id: str, semaphore: AdaptiveLimiter) -> None:
+        """
+        Wait the authentication of the pending chunks, then store the journey
+        in the IPT-Anonymizer and in the anonengine and account it in IoTa
+
+        :param journey_id: uuid4 associated to the journey
+        :param semaphore: synchronize the requests and prevent starvation
+        """
+        poll_interval = self.poll_interval
+        while True:
+            await self._drain(journey_id)
+            progress = await self._run(self._progress, journey_id)
+            if progress is None:
+                # Expired meanwhile
+                return
+            chunks, verified_chunks = progress
+            if verified_chunks == chunks:
+                break
+            # Another worker is authenticating the last chunks
+            await sleep(poll_interval)
+            poll_interval = min(poll_interval * 2, self.lease)
+
+        loaded = await self._run(self._load, journey_id)
+        if loaded is None:
+            return
+        journey, chunks = loaded
+        header, host, source_app, client_id, user_id, timestamp = journey[:6]
+        chunk_count, size, counters = (
+            journey[6],
+            journey[7],
+            defaultdict(int, orjson.loads(journey[8])),
+        )
+        positions = [
+            position
+            for chunk in chunks
+            for position in parse_raw_as(List[PositionObject], zlib.decompress(chunk))
+        ]
+
+        try:
+            async with semaphore:
+                semaphore.weigh(len(positions))
+                await forward_user_feed(
+                    UserFeed.construct(
+                        **dict(UserFeedHeader.parse_raw(header)),
+                        trace_information=positions,
+                    ),
+                    journey_id,
+                    source_app,
+                )
+        finally:
+            await self._run(self._delete, journey_id)
+            self.finalized += 1
+            await self._account(
+                journey_id=journey_id,
+                host=host,
+                source_app=source_app,
+                client_id=client_id,
+                user_id=user_id,
+                timestamp=timestamp,
+                chunks=chunk_count,
+                size=size,
+                counters=counters,
+            )
+
+    @staticmethod
+    async def _account(
+        journey_id: str,
+        host: str,
+        source_app: str,
+        client_id: str,
+        user_id: Optional[str],
+        timestamp: float,
+        chunks: int,
+        size: int,
+        counters: Dict[str, int],
+    ) -> None:
+        """Log the analysis of the journey and account it in IoTa"""
+
+        await get_logger().info(
+            {
+                "host": host,
+                "source_app": source_app,
+                "journey_id": journey_id,
+                "galileo_auth": counters["galileo_auth"],
+                "authentic": counters["authentic"],
+                "not_authentic": counters["not_authentic"],
+                "unknown": counters["unknown"],
+                "chunks": chunks,
+                "dedup_ratio": f"{dedup_ratio(counters)}",
+                "request_procession_time": f"{time.time() - timestamp}",
+            }
+        )
+
+        await store_in_iota(
+            source_app=source_app,
+            client_id=client_id,
+            user_id=user_id,
+            msg_id=journey_id,
+            msg_size=size,
+            msg_time=timestamp,
+            msg_malicious_position=counters["not_authentic"],
+            msg_authenticated_position=counters["authentic"],
+            msg_unknown_position=counters["unknown"],
+            msg_total_position=counters["galileo_auth"],
+        )
+
+    async def stop(self) -> None:
+        """
+        Stop the authentications running in this worker and close the database.
+        The chunks left are authenticated by the next worker that receives a request
+        """
+        for task in list(self._tasks):
+            task.cancel()
+        for task in list(self._tasks):
+            try:
+                await task
+            except CancelledError:
+                pass
+        self.close_database()
+
+    def close_database(self) -> None:
+        """Close the database, the sessions left are kept for the other workers"""
+        if self._writer is not None:
+            self._writer.shutdown()
+            self._writer = None
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def clear(self) -> None:
+        """Drop every session and reset the counters"""
+        for task in self._tasks:
+            task.cancel()
+        self._open_database()
+        self.connection.execute("DELETE FROM journeys")
+        self.open_sessions = 0
+        self.opened = 0
+        self.finalized = 0
+        self.expired = 0
+
+    def stats(self) -> dict:
+        """Counters of the sessions, the open ones are the ones last counted"""
+        return {
+            "open": self.open_sessions,
+            "max_sessions": self.max_sessions,
+            "opened": self.opened,
+            "finalized": self.finalized,
+            "expired": self.expired,
+            "authenticating": len(self._tasks),
+            "chunk_time": self.chunk_time,
+        }
+
+
+# --------------------------------------------------------------------------------------------
+
+
+@lru_cache(maxsize=1)
+def _get_journey_sessions() -> _JourneySessions:
+    """Instantiate a singleton _JourneySessions"""
+    settings = get_journey_settings()
+    return _JourneySessions(
+        path=settings.journey_store_path,
+        ttl=settings.journey_session_ttl,
+        max_sessions=settings.journey_max_sessions,
+        max_chunk_size=settings.journey_max_chunk_size,
+        max_pending_chunks=settings.journey_max_pending_chunks,
+        lease=settings.journey_lease,
+        poll_interval=settings.journey_poll_interval,
+        max_retry_after=settings.journey_max_retry_after,
+    )
+
+
+# --------------------------------------------------------------------------------------------
+
+
+JOURNEY_SESSIONS = _get_journey_sessions()
+"""Journey sessions Singleton"""
@@ -23,13 +23,22 @@ Keycloak package
 """
 
 # Standard Library
-from asyncio import Lock, TimeoutError
+from asyncio import CancelledError, Task, TimeoutError, ensure_future, shield, sleep
 from functools import lru_cache
+from random import random
 import time
+from typing import Optional
 
 # Third Party
 from fastapi import status, HTTPException
-from aiohttp import ClientSession, ClientResponseError, ClientTimeout, TCPConnector
+from aiohttp import (
+    ClientError,
+    ClientSession,
+    ClientResponseError,
+    ClientTimeout,
+    TCPConnector,
+)
+from jose import jwt, JWTError
 import orjson
 
 # Internal
@@ -39,6 +48,9 @@ from ..models.security import Token
 
 # --------------------------------------------------------------------------------------------
 
+DEFAULT_TOKEN_LIFETIME = 150
+"""Seconds a token is used when its expiration can't be read"""
+
 
 class _Keycloak:
     """Class that handles the communication with keycloak"""
@@ -49,12 +61,18 @@ class _Keycloak:
     last_token: str
     """Token"""
 
-    async_lock: Lock
-    """Asynchronous lock """
+    token_lifetime: float = DEFAULT_TOKEN_LIFETIME
+    """Seconds the last token can be used"""
 
     session: ClientSession
     """Aiohttp session"""
 
+    refresher: Task
+    """Background task that refreshes the token ahead of its expiration"""
+
+    _refreshing: Optional[Task] = None
+    """Request of a new token in flight"""
+
     async def setup(self):
         """
         Setup keycloak, call this method only inside the startup event
@@ -72,14 +90,19 @@ class _Keycloak:
             timeout=timeout,
             connector=connector,
         )
-        self.async_lock = Lock()
-        self.last_token = await self._get_token()
-        self.last_token_reception_time = time.time()
+        self._refreshing = None
+        await self._refresh()
+        self.refresher = ensure_future(self._refresh_ahead())
 
     async def close(self):
         """
         Close gracefully Keycloak session
         """
+        self.refresher.cancel()
+        try:
+            await self.refresher
+        except CancelledError:
+            pass
         await self.session.close()
 
     async def _get_token(self):
@@ -140,34 +163,70 @@ class _Keycloak:
                 detail="Keycloak service not available",
             )
 
-    async def get_ublox_token(self):
-        """
-        Obtain a token from keycloak. If 150 seconds are passed since the last token was obtained,
-        it will obtain a fresh one and adjust it's timestamp
+    def _store(self, token: str) -> None:
         """
+        Swap the token together with its reception time and its lifetime,
+        read from the exp claim of the token
 
-        # Obtain actual timestamp
+        :param token: the new token
+        """
         now = time.time()
+        try:
+            claims = jwt.get_unverified_claims(token)
+            lifetime = (
+                claims["exp"]
+                - claims.get("iat", now)
+                - get_keycloak_settings().token_expiry_margin
+            )
+        except (JWTError, KeyError, TypeError):
+            lifetime = DEFAULT_TOKEN_LIFETIME
 
-        # Check if it's been at least 50 seconds since last token was obtained
-        if now - self.last_token_reception_time >= 150:
+        # No await in between, the waiters never see a partial update
+        self.last_token = token
+        self.last_token_reception_time = now
+        self.token_lifetime = lifetime
 
-            # Check if the lock is already acquired by a coroutine
-            if self.async_lock.locked():
+    async def _fetch(self) -> str:
+        """Obtain a new token from keycloak and store it"""
+        try:
+            token = await self._get_token()
+            self._store(token)
+            return token
+        finally:
+            self._refreshing = None
 
-                # Await until the lock is released by the other coroutine
-                # and after that release it
-                await self.async_lock.acquire()
-                self.async_lock.release()
+    async def _refresh(self) -> str:
+        """
+        Obtain a new token, joining the request already in flight if any,
+        so that the waiters never pile up on keycloak
+        """
+        if self._refreshing is None:
+            self._refreshing = ensure_future(self._fetch())
+        return await shield(self._refreshing)
+
+    async def _refresh_ahead(self):
+        """Refresh the token ahead of its expiration, with jitter between the workers"""
+        settings = get_keycloak_settings()
 
-                # Here we are sure that the token was updated
-                return self.last_token
+        while True:
+            delay = self.token_lifetime * settings.token_refresh_ratio * (
+                1 - random() * settings.token_refresh_jitter
+            ) - (time.time() - self.last_token_reception_time)
+            await sleep(max(delay, 0))
 
-            # Only one coroutine has to update the token
-            async with self.async_lock:
-                # Update token and timestamp
-                self.last_token = await self._get_token()
-                self.last_token_reception_time = time.time()
+            try:
+                await self._refresh()
+            except (HTTPException, ClientError):
+                # The current token is still valid, try again later
+                await sleep(settings.token_retry)
+
+    async def get_ublox_token(self):
+        """
+        Obtain a token from keycloak. The token is normally refreshed in background,
+        only an expired token makes the request wait for a fresh one
+        """
+        if time.time() - self.last_token_reception_time >= self.token_lifetime:
+            return await self._refresh()
 
         # return the stored token
         return self.last_token
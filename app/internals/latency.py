@@ -0,0 +1,145 @@
+"""
+Latency tracker package
+
+:author: Angelo Cutaia
+:copyright: Copyright 2021, LINKS Foundation
+:version: 1.0.0
+
+..
+
+    Copyright 2021 LINKS Foundation
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+        https://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+
+# Standard Library
+from collections import deque
+from functools import lru_cache
+import time
+from typing import Any, Awaitable, Deque, Dict, List, Optional
+
+# Internal
+from ..config import get_ublox_api_settings
+
+# --------------------------------------------------------------------------------------------
+
+
+class _LatencyTracker:
+    """
+    Recent latencies of the successful calls made to every upstream service,
+    used to derive the percentiles that drive hedging and timeouts
+    """
+
+    def __init__(self, window: int, min_samples: int, refresh: int = 50):
+        """
+        :param window: number of latencies kept for every upstream
+        :param min_samples: number of latencies needed before trusting a percentile
+        :param refresh: number of new latencies after which the percentiles are
+            computed again, at most a tenth of the window
+        """
+        self.window = window
+        self.min_samples = min_samples
+        self.refresh = max(1, min(refresh, window // 10))
+        self._samples: Dict[str, Deque[float]] = {}
+        self._sorted: Dict[str, List[float]] = {}
+        self._stale: Dict[str, int] = {}
+
+    def observe(self, name: str, seconds: float) -> None:
+        """
+        Record the latency of a call
+
+        :param name: upstream identifier
+        :param seconds: latency of the call
+        """
+        samples = self._samples.get(name)
+        if samples is None:
+            samples = self._samples[name] = deque(maxlen=self.window)
+        samples.append(seconds)
+        self._stale[name] = self._stale.get(name, 0) + 1
+
+    async def timed(self, name: str, call: Awaitable[Any]) -> Any:
+        """
+        Await a call recording its latency if it succeeds
+
+        :param name: upstream identifier
+        :param call: awaitable that contacts the upstream
+        :return: result of the call
+        """
+        start = time.monotonic()
+        result = await call
+        self.observe(name, time.monotonic() - start)
+        return result
+
+    def percentile(self, name: str, percentile: float) -> Optional[float]:
+        """
+        :param name: upstream identifier
+        :param percentile: percentile to compute, between 0 and 100
+        :return: the latency percentile or None if there are too few samples
+        """
+        samples = self._samples.get(name)
+        if samples is None or len(samples) < self.min_samples:
+            return None
+
+        # Sorting the whole window on every call is too slow for the hot path,
+        # the sorted copy is refreshed only after some new latencies
+        ordered = self._sorted.get(name)
+        if (
+            ordered is None
+            or len(ordered) < self.min_samples
+            or self._stale[name] >= self.refresh
+        ):
+            ordered = self._sorted[name] = sorted(samples)
+            self._stale[name] = 0
+
+        index = min(len(ordered) - 1, int(len(ordered) * percentile / 100))
+        return ordered[index]
+
+    def clear(self) -> None:
+        """Drop every latency"""
+        self._samples.clear()
+        self._sorted.clear()
+        self._stale.clear()
+
+    def stats(self) -> dict:
+        """Percentiles of every upstream"""
+        return {
+            name: {
+                "samples": len(samples),
+                "p50": self.percentile(name, 50),
+                "p95": self.percentile(name, 95),
+                "p99": self.percentile(name, 99),
+            }
+            for name, samples in self._samples.items()
+        }
+
+
+# --------------------------------------------------------------------------------------------
+
+
+@lru_cache(maxsize=1)
+def _get_latency_tracker() -> _LatencyTracker:
+    """Instantiate a singleton _LatencyTracker"""
+    settings = get_ublox_api_settings()
+    return _LatencyTracker(
+        window=settings.latency_window,
+        min_samples=settings.latency_min_samples,
+        refresh=settings.latency_refresh,
+    )
+
+
+# --------------------------------------------------------------------------------------------
+
+
+LATENCY = _get_latency_tracker()
+"""Latency tracker Singleton"""
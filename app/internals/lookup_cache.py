@@ -0,0 +1,322 @@
+"""
+Lookup cache package
+
+:author: Angelo Cutaia
+:copyright: Copyright 2021, LINKS Foundation
+:version: 1.0.0
+
+..
+
+    Copyright 2021 LINKS Foundation
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+        https://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+# Standard Library
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from functools import lru_cache
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Internal
+from ..config import get_ublox_api_settings
+from ..models.galileo.ublox_api import UbloxAPI
+
+# --------------------------------------------------------------------------------------------
+
+LookupKey = Tuple[str, str, int, int]
+"""(region, uri kind, svid, timestamp)"""
+
+TimelineKey = Tuple[str, str, int]
+"""(region, uri kind, svid)"""
+
+
+class _Timeline:
+    """
+    Messages of a satellite fetched through the window requests, grouped by the
+    grid timestamp they were requested for. Adjacent windows overlap, so only the
+    timestamps never requested are fetched again
+    """
+
+    def __init__(self):
+        self.timestamps: List[int] = []
+        self.answers: Dict[int, List[UbloxAPI]] = {}
+        self.requested: Dict[int, float] = {}
+
+    def missing(self, timestamps: Iterable[int]) -> List[int]:
+        """
+        :param timestamps: timestamps of a window
+        :return: the timestamps never requested or whose answer is expired
+        """
+        now = time.monotonic()
+        return [
+            timestamp
+            for timestamp in timestamps
+            if self.requested.get(timestamp, 0) < now
+        ]
+
+    def add(
+        self,
+        requested: Iterable[int],
+        info: List[UbloxAPI],
+        ttl: float,
+        negative_ttl: float,
+    ) -> None:
+        """
+        Store the answer of a window request. A message is assigned to the timestamp
+        requested for it, or to the closest one requested if Ublox-Api answered
+        with a different timestamp
+
+        :param requested: timestamps requested
+        :param info: answer of Ublox-Api
+        :param ttl: seconds a raw data is considered valid
+        :param negative_ttl: seconds a missing answer is considered valid
+        """
+        requested = sorted(requested)
+        if not requested:
+            return
+        for timestamp in requested:
+            self.answers.pop(timestamp, None)
+
+        for ublox_api in info:
+            if ublox_api.raw_data is None:
+                continue
+            index = bisect_left(requested, ublox_api.timestamp)
+            if index == len(requested) or (
+                index > 0
+                and ublox_api.timestamp - requested[index - 1]
+                <= requested[index] - ublox_api.timestamp
+            ):
+                index -= 1
+            timestamp = requested[index]
+
+            if timestamp not in self.answers:
+                self.answers[timestamp] = []
+                if timestamp not in self.timestamps:
+                    insort(self.timestamps, timestamp)
+            self.answers[timestamp].append(ublox_api)
+
+        now = time.monotonic()
+        for timestamp in requested:
+            self.requested[timestamp] = now + (
+                ttl if timestamp in self.answers else negative_ttl
+            )
+
+    def window(self, timestamps: Iterable[int]) -> List[UbloxAPI]:
+        """
+        :param timestamps: timestamps of the window
+        :return: the messages fetched for exactly those timestamps, the ones fetched
+            for the windows of other positions are excluded
+        """
+        return [
+            ublox_api
+            for timestamp in timestamps
+            for ublox_api in self.answers.get(timestamp, ())
+        ]
+
+    def trim(self, max_size: int) -> int:
+        """
+        Keep only the most recent half of the timestamps when the timeline is too long
+
+        :param max_size: max number of timestamps requested kept in memory
+        :return: number of timestamps dropped
+        """
+        if len(self.requested) <= max_size:
+            return 0
+
+        cutoff = sorted(self.requested)[len(self.requested) - max_size // 2]
+        dropped = len(self.requested)
+        self.requested = {
+            timestamp: expire_at
+            for timestamp, expire_at in self.requested.items()
+            if timestamp >= cutoff
+        }
+        index = bisect_left(self.timestamps, cutoff)
+        for timestamp in self.timestamps[:index]:
+            self.answers.pop(timestamp, None)
+        del self.timestamps[:index]
+
+        return dropped - len(self.requested)
+
+
+class _LookupCache:
+    """
+    Bounded LRU cache of the raw data obtained from Ublox-Api, together with
+    the timeline of every satellite fetched through the window requests.
+    Historical navigation data never changes, so positive answers live long,
+    while None answers are kept only for a short time
+    """
+
+    def __init__(
+        self,
+        max_size: int,
+        ttl: float,
+        negative_ttl: float,
+        max_timeline_size: int,
+    ):
+        """
+        :param max_size: max number of entries kept in memory
+        :param ttl: seconds a raw data is considered valid
+        :param negative_ttl: seconds a None answer is considered valid
+        :param max_timeline_size: max number of timestamps kept for every satellite
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_timeline_size = max_timeline_size
+        self._entries: "OrderedDict[LookupKey, Tuple[float, Optional[bytes]]]" = (
+            OrderedDict()
+        )
+        self._timelines: Dict[TimelineKey, _Timeline] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.window_fetched = 0
+        self.window_reused = 0
+
+    def lookup(self, key: LookupKey) -> Tuple[bool, Optional[bytes]]:
+        """
+        Search a raw data in the cache
+
+        :param key: (region, uri kind, svid, timestamp)
+        :return: True and the raw data if the key was found, else False and None
+        """
+        entry = self._entries.get(key)
+
+        if entry is None:
+            self.misses += 1
+            return False, None
+
+        expire_at, raw_data = entry
+        if expire_at < time.monotonic():
+            # The entry is stale
+            del self._entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return False, None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return True, raw_data
+
+    def contains(self, key: LookupKey) -> bool:
+        """
+        Check if a valid entry is cached without touching the counters
+
+        :param key: (region, uri kind, svid, timestamp)
+        :return: True if the key is cached
+        """
+        entry = self._entries.get(key)
+        return entry is not None and entry[0] >= time.monotonic()
+
+    def store(self, key: LookupKey, raw_data: Optional[bytes]) -> None:
+        """
+        Store a raw data in the cache evicting the least recently used entries
+
+        :param key: (region, uri kind, svid, timestamp)
+        :param raw_data: answer of Ublox-Api
+        """
+        ttl = self.ttl if raw_data is not None else self.negative_ttl
+        self._entries[key] = (time.monotonic() + ttl, raw_data)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def window_missing(self, key: TimelineKey, timestamps: List[int]) -> List[int]:
+        """
+        Find the timestamps of a window that must be fetched from Ublox-Api
+
+        :param key: (region, uri kind, svid)
+        :param timestamps: timestamps of the window
+        :return: timestamps to fetch
+        """
+        timeline = self._timelines.get(key)
+        missing = timestamps if timeline is None else timeline.missing(timestamps)
+
+        self.window_fetched += len(missing)
+        self.window_reused += len(timestamps) - len(missing)
+        return missing
+
+    def window_store(
+        self, key: TimelineKey, requested: List[int], info: List[UbloxAPI]
+    ) -> None:
+        """
+        Store the answer of a window request in the timeline of the satellite
+
+        :param key: (region, uri kind, svid)
+        :param requested: timestamps requested
+        :param info: answer of Ublox-Api
+        """
+        timeline = self._timelines.setdefault(key, _Timeline())
+        timeline.add(requested, info, self.ttl, self.negative_ttl)
+        self.evictions += timeline.trim(self.max_timeline_size)
+
+    def window(self, key: TimelineKey, timestamps: Iterable[int]) -> List[UbloxAPI]:
+        """
+        :param key: (region, uri kind, svid)
+        :param timestamps: timestamps of the window
+        :return: the messages of the satellite stored at those timestamps
+        """
+        timeline = self._timelines.get(key)
+        return [] if timeline is None else timeline.window(timestamps)
+
+    def clear(self) -> None:
+        """Drop every entry and reset the counters"""
+        self._entries.clear()
+        self._timelines.clear()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.window_fetched = 0
+        self.window_reused = 0
+
+    def stats(self) -> dict:
+        """Counters of the cache"""
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "timelines": len(self._timelines),
+            "window_fetched": self.window_fetched,
+            "window_reused": self.window_reused,
+        }
+
+
+# --------------------------------------------------------------------------------------------
+
+
+@lru_cache(maxsize=1)
+def _get_lookup_cache() -> _LookupCache:
+    """Instantiate a singleton _LookupCache"""
+    settings = get_ublox_api_settings()
+    return _LookupCache(
+        max_size=settings.lookup_cache_size,
+        ttl=settings.lookup_cache_ttl,
+        negative_ttl=settings.lookup_cache_negative_ttl,
+        max_timeline_size=settings.window_cache_size,
+    )
+
+
+# --------------------------------------------------------------------------------------------
+
+
+LOOKUP_CACHE = _get_lookup_cache()
+"""Lookup cache Singleton"""
@@ -2,7 +2,7 @@
 #cython: language_level=3
 
 """
-Haversine function
+Haversine and meaconing detection functions
 
 :author: Angelo Cutaia
 :copyright: Copyright 2021, LINKS Foundation
@@ -91,3 +91,54 @@ def haversine(double lat, double lon) -> str:
         return ITALY
 
     return SWEDEN
+
+
+def meaconing(
+    const unsigned char[:] auth,
+    const long long[:] fullbiasnano,
+    const long long[:] timenano,
+    double meaconing_threshold,
+    long long[:] reference=None,
+) -> list:
+    """
+    Given the columns of the first GalileoAuth of every position of a trace
+    returns the meaconing verdict of every position.
+    A position without auth data resets the reference fullbiasnano and timenano.
+    The reference can be carried between the chunks of a trace
+    """
+    cdef Py_ssize_t i, size
+    cdef long long reference_fullbiasnano, reference_timenano, check_timenano
+    cdef list meaconed
+
+    size = auth.shape[0]
+    meaconed = [False] * size
+    reference_fullbiasnano = 0
+    reference_timenano = 0
+    if reference is not None:
+        reference_fullbiasnano = reference[0]
+        reference_timenano = reference[1]
+
+    for i in range(size):
+        if not auth[i]:
+            reference_fullbiasnano = 0
+            reference_timenano = 0
+
+        elif reference_fullbiasnano and reference_timenano:
+            check_timenano = timenano[i] - reference_timenano
+            if check_timenano == 0:
+                meaconed[i] = True
+            elif (
+                <double>(fullbiasnano[i] - reference_fullbiasnano) / check_timenano
+                > meaconing_threshold
+            ):
+                meaconed[i] = True
+
+        else:
+            reference_fullbiasnano = fullbiasnano[i]
+            reference_timenano = timenano[i]
+
+    if reference is not None:
+        reference[0] = reference_fullbiasnano
+        reference[1] = reference_timenano
+
+    return meaconed
@@ -0,0 +1,230 @@
+"""
+Prefetcher package
+
+:author: Angelo Cutaia
+:copyright: Copyright 2021, LINKS Foundation
+:version: 1.0.0
+
+..
+
+    Copyright 2021 LINKS Foundation
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+        https://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+
+# Standard Library
+from asyncio import CancelledError, Task, ensure_future, sleep
+from functools import lru_cache
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+# Internal
+from .logger import get_logger
+from .lookup_cache import LOOKUP_CACHE, LookupKey, TimelineKey
+from ..config import get_ublox_api_settings
+from ..models.galileo.ublox_api import UbloxAPI
+
+# --------------------------------------------------------------------------------------------
+
+
+class _Prefetcher:
+    """
+    Fetch in background the messages of the last minutes of every visible satellite,
+    sampled on a grid of timestamps, and store them in the lookup cache.
+    A satellite is visible if it was looked up within the horizon.
+    Only the exact grid timestamps are answered, nothing is inferred in between
+    """
+
+    def __init__(self, interval: float, horizon: int, step: int, budget: int):
+        """
+        :param interval: seconds between two refreshes
+        :param horizon: seconds of messages kept for every satellite
+        :param step: milliseconds between two grid timestamps
+        :param budget: max number of upstream requests of a refresh
+        """
+        self.interval = interval
+        self.horizon = horizon
+        self.step = step
+        self.budget = budget
+        self.task: Optional[Task] = None
+        self.visible: Dict[TimelineKey, float] = {}
+        self._fetched: Dict[TimelineKey, int] = {}
+        self._unused: Dict[LookupKey, float] = {}
+        self.stored = 0
+        self.hits = 0
+        self.requests = 0
+        self.last_requests = 0
+        self.skipped = 0
+
+    def observe(self, key: TimelineKey) -> None:
+        """
+        Mark a satellite as visible
+
+        :param key: (region, uri kind, svid)
+        """
+        if self.task is not None:
+            self.visible[key] = time.monotonic()
+
+    def hit(self, key: LookupKey) -> None:
+        """
+        Count a message served by the lookup cache, once, if it was prefetched
+
+        :param key: (region, uri kind, svid, timestamp)
+        """
+        if self._unused.pop(key, None) is not None:
+            self.hits += 1
+
+    def due(self) -> List[Tuple[TimelineKey, List[int]]]:
+        """
+        Forget the satellites not visible anymore
+
+        :return: grid timestamps to fetch for every visible satellite, within the budget
+        """
+        now = time.time() * 1000
+        first = int(now - self.horizon * 1000)
+        first -= first % self.step
+        last = int(now) - int(now) % self.step
+        deadline = time.monotonic() - self.horizon
+
+        # The messages not used within the horizon are a miss of the prefetch
+        for key in [key for key, at in self._unused.items() if at < deadline]:
+            del self._unused[key]
+
+        due = []
+        for key, seen_at in list(self.visible.items()):
+            if seen_at < deadline:
+                del self.visible[key]
+                self._fetched.pop(key, None)
+                continue
+
+            start = max(self._fetched.get(key, first - self.step) + self.step, first)
+            timestamps = list(range(start, last + 1, self.step))
+            if timestamps:
+                due.append((key, timestamps))
+
+        # The most outdated satellites first
+        due.sort(key=lambda item: item[1][0])
+        self.skipped += max(0, len(due) - self.budget)
+        return due[: self.budget]
+
+    def store(
+        self, key: TimelineKey, requested: List[int], info: List[UbloxAPI]
+    ) -> None:
+        """
+        Store the answer of a prefetch request in the lookup cache, every grid timestamp
+        with the message Ublox-Api answered for it or with None
+
+        :param key: (region, uri kind, svid)
+        :param requested: grid timestamps requested
+        :param info: answer of Ublox-Api
+        """
+        if not requested:
+            return
+        answers = dict.fromkeys(requested)
+        answers.update(
+            (ublox_api.timestamp, ublox_api.raw_data)
+            for ublox_api in info
+            if ublox_api.timestamp in answers
+        )
+
+        now = time.monotonic()
+        for timestamp, raw_data in answers.items():
+            LOOKUP_CACHE.store((*key, timestamp), raw_data)
+            self._unused[(*key, timestamp)] = now
+        LOOKUP_CACHE.window_store(
+            key,
+            requested,
+            [
+                UbloxAPI.construct(timestamp=timestamp, raw_data=raw_data)
+                for timestamp, raw_data in answers.items()
+            ],
+        )
+
+        last = max(requested)
+        self._fetched[key] = max(self._fetched.get(key, last), last)
+        self.stored += len(answers)
+
+    def start(self, refresh: Callable[[], Awaitable[int]]) -> None:
+        """
+        Start the background refresh, call this method only inside the startup event
+
+        :param refresh: coroutine function that fetches the due grid timestamps
+            and returns the number of upstream requests made
+        """
+        self.task = ensure_future(self._run(refresh))
+
+    async def _run(self, refresh: Callable[[], Awaitable[int]]) -> None:
+        """Refresh the grids forever"""
+        while True:
+            try:
+                self.last_requests = await refresh()
+                self.requests += self.last_requests
+            except CancelledError:
+                raise
+            except Exception as exc:
+                await get_logger().warning({"error": f"Prefetch failed: {exc!r}"})
+            await sleep(self.interval)
+
+    async def stop(self) -> None:
+        """Stop the background refresh"""
+        if self.task is None:
+            return
+        self.task.cancel()
+        try:
+            await self.task
+        except CancelledError:
+            pass
+        self.task = None
+        self.visible.clear()
+        self._fetched.clear()
+        self._unused.clear()
+
+    def stats(self) -> dict:
+        """
+        Counters of the prefetcher, the hit ratio is the share of the prefetched
+        messages later served by the lookup cache
+        """
+        return {
+            "running": self.task is not None,
+            "visible": len(self.visible),
+            "stored": self.stored,
+            "hits": self.hits,
+            "hit_ratio": self.hits / self.stored if self.stored else 0.0,
+            "requests": self.requests,
+            "last_requests": self.last_requests,
+            "budget": self.budget,
+            "skipped": self.skipped,
+        }
+
+
+# --------------------------------------------------------------------------------------------
+
+
+@lru_cache(maxsize=1)
+def _get_prefetcher() -> _Prefetcher:
+    """Instantiate a singleton _Prefetcher"""
+    settings = get_ublox_api_settings()
+    return _Prefetcher(
+        interval=settings.prefetch_interval,
+        horizon=settings.prefetch_horizon,
+        step=settings.prefetch_step,
+        budget=settings.prefetch_budget,
+    )
+
+
+# --------------------------------------------------------------------------------------------
+
+
+PREFETCHER = _get_prefetcher()
+"""Prefetcher Singleton"""
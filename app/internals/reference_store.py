@@ -0,0 +1,350 @@
+"""
+Reference store package
+
+:author: Angelo Cutaia
+:copyright: Copyright 2021, LINKS Foundation
+:version: 1.0.0
+
+..
+
+    Copyright 2021 LINKS Foundation
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+        https://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+
+# Standard Library
+from bisect import bisect_right
+from functools import lru_cache
+import mmap
+import os
+import struct
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Internal
+from .lookup_cache import LookupKey, TimelineKey
+from ..config import get_ublox_api_settings
+from ..models.galileo.ublox_api import UbloxAPI
+
+# --------------------------------------------------------------------------------------------
+
+HEADER = struct.Struct("<4sIIII")
+"""magic, version, number of messages, payload width, number of covered intervals"""
+
+MAGIC = b"GREF"
+"""Identifier of the files of the store"""
+
+VERSION = 3
+"""Version of the file format"""
+
+
+def satellite_path(root: str, key: TimelineKey) -> str:
+    """
+    :param root: directory of the store
+    :param key: (region, uri kind, svid)
+    :return: path of the file holding the messages of the satellite
+    """
+    location, kind, svid = key
+    return os.path.join(root, location, kind, f"{svid}.bin")
+
+
+# --------------------------------------------------------------------------------------------
+
+
+class ReferenceBackend:
+    """
+    Source of the reference messages consulted before contacting Ublox-Api.
+    This backend has no message, so every lookup goes to Ublox-Api
+    """
+
+    def lookup(self, key: LookupKey) -> Tuple[bool, Optional[bytes]]:
+        """
+        :param key: (region, uri kind, svid, timestamp)
+        :return: True and the raw data if the backend covers the timestamp, else False and None
+        """
+        return False, None
+
+    def window(
+        self, key: TimelineKey, timestamps: Iterable[int]
+    ) -> Optional[List[UbloxAPI]]:
+        """
+        :param key: (region, uri kind, svid)
+        :param timestamps: timestamps of the window
+        :return: the messages valid at the timestamps or None if the backend
+            can't resolve all of them
+        """
+        return None
+
+    def close(self) -> None:
+        """Release the resources of the backend"""
+
+    def stats(self) -> dict:
+        """Counters of the backend"""
+        return {"backend": "ublox_api"}
+
+
+class _MappedSatellite:
+    """
+    Messages of a satellite memory-mapped from the store: the intervals covered by the
+    ingested grids, a sorted array of timestamps, the length of every payload and an array
+    of fixed width binary payloads. A zero length marks a timestamp Ublox-Api had no
+    message for. The pages are shared by every worker
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as fp:
+            self.inode = os.fstat(fp.fileno()).st_ino
+            self._mmap = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.count, self.width, intervals = HEADER.unpack_from(
+            self._mmap
+        )
+        if magic != MAGIC or version != VERSION:
+            self._mmap.close()
+            raise ValueError(f"{path} is not a reference store file")
+
+        # Few intervals, kept unpacked
+        bounds = struct.unpack_from(f"<{2 * intervals}q", self._mmap, HEADER.size)
+        self.intervals = list(zip(bounds[::2], bounds[1::2]))
+        self._starts = bounds[::2]
+
+        view = memoryview(self._mmap)
+        timestamps_offset = HEADER.size + 16 * intervals
+        lengths_offset = timestamps_offset + 8 * self.count
+        payloads_offset = lengths_offset + 2 * self.count
+        self.timestamps = view[timestamps_offset:lengths_offset].cast("q")
+        self.lengths = view[lengths_offset:payloads_offset].cast("H")
+        self.payloads = view[
+            payloads_offset : payloads_offset + self.count * self.width
+        ]
+
+    def _interval(self, timestamp: int) -> Optional[Tuple[int, int]]:
+        """Covered interval containing the timestamp if any"""
+        index = bisect_right(self._starts, timestamp) - 1
+        if index >= 0 and timestamp <= self.intervals[index][1]:
+            return self.intervals[index]
+        return None
+
+    def _payload(self, index: int) -> Optional[bytes]:
+        """Raw data of the message at the given index"""
+        if not self.lengths[index]:
+            return None
+        start = index * self.width
+        return bytes(self.payloads[start : start + self.lengths[index]])
+
+    def find(self, timestamp: int) -> Optional[bytes]:
+        """
+        Resolve a timestamp to the message valid at that time: the last one received
+        at or before it inside the same ingested interval
+
+        :param timestamp: Requested timestamp
+        :return: the raw data valid at the timestamp if the store knows it
+        """
+        interval = self._interval(timestamp)
+        if interval is None:
+            return None
+
+        index = bisect_right(self.timestamps, timestamp) - 1
+        if index < 0 or self.timestamps[index] < interval[0]:
+            return None
+        return self._payload(index)
+
+    def entries(self) -> Dict[int, Optional[bytes]]:
+        """Every stored timestamp and its raw data"""
+        return {
+            self.timestamps[index]: self._payload(index) for index in range(self.count)
+        }
+
+    def close(self) -> None:
+        """Unmap the file"""
+        self.timestamps.release()
+        self.lengths.release()
+        self.payloads.release()
+        self._mmap.close()
+
+
+class _LocalReferenceStore(ReferenceBackend):
+    """
+    Reference messages ingested from Ublox-Api dumps and memory-mapped from disk.
+    Timestamps the store can't resolve to a message are asked to Ublox-Api
+    """
+
+    def __init__(self, root: str, refresh: float):
+        """
+        :param root: directory of the store
+        :param refresh: seconds after which a satellite file is checked for a new ingestion
+        """
+        self.root = root
+        self.refresh = refresh
+        self._satellites: Dict[
+            TimelineKey, Tuple[float, Optional[_MappedSatellite]]
+        ] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _satellite(self, key: TimelineKey) -> Optional[_MappedSatellite]:
+        """Map the file of a satellite, mapping it again if it was replaced"""
+        now = time.monotonic()
+        checked_at, satellite = self._satellites.get(key, (-self.refresh, None))
+        if now - checked_at < self.refresh:
+            return satellite
+
+        path = satellite_path(self.root, key)
+        try:
+            inode = os.stat(path).st_ino
+        except FileNotFoundError:
+            inode = None
+
+        if satellite is not None and satellite.inode != inode:
+            satellite.close()
+            satellite = None
+        if satellite is None and inode is not None:
+            satellite = _MappedSatellite(path)
+
+        self._satellites[key] = (now, satellite)
+        return satellite
+
+    def lookup(self, key: LookupKey) -> Tuple[bool, Optional[bytes]]:
+        location, kind, svid, timestamp = key
+        satellite = self._satellite((location, kind, svid))
+
+        raw_data = None if satellite is None else satellite.find(timestamp)
+
+        if raw_data is None:
+            self.misses += 1
+            return False, None
+
+        self.hits += 1
+        return True, raw_data
+
+    def window(
+        self, key: TimelineKey, timestamps: Iterable[int]
+    ) -> Optional[List[UbloxAPI]]:
+        satellite = self._satellite(key)
+
+        info = []
+        for timestamp in timestamps:
+            raw_data = None if satellite is None else satellite.find(timestamp)
+            if raw_data is None:
+                self.misses += 1
+                return None
+            info.append(UbloxAPI.construct(timestamp=timestamp, raw_data=raw_data))
+
+        self.hits += 1
+        return info
+
+    def close(self) -> None:
+        for _, satellite in self._satellites.values():
+            if satellite is not None:
+                satellite.close()
+        self._satellites.clear()
+
+    def stats(self) -> dict:
+        return {
+            "backend": "local",
+            "satellites": sum(
+                satellite is not None for _, satellite in self._satellites.values()
+            ),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+# --------------------------------------------------------------------------------------------
+
+
+def ingest(root: str, key: TimelineKey, grids: Iterable[Iterable[UbloxAPI]]) -> int:
+    """
+    Merge the messages obtained from Ublox-Api in the file of a satellite.
+    Every grid covers only the interval between its first and last timestamp,
+    so the gaps between the dumps are still asked to Ublox-Api.
+    The file is replaced atomically, so the workers keep reading the previous one
+    until they map the new one.
+
+    :param root: directory of the store
+    :param key: (region, uri kind, svid)
+    :param grids: timestamps requested to Ublox-Api and their raw data, one list per request
+    :return: number of messages of the satellite
+    """
+    path = satellite_path(root, key)
+    messages: Dict[int, Optional[bytes]] = {}
+    intervals: List[Tuple[int, int]] = []
+
+    if os.path.exists(path):
+        satellite = _MappedSatellite(path)
+        messages.update(satellite.entries())
+        intervals.extend(satellite.intervals)
+        satellite.close()
+
+    for info in grids:
+        requested = []
+        for ublox_api in info:
+            requested.append(ublox_api.timestamp)
+            messages[ublox_api.timestamp] = ublox_api.raw_data or None
+        if requested:
+            intervals.append((min(requested), max(requested)))
+
+    if not intervals:
+        return 0
+
+    # Merge the overlapping intervals
+    merged: List[Tuple[int, int]] = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+
+    timestamps = sorted(messages)
+    payloads = [messages[timestamp] or b"" for timestamp in timestamps]
+    width = max(map(len, payloads), default=0)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(f"{path}.tmp", "wb") as fp:
+        fp.write(HEADER.pack(MAGIC, VERSION, len(timestamps), width, len(merged)))
+        fp.write(
+            struct.pack(
+                f"<{2 * len(merged)}q",
+                *(bound for interval in merged for bound in interval),
+            )
+        )
+        fp.write(struct.pack(f"<{len(timestamps)}q", *timestamps))
+        fp.write(struct.pack(f"<{len(payloads)}H", *map(len, payloads)))
+        for payload in payloads:
+            fp.write(payload.ljust(width, b"\0"))
+    os.replace(f"{path}.tmp", path)
+
+    return sum(map(bool, payloads))
+
+
+# --------------------------------------------------------------------------------------------
+
+
+@lru_cache(maxsize=1)
+def _get_reference_backend() -> ReferenceBackend:
+    """Instantiate a singleton ReferenceBackend of the configured kind"""
+    settings = get_ublox_api_settings()
+    if settings.reference_backend == "local":
+        return _LocalReferenceStore(
+            root=settings.reference_store_path,
+            refresh=settings.reference_store_refresh,
+        )
+    return ReferenceBackend()
+
+
+# --------------------------------------------------------------------------------------------
+
+
+REFERENCE_BACKEND = _get_reference_backend()
+"""Reference backend Singleton"""
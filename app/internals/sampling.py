@@ -0,0 +1,127 @@
+"""
+Sampled authentication package
+
+:author: Angelo Cutaia
+:copyright: Copyright 2021, LINKS Foundation
+:version: 1.0.0
+
+..
+
+    Copyright 2021 LINKS Foundation
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+        https://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+
+# Standard Library
+from math import sqrt
+import random
+from typing import List, Optional, Tuple
+
+# --------------------------------------------------------------------------------------------
+
+Stratum = Tuple[int, List[int]]
+"""(number of positions of the stratum, indexes of the positions sampled)"""
+
+
+def stratified_sample(
+    trace_indexes: List[int],
+    meaconed: List[bool],
+    sample_size: int,
+    strata: int,
+    suspicion_factor: float,
+    rng: random.Random = random,
+) -> List[Stratum]:
+    """
+    Split the positions to verify in contiguous strata along the trace and pick
+    a random sample in each of them, proportionally to their size.
+    The strata where meaconing was detected are suspicious, so their share is
+    multiplied by the suspicion factor. Every stratum gets at least one position,
+    so at most sample_size + strata positions are sampled
+
+    :param trace_indexes: index in the trace of every position to verify
+    :param meaconed: meaconing verdict of every position of the trace
+    :param sample_size: number of positions to sample
+    :param strata: number of strata
+    :param suspicion_factor: weight of the suspicious strata
+    :param rng: source of randomness
+    :return: the strata of the positions to verify
+    """
+    size = len(trace_indexes)
+    if size == 0:
+        return []
+
+    strata = max(1, min(strata, size))
+    bounds = [size * stratum // strata for stratum in range(strata + 1)]
+
+    # Prefix sums of the meaconed positions of the trace
+    meaconed_before = [0]
+    for verdict in meaconed:
+        meaconed_before.append(meaconed_before[-1] + verdict)
+
+    weights = []
+    for start, end in zip(bounds, bounds[1:]):
+        suspicious = (
+            meaconed_before[trace_indexes[end - 1] + 1]
+            > meaconed_before[trace_indexes[start]]
+        )
+        weights.append((end - start) * (suspicion_factor if suspicious else 1))
+    total = sum(weights)
+
+    sample = []
+    for (start, end), weight in zip(zip(bounds, bounds[1:]), weights):
+        allocation = min(end - start, max(1, int(sample_size * weight / total)))
+        sample.append((end - start, sorted(rng.sample(range(start, end), allocation))))
+
+    return sample
+
+
+def estimate_authenticity(
+    strata: List[Tuple[int, int, int]], z: float
+) -> Optional[Tuple[float, float, float]]:
+    """
+    Extrapolate the ratio of authentic positions of the journey from the sample,
+    weighting every stratum by its size
+
+    :param strata: number of positions, authentic and not authentic positions sampled
+        of every stratum
+    :param z: standard score of the confidence interval
+    :return: estimated ratio of authentic positions and its confidence bounds,
+        None if no sampled position could be verified
+    """
+    verified = [
+        (size, authentic, not_authentic)
+        for size, authentic, not_authentic in strata
+        if authentic + not_authentic > 0
+    ]
+    total = sum(size for size, _, _ in verified)
+    if total == 0:
+        return None
+
+    ratio = 0.0
+    variance = 0.0
+    for size, authentic, not_authentic in verified:
+        weight = size / total
+        sampled = authentic + not_authentic
+        stratum_ratio = authentic / sampled
+        ratio += weight * stratum_ratio
+        variance += (
+            weight**2
+            * stratum_ratio
+            * (1 - stratum_ratio)
+            / sampled
+            * max(0.0, 1 - sampled / size)
+        )
+
+    margin = z * sqrt(variance)
+    return ratio, max(0.0, ratio - margin), min(1.0, ratio + margin)
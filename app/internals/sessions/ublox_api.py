@@ -24,17 +24,22 @@ Ublox-Api session package
 
 # Standard Library
 from contextlib import asynccontextmanager
+from functools import lru_cache
+from typing import Dict
 
 # Third Party
 from aiohttp import ClientSession, ClientTimeout, TCPConnector
 import orjson
 
+# Internal
+from ...config import get_timeout_settings, get_ublox_api_settings
+
 # ----------------------------------------------------------------------------
 
 
 @asynccontextmanager
 async def get_ublox_api_session() -> ClientSession:
-    """Async Context manager to get a session to communicate with UbloxApi"""
+    """Async Context manager to get a one-shot session to communicate with UbloxApi"""
     timeout = ClientTimeout(total=None)
     connector = TCPConnector(limit=1, ssl=False, ttl_dns_cache=300)
     session = ClientSession(
@@ -48,3 +53,72 @@ async def get_ublox_api_session() -> ClientSession:
         yield session
     finally:
         await session.close()
+
+
+# ----------------------------------------------------------------------------
+
+
+class _UbloxApiSessions:
+    """Class that handles the long-lived sessions used to communicate with Ublox-Api"""
+
+    sessions: Dict[str, ClientSession]
+    """Aiohttp session of every reference region"""
+
+    async def setup(self):
+        """
+        Setup a pooled session for Italy and Sweden, call this method only inside the startup event
+        """
+        settings = get_ublox_api_settings()
+        timeout_settings = get_timeout_settings()
+
+        self.sessions = {}
+        for location in ("Italy", "Sweden"):
+            # connection options
+            connector = TCPConnector(
+                limit=settings.ublox_api_connection_limit,
+                limit_per_host=settings.ublox_api_connection_limit,
+                keepalive_timeout=settings.ublox_api_keep_alive,
+                ttl_dns_cache=settings.ublox_api_dns_cache,
+                ssl=False,
+            )
+
+            # Instantiate a session, every request sets its own deadline
+            self.sessions[location] = ClientSession(
+                connector=connector,
+                timeout=ClientTimeout(total=timeout_settings.ublox_api_timeout_max),
+                json_serialize=lambda x: orjson.dumps(x).decode(),
+                raise_for_status=True,
+                connector_owner=True,
+            )
+
+    async def close(self):
+        """
+        Close gracefully Ublox-Api sessions
+        """
+        for session in self.sessions.values():
+            await session.close()
+
+    def get(self, location: str) -> ClientSession:
+        """
+        Borrow the session of a reference region
+
+        :param location: Sweden or Italy
+        :return: Aiohttp session
+        """
+        return self.sessions[location]
+
+
+# ----------------------------------------------------------------------------
+
+
+@lru_cache(maxsize=1)
+def _get_ublox_api_sessions() -> _UbloxApiSessions:
+    """Instantiate a singleton _UbloxApiSessions"""
+    return _UbloxApiSessions()
+
+
+# ----------------------------------------------------------------------------
+
+
+UBLOX_API_SESSIONS = _get_ublox_api_sessions()
+"""Ublox-Api sessions Singleton"""
@@ -0,0 +1,262 @@
+"""
+Shared cache package
+
+:author: Angelo Cutaia
+:copyright: Copyright 2021, LINKS Foundation
+:version: 1.0.0
+
+..
+
+    Copyright 2021 LINKS Foundation
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+        https://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+# Standard Library
+from functools import lru_cache
+from hashlib import blake2b
+import mmap
+from multiprocessing import Lock
+import struct
+import time
+from typing import Optional, Tuple
+
+# Internal
+from .lookup_cache import LookupKey
+from ..config import get_ublox_api_settings
+
+# --------------------------------------------------------------------------------------------
+
+SLOT_HEADER = struct.Struct("<IBBHQd")
+"""sequence, reference bit, state, payload length, key hash, expiration time"""
+
+REFERENCE_BIT = 4
+"""Offset of the reference bit in the slot"""
+
+EMPTY, PRESENT, MISSING = 0, 1, 2
+"""State of a slot: never used, raw data stored, None answer stored"""
+
+
+class SharedCache:
+    """
+    Cache of the raw data shared by the workers.
+    This cache stores nothing, so every lookup misses
+    """
+
+    def lookup(self, key: LookupKey) -> Tuple[bool, Optional[bytes]]:
+        """
+        :param key: (region, uri kind, svid, timestamp)
+        :return: True and the raw data if the key was found, else False and None
+        """
+        return False, None
+
+    def store(self, key: LookupKey, raw_data: Optional[bytes]) -> None:
+        """
+        :param key: (region, uri kind, svid, timestamp)
+        :param raw_data: answer of Ublox-Api
+        """
+
+    def stats(self) -> dict:
+        """Counters of the cache"""
+        return {"enabled": False}
+
+
+class _SharedMemoryCache(SharedCache):
+    """
+    Hash table of fixed size slots in an anonymous shared memory mapping.
+    It's created by the gunicorn master when the app is imported, so every worker
+    forked afterwards attaches to the same pages and finds the messages fetched by the others.
+    A key lives in one of the probe slots that follow its hash, the victim among them
+    is chosen with the clock (second chance) algorithm. The writers are serialized by
+    a lock shared by the workers, the readers don't take it and detect a concurrent
+    write through the sequence of the slot
+    """
+
+    def __init__(
+        self,
+        slots: int,
+        slot_size: int,
+        probe: int,
+        ttl: float,
+        negative_ttl: float,
+    ):
+        """
+        :param slots: number of slots of the table
+        :param slot_size: max size in bytes of a raw data
+        :param probe: number of slots where a key can be stored
+        :param ttl: seconds a raw data is considered valid
+        :param negative_ttl: seconds a None answer is considered valid
+        """
+        self.slots = slots
+        self.slot_size = slot_size
+        self.probe = min(probe, slots)
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.stride = SLOT_HEADER.size + slot_size
+        self._memory = mmap.mmap(-1, slots * self.stride)
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.skipped = 0
+
+    @staticmethod
+    def _hash(key: LookupKey) -> int:
+        """Hash of a key, the same in every worker"""
+        location, kind, svid, timestamp = key
+        return int.from_bytes(
+            blake2b(
+                f"{location}/{kind}/{svid}/{timestamp}".encode(), digest_size=8
+            ).digest(),
+            "little",
+        )
+
+    def _offsets(self, key_hash: int):
+        """Offsets of the slots where a key can be stored"""
+        first = key_hash % self.slots
+        for index in range(self.probe):
+            yield ((first + index) % self.slots) * self.stride
+
+    def lookup(self, key: LookupKey) -> Tuple[bool, Optional[bytes]]:
+        key_hash = self._hash(key)
+        now = time.time()
+
+        for offset in self._offsets(key_hash):
+            sequence, _, state, length, slot_hash, expire_at = SLOT_HEADER.unpack_from(
+                self._memory, offset
+            )
+            if state == EMPTY or slot_hash != key_hash:
+                continue
+
+            payload = self._memory[
+                offset + SLOT_HEADER.size : offset + SLOT_HEADER.size + length
+            ]
+            if (
+                sequence & 1
+                or SLOT_HEADER.unpack_from(self._memory, offset)[0] != sequence
+            ):
+                # Written concurrently
+                break
+            if expire_at < now:
+                break
+
+            # Second chance for the clock
+            self._memory[offset + REFERENCE_BIT] = 1
+            self.hits += 1
+            return True, payload if state == PRESENT else None
+
+        self.misses += 1
+        return False, None
+
+    def store(self, key: LookupKey, raw_data: Optional[bytes]) -> None:
+        if raw_data is not None and len(raw_data) > self.slot_size:
+            self.skipped += 1
+            return
+
+        # Never block the event loop, the message can be fetched again
+        if not self._lock.acquire(block=False):
+            self.skipped += 1
+            return
+
+        try:
+            key_hash = self._hash(key)
+            offset = self._victim(key_hash)
+            sequence = SLOT_HEADER.unpack_from(self._memory, offset)[0]
+
+            # Odd sequence while writing
+            struct.pack_into("<I", self._memory, offset, sequence + 1)
+            if raw_data is None:
+                state, payload = MISSING, b""
+                expire_at = time.time() + self.negative_ttl
+            else:
+                state, payload = PRESENT, raw_data
+                expire_at = time.time() + self.ttl
+            self._memory[
+                offset + SLOT_HEADER.size : offset + SLOT_HEADER.size + len(payload)
+            ] = payload
+            SLOT_HEADER.pack_into(
+                self._memory,
+                offset,
+                sequence + 2,
+                1,
+                state,
+                len(payload),
+                key_hash,
+                expire_at,
+            )
+            self.stores += 1
+        finally:
+            self._lock.release()
+
+    def _victim(self, key_hash: int) -> int:
+        """
+        Choose the slot for a key: the one already holding it, an empty or expired one,
+        otherwise the first one without the reference bit, clearing the others
+
+        :param key_hash: hash of the key
+        :return: offset of the slot
+        """
+        offsets = list(self._offsets(key_hash))
+        now = time.time()
+
+        for offset in offsets:
+            _, _, state, _, slot_hash, expire_at = SLOT_HEADER.unpack_from(
+                self._memory, offset
+            )
+            if state == EMPTY or slot_hash == key_hash or expire_at < now:
+                return offset
+
+        self.evictions += 1
+        while True:
+            for offset in offsets:
+                if not self._memory[offset + REFERENCE_BIT]:
+                    return offset
+                self._memory[offset + REFERENCE_BIT] = 0
+
+    def stats(self) -> dict:
+        return {
+            "enabled": True,
+            "slots": self.slots,
+            "slot_size": self.slot_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "skipped": self.skipped,
+        }
+
+
+# --------------------------------------------------------------------------------------------
+
+
+@lru_cache(maxsize=1)
+def _get_shared_cache() -> SharedCache:
+    """Instantiate a singleton SharedCache, in shared memory if enabled"""
+    settings = get_ublox_api_settings()
+    if settings.shared_cache:
+        return _SharedMemoryCache(
+            slots=settings.shared_cache_slots,
+            slot_size=settings.shared_cache_slot_size,
+            probe=settings.shared_cache_probe,
+            ttl=settings.lookup_cache_ttl,
+            negative_ttl=settings.lookup_cache_negative_ttl,
+        )
+    return SharedCache()
+
+
+# --------------------------------------------------------------------------------------------
+
+
+SHARED_CACHE = _get_shared_cache()
+"""Shared cache Singleton"""
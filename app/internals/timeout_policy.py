@@ -0,0 +1,158 @@
+"""
+Timeout policy package
+
+:author: Angelo Cutaia
+:copyright: Copyright 2021, LINKS Foundation
+:version: 1.0.0
+
+..
+
+    Copyright 2021 LINKS Foundation
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+        https://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+
+# Standard Library
+from contextlib import contextmanager
+from functools import lru_cache
+import time
+from typing import Dict, Iterator, Optional, Tuple
+
+# Internal
+from .latency import LATENCY, _LatencyTracker
+from ..config import get_timeout_settings
+
+# --------------------------------------------------------------------------------------------
+
+
+class _TimeoutPolicy:
+    """
+    Deadlines of the outbound calls derived from the recent latencies of every endpoint:
+    a percentile of the latencies multiplied by a factor, clamped to the bounds of the endpoint.
+    Until enough latencies are collected the default deadline of the endpoint is used
+    """
+
+    def __init__(
+        self,
+        bounds: Dict[str, Tuple[float, float, float]],
+        percentile: float,
+        factor: float,
+        latency: _LatencyTracker,
+    ):
+        """
+        :param bounds: default, min and max deadline of every endpoint
+        :param percentile: latency percentile the deadlines are based on
+        :param factor: multiplier of the latency percentile
+        :param latency: tracker of the latencies
+        """
+        self.bounds = bounds
+        self.percentile = percentile
+        self.factor = factor
+        self.latency = latency
+        self._names: Dict[str, str] = {}
+
+    def timeout(self, endpoint: str, name: Optional[str] = None) -> float:
+        """
+        :param endpoint: endpoint whose bounds apply
+        :param name: latencies to use if they aren't the ones of the endpoint
+        :return: seconds the call can last
+        """
+        name = endpoint if name is None else name
+        self._names[name] = endpoint
+
+        default, minimum, maximum = self.bounds[endpoint]
+        latency = self.latency.percentile(name, self.percentile)
+        if latency is None:
+            return default
+        return min(maximum, max(minimum, latency * self.factor))
+
+    @contextmanager
+    def deadline(self, endpoint: str) -> Iterator[float]:
+        """
+        Context manager that provides the deadline of a call and records its latency.
+        A call that fails or times out is recorded too, it lasted at least that long:
+        otherwise an upstream slower than the deadline would never raise it
+
+        :param endpoint: endpoint contacted
+        :return: seconds the call can last
+        """
+        start = time.monotonic()
+        try:
+            yield self.timeout(endpoint)
+        finally:
+            self.latency.observe(endpoint, time.monotonic() - start)
+
+    def stats(self) -> dict:
+        """Current deadline of every endpoint contacted"""
+        return {
+            name: self.timeout(endpoint, name) for name, endpoint in self._names.items()
+        }
+
+
+# --------------------------------------------------------------------------------------------
+
+
+@lru_cache(maxsize=1)
+def _get_timeout_policy() -> _TimeoutPolicy:
+    """Instantiate a singleton _TimeoutPolicy"""
+    settings = get_timeout_settings()
+    return _TimeoutPolicy(
+        bounds={
+            "ublox_api": (
+                settings.ublox_api_timeout,
+                settings.ublox_api_timeout_min,
+                settings.ublox_api_timeout_max,
+            ),
+            "anonengine_store": (
+                settings.anonengine_store_timeout,
+                settings.anonengine_store_timeout_min,
+                settings.anonengine_store_timeout_max,
+            ),
+            "anonengine_extract": (
+                settings.anonengine_extract_timeout,
+                settings.anonengine_extract_timeout_min,
+                settings.anonengine_extract_timeout_max,
+            ),
+            "ipt_anonymizer_store": (
+                settings.ipt_anonymizer_store_timeout,
+                settings.ipt_anonymizer_store_timeout_min,
+                settings.ipt_anonymizer_store_timeout_max,
+            ),
+            "ipt_anonymizer_extract": (
+                settings.ipt_anonymizer_extract_timeout,
+                settings.ipt_anonymizer_extract_timeout_min,
+                settings.ipt_anonymizer_extract_timeout_max,
+            ),
+            "iota_get": (
+                settings.iota_get_timeout,
+                settings.iota_get_timeout_min,
+                settings.iota_get_timeout_max,
+            ),
+            "iota_store": (
+                settings.iota_store_timeout,
+                settings.iota_store_timeout_min,
+                settings.iota_store_timeout_max,
+            ),
+        },
+        percentile=settings.timeout_percentile,
+        factor=settings.timeout_factor,
+        latency=LATENCY,
+    )
+
+
+# --------------------------------------------------------------------------------------------
+
+
+TIMEOUTS = _get_timeout_policy()
+"""Timeout policy Singleton"""
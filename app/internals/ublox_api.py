@@ -23,19 +23,48 @@ Ublox-Api package
 """
 
 # Standard Library
-from asyncio import TimeoutError
-from typing import Optional, List
+from asyncio import (
+    FIRST_COMPLETED,
+    Future,
+    Task,
+    TimeoutError,
+    ensure_future,
+    get_event_loop,
+    shield,
+    wait,
+)
+from functools import lru_cache, partial
+import time
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Hashable,
+    Iterable,
+    Optional,
+    List,
+    Tuple,
+)
 
 # Third Party
-from aiohttp import ClientSession, ClientResponseError
+from aiohttp import ClientError, ClientSession, ClientResponseError
 from fastapi import status, HTTPException
 import orjson
 
 # Internal
+from .circuit_breaker import CIRCUIT_BREAKERS, CircuitOpenError
 from .keycloak import KEYCLOAK
+from .latency import LATENCY
 from .logger import get_logger
+from .lookup_cache import LOOKUP_CACHE, LookupKey, TimelineKey
+from .prefetcher import PREFETCHER
+from .reference_store import REFERENCE_BACKEND
+from .sessions.ublox_api import UBLOX_API_SESSIONS
+from .shared_cache import SHARED_CACHE
+from .timeout_policy import TIMEOUTS
 from ..config import get_ublox_api_settings
-from ..models.galileo.ublox_api import UbloxAPI, UbloxAPIList
+from ..models.galileo.ublox_api import UbloxAPI, UbloxAPIList, UbloxAPIWindow
 
 # --------------------------------------------------------------------------------------------
 
@@ -54,6 +83,237 @@ URL_GALILEO = {
 }
 """ Italian and Swedish url for getting galileo messages """
 
+URLS = {"ublox": URL_UBLOX, "galileo": URL_GALILEO}
+""" Urls of every uri kind """
+
+SECONDARY_REGION = {"Italy": "Sweden", "Sweden": "Italy"}
+""" Region contacted when the primary one is slow or unavailable """
+
+# --------------------------------------------------------------------------------------------
+
+
+class _SingleFlight:
+    """
+    Table of the requests in flight towards Ublox-Api.
+    Concurrent identical requests share one upstream call and one parsed result
+    """
+
+    def __init__(self):
+        self.requests: Dict[Hashable, Task] = {}
+        self.leaders = 0
+        self.followers = 0
+
+    async def do(self, key: Hashable, request: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Make the request or join the identical one already in flight.
+        Errors reach every waiter.
+
+        :param key: identifier of the request
+        :param request: coroutine function that makes the upstream call
+        :return: result of the request
+        """
+        task = self.requests.get(key)
+
+        if task is None:
+            self.leaders += 1
+            # The request runs in its own task so that the cancellation
+            # of a waiter doesn't affect the others
+            task = ensure_future(request())
+            self.requests[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            self.followers += 1
+
+        return await shield(task)
+
+    def _forget(self, key: Hashable, task: Task) -> None:
+        """Remove a completed request from the table"""
+        if self.requests.get(key) is task:
+            del self.requests[key]
+
+    def stats(self) -> dict:
+        """Counters of the table"""
+        return {
+            "in_flight": len(self.requests),
+            "leaders": self.leaders,
+            "followers": self.followers,
+        }
+
+
+@lru_cache(maxsize=1)
+def _get_single_flight() -> _SingleFlight:
+    """Instantiate a singleton _SingleFlight"""
+    return _SingleFlight()
+
+
+SINGLE_FLIGHT = _get_single_flight()
+"""Single-flight Singleton"""
+
+# --------------------------------------------------------------------------------------------
+
+
+class _Hedging:
+    """
+    Race the primary region of a lookup against the secondary one when the primary
+    doesn't answer within a latency percentile, or fails.
+    The first valid answer wins and the other request is cancelled
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.hedged = 0
+        self.fallbacks = 0
+        self.primary_wins = 0
+        self.secondary_wins = 0
+
+    async def do(
+        self,
+        primary: Callable[[], Awaitable[Any]],
+        secondary: Callable[[], Awaitable[Any]],
+        delay: float,
+        valid: Callable[[Any], bool],
+    ) -> Any:
+        """
+        Make the request to the primary region and hedge it if needed
+
+        :param primary: coroutine function that contacts the primary region
+        :param secondary: coroutine function that contacts the secondary region
+        :param delay: seconds to wait the primary region before hedging
+        :param valid: tells if an answer can win the race
+        :return: the first valid answer, otherwise the answer or the error of the primary
+        """
+        self.requests += 1
+        first = ensure_future(primary())
+        second = None
+        pending = {first}
+
+        try:
+            done, pending = await wait(pending, timeout=delay)
+            if done and first.exception() is None and valid(first.result()):
+                return first.result()
+
+            # The primary region is slow or gave a bad answer
+            self.hedged += 1
+            if done:
+                self.fallbacks += 1
+            second = ensure_future(secondary())
+            pending.add(second)
+
+            while pending:
+                done, pending = await wait(pending, return_when=FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None and valid(task.result()):
+                        if task is first:
+                            self.primary_wins += 1
+                        else:
+                            self.secondary_wins += 1
+                        return task.result()
+        finally:
+            # Cancel the loser
+            for task in pending:
+                task.cancel()
+
+        # No valid answer, prefer an answer over an error
+        for task in (first, second):
+            if task.exception() is None:
+                return task.result()
+        return first.result()
+
+    def stats(self) -> dict:
+        """Counters of the hedged requests"""
+        return {
+            "requests": self.requests,
+            "hedged": self.hedged,
+            "fallbacks": self.fallbacks,
+            "primary_wins": self.primary_wins,
+            "secondary_wins": self.secondary_wins,
+            "hedge_rate": self.hedged / self.requests if self.requests else 0.0,
+            "secondary_win_ratio": (
+                self.secondary_wins / self.hedged if self.hedged else 0.0
+            ),
+        }
+
+
+@lru_cache(maxsize=1)
+def _get_hedging() -> _Hedging:
+    """Instantiate a singleton _Hedging"""
+    return _Hedging()
+
+
+HEDGING = _get_hedging()
+"""Hedging Singleton"""
+
+
+async def _contact(url: str, request: Callable[[], Awaitable[Any]]) -> Any:
+    """
+    Contact a Ublox-Api server through its circuit breaker, recording the latency
+
+    :param url: Url of Ublox-Api server
+    :param request: coroutine function that contacts the url
+    :return: the answer
+    """
+    breaker = CIRCUIT_BREAKERS.get(url)
+    if not await breaker.allow():
+        raise CircuitOpenError(url)
+
+    start = time.monotonic()
+    try:
+        result = await request()
+    except Exception:
+        # A timeout is recorded too, so that a slow upstream raises the deadline
+        seconds = time.monotonic() - start
+        LATENCY.observe(url, seconds)
+        await breaker.record(success=False, seconds=seconds)
+        raise
+    except BaseException:
+        # Cancelled, the loser of a hedged request
+        breaker.release()
+        raise
+
+    seconds = time.monotonic() - start
+    LATENCY.observe(url, seconds)
+    await breaker.record(success=True, seconds=seconds)
+    return result
+
+
+async def _hedged(
+    location: str,
+    kind: str,
+    request: Callable[[str, ClientSession], Awaitable[Any]],
+    session: ClientSession,
+    valid: Callable[[Any], bool],
+) -> Any:
+    """
+    Contact the primary region, hedging the request towards the secondary one
+    if hedging is enabled. An open circuit of the primary region makes the
+    secondary one answer immediately.
+
+    :param location: primary region, Sweden or Italy
+    :param kind: galileo or ublox
+    :param request: coroutine function that contacts the given url with the given session
+    :param session: Aiohttp session of the primary region
+    :param valid: tells if an answer can win the race
+    :return: the answer
+    """
+    url = URLS[kind][location]
+    if not SETTINGS.hedge_requests:
+        return await _contact(url, lambda: request(url, session))
+
+    secondary = SECONDARY_REGION[location]
+    secondary_url = URLS[kind][secondary]
+    delay = LATENCY.percentile(url, SETTINGS.hedge_percentile)
+
+    return await HEDGING.do(
+        primary=lambda: _contact(url, lambda: request(url, session)),
+        secondary=lambda: _contact(
+            secondary_url,
+            lambda: request(secondary_url, UBLOX_API_SESSIONS.get(secondary)),
+        ),
+        delay=SETTINGS.hedge_delay if delay is None else delay,
+        valid=valid,
+    )
+
+
 # --------------------------------------------------------------------------------------------
 
 
@@ -63,7 +323,7 @@ async def _get_raw_data(
     ublox_token: str,
     url: str,
     session: ClientSession,
-) -> Optional[str]:
+) -> Optional[bytes]:
     """
     Contacts Ublox-Api and extracts raw data from the given satellite id and timestamp.
 
@@ -81,7 +341,7 @@ async def _get_raw_data(
         async with session.get(
             f"{url}/{svid}/{timestamp}",
             headers={"Authorization": f"Bearer {ublox_token}"},
-            timeout=6,
+            timeout=TIMEOUTS.timeout("ublox_api", url),
         ) as resp:
             # Return RawData
             return UbloxAPI.parse_obj(
@@ -89,7 +349,6 @@ async def _get_raw_data(
             ).raw_data
 
     except ClientResponseError as exc:
-        # Token is expired
         await logger.warning(
             {
                 "method": exc.request_info.method,
@@ -99,14 +358,17 @@ async def _get_raw_data(
                 "error": exc.message,
             }
         )
-        # Get new Token
+        if exc.status != status.HTTP_401_UNAUTHORIZED:
+            raise
+
+        # Token is expired, retry once with the token refreshed in background
         ublox_token = await KEYCLOAK.get_ublox_token()
 
         # Remake the request
         async with session.get(
             f"{url}/{svid}/{timestamp}",
             headers={"Authorization": f"Bearer {ublox_token}"},
-            timeout=6,
+            timeout=TIMEOUTS.timeout("ublox_api", url),
         ) as resp:
             # Return RawData
             return UbloxAPI.parse_obj(
@@ -122,13 +384,238 @@ async def _get_raw_data(
         )
 
 
+class _Batch:
+    """Lookups of a region and uri kind waiting to be dispatched together"""
+
+    def __init__(self, ublox_token: str, session: ClientSession):
+        """
+        :param ublox_token: Token to use with UbloxApi
+        :param session: Aiohttp session of the region
+        """
+        self.ublox_token = ublox_token
+        self.session = session
+        self.futures: Dict[int, Dict[int, Future]] = {}
+        self.size = 0
+        self.timer = None
+
+
+class _Aggregator:
+    """
+    Collect the single lookups made by concurrent requests towards the same region
+    for a few milliseconds, then dispatch them as one list request per satellite
+    and resolve every caller from the combined answer
+    """
+
+    def __init__(self, window: float, max_size: int):
+        """
+        :param window: seconds a lookup waits for the others
+        :param max_size: number of lookups that dispatches the batch immediately
+        """
+        self.window = window
+        self.max_size = max_size
+        self._batches: Dict[Tuple[str, str], _Batch] = {}
+        self.lookups = 0
+        self.requests = 0
+
+    async def lookup(
+        self, key: LookupKey, ublox_token: str, session: ClientSession
+    ) -> Optional[bytes]:
+        """
+        Add a lookup to the batch of its region and wait for the answer
+
+        :param key: (region, uri kind, svid, timestamp)
+        :param ublox_token: Token to use with UbloxApi
+        :param session: Aiohttp session of the region
+        :return: The message
+        """
+        location, kind, svid, timestamp = key
+        batch = self._batches.get((location, kind))
+        if batch is None:
+            batch = self._batches[(location, kind)] = _Batch(ublox_token, session)
+            batch.timer = get_event_loop().call_later(
+                self.window, self._dispatch, location, kind
+            )
+
+        self.lookups += 1
+        satellite = batch.futures.setdefault(svid, {})
+        future = satellite.get(timestamp)
+        if future is None:
+            future = satellite[timestamp] = get_event_loop().create_future()
+            batch.size += 1
+            if batch.size >= self.max_size:
+                batch.timer.cancel()
+                self._dispatch(location, kind)
+
+        return await shield(future)
+
+    def _dispatch(self, location: str, kind: str) -> None:
+        """Close the batch of a region and make a list request for every satellite"""
+        batch = self._batches.pop((location, kind))
+        for svid, futures in batch.futures.items():
+            ensure_future(self._request(location, kind, svid, futures, batch))
+
+    async def _request(
+        self,
+        location: str,
+        kind: str,
+        svid: int,
+        futures: Dict[int, Future],
+        batch: _Batch,
+    ) -> None:
+        """
+        Ask Ublox-Api the timestamps of a satellite and resolve their futures,
+        the timestamps missing in the answer are None
+
+        :param location: Sweden or Italy
+        :param kind: galileo or ublox
+        :param svid: Satellite identifier
+        :param futures: futures of the lookups by timestamp
+        :param batch: batch the lookups belong to
+        """
+        self.requests += 1
+        try:
+            info = await _hedged(
+                location=location,
+                kind=kind,
+                request=lambda region_url, region_session: _get_ublox_api_list(
+                    ublox_token=batch.ublox_token,
+                    url=region_url,
+                    data={
+                        "satellite_id": svid,
+                        "info": [
+                            {"timestamp": timestamp, "raw_data": None}
+                            for timestamp in futures
+                        ],
+                    },
+                    session=region_session,
+                ),
+                session=batch.session,
+                valid=lambda answer: any(
+                    ublox_api.raw_data is not None for ublox_api in answer
+                ),
+            )
+        except Exception as exc:
+            for future in futures.values():
+                if not future.done():
+                    future.set_exception(exc)
+            return
+
+        raw_data = {ublox_api.timestamp: ublox_api.raw_data for ublox_api in info}
+        for timestamp, future in futures.items():
+            if not future.done():
+                future.set_result(raw_data.get(timestamp))
+
+    def stats(self) -> dict:
+        """Counters of the aggregated lookups"""
+        return {
+            "pending": sum(batch.size for batch in self._batches.values()),
+            "lookups": self.lookups,
+            "requests": self.requests,
+            "lookups_per_request": (
+                self.lookups / self.requests if self.requests else 0.0
+            ),
+        }
+
+
+@lru_cache(maxsize=1)
+def _get_aggregator() -> _Aggregator:
+    """Instantiate a singleton _Aggregator"""
+    return _Aggregator(
+        window=SETTINGS.aggregate_window, max_size=SETTINGS.aggregate_max_size
+    )
+
+
+AGGREGATOR = _get_aggregator()
+"""Lookup aggregator Singleton"""
+
+
+def _find_cached(key: LookupKey) -> Tuple[Optional[str], Optional[bytes]]:
+    """
+    Search the raw data in the reference backend, in the lookup cache and in the
+    cache shared by the workers
+
+    :param key: (region, uri kind, svid, timestamp)
+    :return: where the message was found, None if it's missing, and the message
+    """
+    found, raw_data = REFERENCE_BACKEND.lookup(key)
+    if found:
+        return "reference_backend", raw_data
+
+    hit, raw_data = LOOKUP_CACHE.lookup(key)
+    if hit:
+        return "lookup_cache", raw_data
+
+    # Fetched by another worker
+    found, raw_data = SHARED_CACHE.lookup(key)
+    if found:
+        LOOKUP_CACHE.store(key, raw_data)
+        return "shared_cache", raw_data
+
+    return None, None
+
+
+async def _get_cached_raw_data(
+    key: LookupKey,
+    ublox_token: str,
+    session: ClientSession,
+) -> Optional[bytes]:
+    """
+    Search the raw data in the reference backend and in the lookup cache and contact
+    Ublox-Api only in case of miss, joining the identical request already in flight if any.
+
+    :param key: (region, uri kind, svid, timestamp)
+    :param ublox_token: Token to use with UbloxApi
+    :param session: Aiohttp session
+    :return: The message
+    """
+    source, raw_data = _find_cached(key)
+    if source != "reference_backend":
+        PREFETCHER.observe(key[:3])
+    if source == "lookup_cache":
+        PREFETCHER.hit(key)
+    if source is not None:
+        return raw_data
+
+    location, kind, svid, timestamp = key
+
+    async def request() -> Optional[bytes]:
+        if SETTINGS.aggregate_lookups:
+            message = await AGGREGATOR.lookup(key, ublox_token, session)
+            LOOKUP_CACHE.store(key, message)
+            SHARED_CACHE.store(key, message)
+            return message
+
+        message = await _hedged(
+            location=location,
+            kind=kind,
+            request=lambda region_url, region_session: _get_raw_data(
+                svid=svid,
+                timestamp=timestamp,
+                ublox_token=ublox_token,
+                url=region_url,
+                session=region_session,
+            ),
+            session=session,
+            valid=lambda raw_data: raw_data is not None,
+        )
+        LOOKUP_CACHE.store(key, message)
+        SHARED_CACHE.store(key, message)
+        return message
+
+    try:
+        return await SINGLE_FLIGHT.do(key, request)
+    except CircuitOpenError:
+        # Fast-fail, the message will be considered unknown
+        return None
+
+
 async def get_galileo_message(
     svid: int,
     timestamp: int,
     ublox_token: str,
     location: str,
     session: ClientSession,
-) -> Optional[str]:
+) -> Optional[bytes]:
     """
     Extract a Galileo Message from a specific Ublox-Api server situated in Italy or in Sweden
 
@@ -140,18 +627,16 @@ async def get_galileo_message(
     :return: Galileo Message
     """
 
-    return await _get_raw_data(
-        svid=svid,
-        timestamp=timestamp,
+    return await _get_cached_raw_data(
+        key=(location, "galileo", svid, timestamp),
         ublox_token=ublox_token,
-        url=URL_GALILEO[location],
         session=session,
     )
 
 
 async def get_ublox_message(
     svid: int, timestamp: int, ublox_token: str, location: str, session: ClientSession
-) -> Optional[str]:
+) -> Optional[bytes]:
     """
     Extract a Ublox Message from a specific Ublox-Api server situated in Italy or in Sweden
 
@@ -163,11 +648,9 @@ async def get_ublox_message(
     :return: Galileo Message
     """
 
-    return await _get_raw_data(
-        svid=svid,
-        timestamp=timestamp,
+    return await _get_cached_raw_data(
+        key=(location, "ublox", svid, timestamp),
         ublox_token=ublox_token,
-        url=URL_UBLOX[location],
         session=session,
     )
 
@@ -199,7 +682,7 @@ async def _get_ublox_api_list(
             headers={
                 "Authorization": f"Bearer {ublox_token}",
             },
-            timeout=6,
+            timeout=TIMEOUTS.timeout("ublox_api", url),
         ) as resp:
             # Return Info requested
             return UbloxAPIList.parse_obj(
@@ -207,7 +690,6 @@ async def _get_ublox_api_list(
             ).info
 
     except ClientResponseError as exc:
-        # Token is expired
         await logger.warning(
             {
                 "method": exc.request_info.method,
@@ -217,7 +699,10 @@ async def _get_ublox_api_list(
                 "error": exc.message,
             }
         )
-        # Get new Token
+        if exc.status != status.HTTP_401_UNAUTHORIZED:
+            raise
+
+        # Token is expired, retry once with the token refreshed in background
         ublox_token = await KEYCLOAK.get_ublox_token()
 
         # Remake the request
@@ -227,7 +712,7 @@ async def _get_ublox_api_list(
             headers={
                 "Authorization": f"Bearer {ublox_token}",
             },
-            timeout=6,
+            timeout=TIMEOUTS.timeout("ublox_api", url),
         ) as resp:
             # Return Info requested
             return UbloxAPIList.parse_obj(
@@ -243,6 +728,86 @@ async def _get_ublox_api_list(
         )
 
 
+async def _get_window(
+    key: TimelineKey,
+    timestamp: int,
+    ublox_token: str,
+    session: ClientSession,
+) -> UbloxAPIWindow:
+    """
+    Serve the window from the reference backend if it resolves it, otherwise ask Ublox-Api
+    only the timestamps of the window around a timestamp that aren't already stored in
+    the timeline of the satellite, joining the identical request already in flight if any.
+
+    :param key: (region, uri kind, svid)
+    :param timestamp: Requested timestamp
+    :param ublox_token: Token to use with UbloxApi
+    :param session: Aiohttp session
+    :return: window of UbloxApi objects
+    """
+    timestamps = window_timestamps(timestamp)
+    info = REFERENCE_BACKEND.window(key, timestamps)
+    if info is not None:
+        return UbloxAPIWindow(info)
+
+    location, kind, svid = key
+    missing = LOOKUP_CACHE.window_missing(key, timestamps)
+
+    PREFETCHER.observe(key)
+    for cached in set(timestamps).difference(missing):
+        PREFETCHER.hit((*key, cached))
+
+    if missing:
+
+        async def request() -> None:
+            info = await _hedged(
+                location=location,
+                kind=kind,
+                request=lambda region_url, region_session: _get_ublox_api_list(
+                    ublox_token=ublox_token,
+                    url=region_url,
+                    data={
+                        "satellite_id": svid,
+                        "info": [
+                            {"timestamp": time, "raw_data": None} for time in missing
+                        ],
+                    },
+                    session=region_session,
+                ),
+                session=session,
+                valid=lambda answer: any(
+                    ublox_api.raw_data is not None for ublox_api in answer
+                ),
+            )
+            LOOKUP_CACHE.window_store(key, missing, info)
+
+        try:
+            await SINGLE_FLIGHT.do((*key, tuple(missing)), request)
+        except CircuitOpenError:
+            # Fast-fail, only the messages already stored are available
+            pass
+
+    return UbloxAPIWindow(LOOKUP_CACHE.window(key, timestamps))
+
+
+def window_timestamps(timestamp: int) -> List[int]:
+    """
+    Timestamps of the window around a timestamp, the timestamp itself excluded
+
+    :param timestamp: Timestamp associated to the measure
+    :return: timestamps of the window
+    """
+    return [
+        time
+        for time in range(
+            timestamp - SETTINGS.window,
+            timestamp + SETTINGS.window + 1,
+            SETTINGS.window_step,
+        )
+        if time != timestamp
+    ]
+
+
 def construct_request(
     svid: int,
     timestamp: int,
@@ -258,12 +823,7 @@ def construct_request(
         "satellite_id": svid,
         "info": [
             {"timestamp": time, "raw_data": None}
-            for time in range(
-                timestamp - SETTINGS.window,
-                timestamp + SETTINGS.window + 1,
-                SETTINGS.window_step,
-            )
-            if time != timestamp
+            for time in window_timestamps(timestamp)
         ],
     }
 
@@ -274,7 +834,7 @@ async def get_galileo_messages_list(
     ublox_token: str,
     location: str,
     session: ClientSession,
-) -> List[UbloxAPI]:
+) -> UbloxAPIWindow:
     """
     Extract a list of  Galileo Messages in a range of timestamps from a specific Ublox-Api
     server situated in Italy or in Sweden
@@ -287,17 +847,17 @@ async def get_galileo_messages_list(
     :return: A list of Galileo Messages
     """
 
-    return await _get_ublox_api_list(
+    return await _get_window(
+        key=(location, "galileo", svid),
+        timestamp=timestamp,
         ublox_token=ublox_token,
-        url=URL_GALILEO[location],
-        data=construct_request(svid, timestamp),
         session=session,
     )
 
 
 async def get_ublox_messages_list(
     svid: int, timestamp: int, ublox_token: str, location: str, session: ClientSession
-) -> List[UbloxAPI]:
+) -> UbloxAPIWindow:
     """
     Extract a list of  Ublox Messages in a range of timestamps from a specific Ublox-Api
     server situated in Italy or in Sweden
@@ -310,9 +870,186 @@ async def get_ublox_messages_list(
     :return: A list of Ublox Messages
     """
 
-    return await _get_ublox_api_list(
+    return await _get_window(
+        key=(location, "ublox", svid),
+        timestamp=timestamp,
         ublox_token=ublox_token,
+        session=session,
+    )
+
+
+# ---------------------------------------------------------------------------------------
+
+
+async def _prefetch_messages(
+    kind: str,
+    svid: int,
+    timestamps: Iterable[int],
+    ublox_token: str,
+    location: str,
+    url: str,
+    session: ClientSession,
+) -> None:
+    """
+    Fetch with as few list requests as possible the messages of a satellite
+    that aren't already stored or in flight and store them in the lookup cache
+    and in the cache shared by the workers. Identical batches share one request.
+
+    :param kind: galileo or ublox
+    :param svid: Satellite identifier
+    :param timestamps: Requested timestamps
+    :param ublox_token: Token to use with UbloxApi
+    :param location: Could be Italy or Sweden
+    :param url: Url of Ublox-Api server, it could be in Italy or Sweden
+    :param session: Aiohttp session
+    """
+    missing = sorted(
+        {
+            timestamp
+            for timestamp in timestamps
+            if (location, kind, svid, timestamp) not in SINGLE_FLIGHT.requests
+            and _find_cached((location, kind, svid, timestamp))[0] is None
+        }
+    )
+
+    async def request(requested: List[int]) -> None:
+        info = await _contact(
+            url,
+            lambda: _get_ublox_api_list(
+                ublox_token=ublox_token,
+                url=url,
+                data={
+                    "satellite_id": svid,
+                    "info": [
+                        {"timestamp": timestamp, "raw_data": None}
+                        for timestamp in requested
+                    ],
+                },
+                session=session,
+            ),
+        )
+
+        # Store only the answers to what was asked, the others will be
+        # requested one by one
+        requested = set(requested)
+        for ublox_api in info:
+            if ublox_api.timestamp in requested:
+                key = (location, kind, svid, ublox_api.timestamp)
+                LOOKUP_CACHE.store(key, ublox_api.raw_data)
+                SHARED_CACHE.store(key, ublox_api.raw_data)
+
+    for start in range(0, len(missing), SETTINGS.batch_lookup_size):
+        requested = missing[start : start + SETTINGS.batch_lookup_size]
+        await SINGLE_FLIGHT.do(
+            ("batch", location, kind, svid, tuple(requested)),
+            partial(request, requested),
+        )
+
+
+async def prefetch_galileo_messages(
+    svid: int,
+    timestamps: Iterable[int],
+    ublox_token: str,
+    location: str,
+    session: ClientSession,
+) -> None:
+    """
+    Fetch in batch the Galileo Messages of a satellite from a specific Ublox-Api
+    server situated in Italy or in Sweden, so that get_galileo_message finds them cached
+
+    :param svid: Satellite identifier
+    :param timestamps: Requested timestamps
+    :param ublox_token: Token to use with UbloxApi
+    :param location: Could be Italy or Sweden
+    :param session: Aiohttp session
+    """
+
+    await _prefetch_messages(
+        kind="galileo",
+        svid=svid,
+        timestamps=timestamps,
+        ublox_token=ublox_token,
+        location=location,
+        url=URL_GALILEO[location],
+        session=session,
+    )
+
+
+async def prefetch_ublox_messages(
+    svid: int,
+    timestamps: Iterable[int],
+    ublox_token: str,
+    location: str,
+    session: ClientSession,
+) -> None:
+    """
+    Fetch in batch the Ublox Messages of a satellite from a specific Ublox-Api
+    server situated in Italy or in Sweden, so that get_ublox_message finds them cached
+
+    :param svid: Satellite identifier
+    :param timestamps: Requested timestamps
+    :param ublox_token: Token to use with UbloxApi
+    :param location: Could be Italy or Sweden
+    :param session: Aiohttp session
+    """
+
+    await _prefetch_messages(
+        kind="ublox",
+        svid=svid,
+        timestamps=timestamps,
+        ublox_token=ublox_token,
+        location=location,
         url=URL_UBLOX[location],
-        data=construct_request(svid, timestamp),
         session=session,
     )
+
+
+# ---------------------------------------------------------------------------------------
+
+
+async def refresh_prefetched_messages() -> int:
+    """
+    Fetch through the list endpoint the recent messages of the visible satellites
+    that the prefetcher is missing. Failed satellites are retried at the next refresh
+
+    :return: number of requests made to Ublox-Api
+    """
+    # Get Logger
+    logger = get_logger()
+
+    ublox_token = await KEYCLOAK.get_ublox_token()
+    requests = 0
+
+    for (location, kind, svid), timestamps in PREFETCHER.due():
+        url = URLS[kind][location]
+        requested = timestamps[-SETTINGS.batch_lookup_size :]
+        try:
+            requests += 1
+            info = await _contact(
+                url,
+                lambda: _get_ublox_api_list(
+                    ublox_token=ublox_token,
+                    url=url,
+                    data={
+                        "satellite_id": svid,
+                        "info": [
+                            {"timestamp": timestamp, "raw_data": None}
+                            for timestamp in requested
+                        ],
+                    },
+                    session=UBLOX_API_SESSIONS.get(location),
+                ),
+            )
+        except (HTTPException, ClientError, CircuitOpenError) as exc:
+            await logger.warning(
+                {
+                    "location": location,
+                    "satellite_id": svid,
+                    "error": f"Prefetch failed: {exc!r}",
+                }
+            )
+            continue
+
+        PREFETCHER.store((location, kind, svid), requested, info)
+
+    return requests
@@ -23,26 +23,347 @@ UserFeed utilities package
 """
 
 # Standard Library
-from asyncio import Semaphore
+from array import array
+from asyncio import Semaphore, Task, ensure_future, gather
+from collections import defaultdict
+from functools import partial
 import sys
 import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
 
 # Third Party
+from aiohttp import ClientError
 from fastapi import HTTPException
 
 # Internal
-from .accounting_manager import store_in_iota
+from .accounting_manager import store_error_in_iota, store_in_iota
 from .anonymizer import store_in_the_anonengine
+from .circuit_breaker import CircuitOpenError
 from .ipt_anonymizer import store_in_the_anonymizer, SETTINGS
 from .keycloak import KEYCLOAK
 from .logger import get_logger
-from .position_alteration_detection import haversine
-from .sessions.ublox_api import get_ublox_api_session
-from .ublox_api import get_galileo_message, get_galileo_messages_list
-from ..concurrency.position_authentication import position_auth
+from .position_alteration_detection import haversine, meaconing
+from .sampling import estimate_authenticity, stratified_sample
+from .sessions.ublox_api import UBLOX_API_SESSIONS
+from .ublox_api import (
+    get_galileo_message,
+    get_galileo_messages_list,
+    prefetch_galileo_messages,
+)
+from ..concurrency.position_authentication import (
+    AdaptiveLimiter,
+    position_auth,
+    store_semaphore,
+)
 from ..config import get_ublox_api_settings
+from ..models.galileo.galileo_auth import GalileoAuth
 from ..models.security import Authenticity
-from ..models.user_feed.user import UserFeedInput, UserFeedOutput, PositionObject
+from ..models.user_feed.position import PositionObjectInput
+from ..models.user_feed.user import (
+    PositionObject,
+    UserFeed,
+    UserFeedInput,
+    UserFeedOutput,
+)
+
+# --------------------------------------------------------------------------------------------
+
+AuthKey = Tuple[str, int, int, bytes]
+"""(location, svid, time, data)"""
+
+
+def detect_meaconing(
+    trace_information: List[PositionObjectInput],
+    meaconing_threshold: int,
+    reference: Optional[array] = None,
+) -> List[bool]:
+    """
+    Check the continuity of fullbiasnano and timenano along the trace
+    and find the positions altered by meaconing
+
+    :param trace_information: positions of the trace
+    :param meaconing_threshold: max drift allowed between fullbiasnano and timenano
+    :param reference: fullbiasnano and timenano of reference carried between
+        the chunks of a trace, updated in place
+    :return: True for every meaconed position
+    """
+    auth = bytearray(len(trace_information))
+    fullbiasnano = array("q", bytes(8 * len(trace_information)))
+    timenano = array("q", bytes(8 * len(trace_information)))
+
+    # Columns of the first GalileoAuth of every position
+    for index, position in enumerate(trace_information):
+        if len(position.galileo_auth) > 0:
+            auth[index] = 1
+            fullbiasnano[index] = position.galileo_auth[0].fullbiasnano
+            timenano[index] = position.galileo_auth[0].timenano
+
+    return meaconing(auth, fullbiasnano, timenano, meaconing_threshold, reference)
+
+
+def locate_positions(
+    trace_information: List[PositionObjectInput], meaconing_verdicts: List[bool]
+) -> Tuple[List[Tuple[PositionObjectInput, str]], List[int]]:
+    """
+    Mark the meaconed positions as not authentic and find the location
+    of the positions to verify
+
+    :param trace_information: positions of the trace
+    :param meaconing_verdicts: meaconing verdict of every position
+    :return: positions to verify with their location (Sweden or Italy),
+        and their index in the trace
+    """
+    positions = []
+    trace_indexes = []
+    for index, (position, meaconed) in enumerate(
+        zip(trace_information, meaconing_verdicts)
+    ):
+        if meaconed:
+            position.authenticity = Authenticity.not_authentic
+        elif len(position.galileo_auth) > 0:
+            positions.append((position, haversine(position.lat, position.lon)))
+            trace_indexes.append(index)
+
+    return positions, trace_indexes
+
+
+def plan_trace_lookups(
+    positions: List[Tuple[PositionObjectInput, str]]
+) -> Dict[Tuple[str, int], Set[int]]:
+    """
+    Group every (svid, time) pair of the positions by region and satellite
+
+    :param positions: positions to verify and their location
+    :return: timestamps to look up for every (location, svid)
+    """
+    plan = defaultdict(set)
+
+    for position, location in positions:
+        for auth in position.galileo_auth:
+            if len(auth.data) != 30:
+                break
+            plan[(location, auth.svid)].add(auth.time)
+
+    return plan
+
+
+async def batch_lookup(plan: Dict[Tuple[str, int], Set[int]], ublox_token: str) -> None:
+    """
+    Fetch every group of the plan through the Ublox-Api list endpoint so that
+    the verdicts can be computed locally. Failed groups will be looked up one by one
+
+    :param plan: timestamps to look up for every (location, svid)
+    :param ublox_token: Token to use with UbloxApi
+    """
+    # Get Logger
+    logger = get_logger()
+
+    for (location, svid), timestamps in plan.items():
+        try:
+            await prefetch_galileo_messages(
+                svid,
+                timestamps,
+                ublox_token,
+                location,
+                UBLOX_API_SESSIONS.get(location),
+            )
+        except (HTTPException, ClientError, CircuitOpenError) as exc:
+            await logger.warning(
+                {
+                    "location": location,
+                    "satellite_id": svid,
+                    "error": f"Batch lookup failed: {exc!r}",
+                }
+            )
+
+
+async def _lookup_auth(
+    auth: GalileoAuth, location: str, ublox_token: str, semaphore: Semaphore
+) -> Tuple[Any, Any]:
+    """
+    Contact Ublox-Api for a single GalileoAuth. The errors are returned instead of
+    being raised, so that they can be handled following the order of the trace
+
+    :param auth: GalileoAuth to verify
+    :param location: Sweden or Italy
+    :param ublox_token: Token to use with UbloxApi
+    :param semaphore: limit of concurrent lookups of the journey
+    :return: galileo message and, in case of mismatch, the window of galileo messages
+    """
+    # Borrow the session of the region
+    session = UBLOX_API_SESSIONS.get(location)
+
+    async with semaphore:
+        try:
+            galileo_data = await get_galileo_message(
+                auth.svid, auth.time, ublox_token, location, session
+            )
+        except HTTPException as exc:
+            return exc, None
+
+        if galileo_data is None or galileo_data == auth.data:
+            return galileo_data, None
+
+        try:
+            # Remake the request
+            return galileo_data, await get_galileo_messages_list(
+                auth.svid, auth.time, ublox_token, location, session
+            )
+        except HTTPException as exc:
+            return galileo_data, exc
+
+
+async def lookup_trace(
+    positions: List[Tuple[PositionObjectInput, str]],
+    ublox_token: str,
+    concurrency: int,
+) -> Tuple[Dict[AuthKey, Tuple[Any, Any]], int]:
+    """
+    Contact Ublox-Api for the GalileoAuth of the positions, once for every unique
+    lookup key. The positions are looked up concurrently, the GalileoAuth of a position
+    in order, stopping where its verdict stops, so that no answer is thrown away
+
+    :param positions: positions to verify and their location
+    :param ublox_token: Token to use with UbloxApi
+    :param concurrency: max number of concurrent lookups
+    :return: the answers of _lookup_auth for every lookup key,
+        and the number of GalileoAuth referencing them
+    """
+    semaphore = Semaphore(concurrency)
+    lookups: Dict[AuthKey, Task] = {}
+
+    async def walk(position: PositionObjectInput, location: str) -> int:
+        references = 0
+        for auth in position.galileo_auth:
+            if len(auth.data) != 30:
+                break
+            references += 1
+
+            key = (location, auth.svid, auth.time, auth.data)
+            if key not in lookups:
+                lookups[key] = ensure_future(
+                    _lookup_auth(auth, location, ublox_token, semaphore)
+                )
+            galileo_data, _ = await lookups[key]
+            if galileo_data is None or isinstance(galileo_data, HTTPException):
+                break
+        return references
+
+    walks = [
+        ensure_future(walk(position, location)) for position, location in positions
+    ]
+    try:
+        references = sum(await gather(*walks))
+    except BaseException:
+        # Don't leave the other lookups running unobserved
+        for task in (*walks, *lookups.values()):
+            task.cancel()
+        await gather(*walks, *lookups.values(), return_exceptions=True)
+        raise
+
+    return {key: task.result() for key, task in lookups.items()}, references
+
+
+async def authenticate_positions(
+    positions: List[Tuple[PositionObjectInput, str]],
+    on_error: Optional[Callable[[HTTPException], Awaitable[None]]] = None,
+) -> Dict[str, int]:
+    """
+    Contact Ublox-Api for the GalileoAuth of the positions and compute their verdicts
+
+    :param positions: positions to verify and their location
+    :param on_error: coroutine handling the errors of Ublox-Api, if None they are raised
+    :return: number of GalileoAuth verified, authentic, not authentic and unknown,
+        number of unique lookups and of GalileoAuth referencing them
+    """
+    # Get Logger
+    logger = get_logger()
+
+    # Get Ublox-Api settings
+    ublox_api_settings = get_ublox_api_settings()
+
+    counters = {"galileo_auth": 0, "authentic": 0, "not_authentic": 0, "unknown": 0}
+
+    # Get Ublox-APi token
+    ublox_token = await KEYCLOAK.get_ublox_token()
+
+    # Long traces are fetched in batch before the analysis
+    plan = plan_trace_lookups(positions)
+    if (
+        sum(len(timestamps) for timestamps in plan.values())
+        >= ublox_api_settings.batch_lookup_threshold
+    ):
+        await batch_lookup(plan, ublox_token)
+
+    # Contact Ublox-Api concurrently under the limit of the journey
+    lookups, references = await lookup_trace(
+        positions, ublox_token, ublox_api_settings.journey_concurrency
+    )
+
+    # Compute the verdicts following the order of the trace
+    for position, location in positions:
+        for auth in position.galileo_auth:
+            if len(auth.data) != 30:
+                position.authenticity = Authenticity.not_authentic
+                break
+            counters["galileo_auth"] += 1
+            galileo_data, galileo_data_list = lookups[
+                (location, auth.svid, auth.time, auth.data)
+            ]
+
+            if isinstance(galileo_data, HTTPException):
+                if on_error is None:
+                    raise galileo_data
+                await on_error(galileo_data)
+                galileo_data = None
+
+            if galileo_data is None:
+                position.authenticity = Authenticity.unknown
+                counters["unknown"] += 1
+                break
+
+            elif galileo_data == auth.data:
+                position.authenticity = Authenticity.authentic
+                counters["authentic"] += 1
+
+            else:
+                position.authenticity = Authenticity.not_authentic
+                counters["not_authentic"] += 1
+
+                if isinstance(galileo_data_list, HTTPException):
+                    if on_error is None:
+                        raise galileo_data_list
+                    await on_error(galileo_data_list)
+                    continue
+
+                if auth.data in galileo_data_list.payloads:
+                    position.authenticity = Authenticity.authentic
+                    counters["authentic"] += 1
+                    counters["not_authentic"] -= 1
+                if position.authenticity == Authenticity.not_authentic:
+                    await logger.debug(
+                        {
+                            "message_timestamp": auth.time,
+                            "android_message": auth.data.hex(),
+                            "satellite_id": auth.svid,
+                            "status": "Real Fake",
+                            "ublox_api_messages": [
+                                ublox_api.hex_dict() for ublox_api in galileo_data_list
+                            ],
+                        }
+                    )
+
+    counters.update({"lookups": len(lookups), "references": references})
+    return counters
+
+
+def dedup_ratio(counters: Dict[str, int]) -> float:
+    """
+    :param counters: counters of authenticate_positions
+    :return: number of GalileoAuth referencing every unique lookup
+    """
+    return counters["references"] / counters["lookups"] if counters["lookups"] else 1.0
+
 
 # --------------------------------------------------------------------------------------------
 
@@ -76,165 +397,97 @@ async def end_to_end_position_authentication(
     # start analysis time
     start_analysis = time.time()
 
-    # Initialize
-    galileo_auth_number = 0
-    authentic_number = 0
-    not_authentic_number = 0
-    unknown_number = 0
+    # Get Ublox-Api settings
+    ublox_api_settings = get_ublox_api_settings()
 
-    # Meaconing variables
-    meaconing_threshold = get_ublox_api_settings().meaconing_threshold
-    fullbiasnano = None
-    timenano = None
+    # First phase: the meaconed positions are not authentic and never cost a lookup
+    meaconing_verdicts = detect_meaconing(
+        user_feed.trace_information, ublox_api_settings.meaconing_threshold
+    )
+    positions, trace_indexes = locate_positions(
+        user_feed.trace_information, meaconing_verdicts
+    )
 
-    # Get Ublox-APi token
-    ublox_token = await KEYCLOAK.get_ublox_token()
+    # Very long journeys of the sampled apps verify only a stratified sample
+    strata = None
+    unsampled_number = None
+    if (
+        source_app in ublox_api_settings.sampled_source_apps
+        and len(positions) > ublox_api_settings.sample_threshold
+    ):
+        sample = stratified_sample(
+            trace_indexes,
+            meaconing_verdicts,
+            ublox_api_settings.sample_size,
+            ublox_api_settings.sample_strata,
+            ublox_api_settings.sample_suspicion_factor,
+        )
+        strata = [
+            (size, [positions[index][0] for index in sampled])
+            for size, sampled in sample
+        ]
+        # The positions not sampled stay unknown
+        for position, _ in positions:
+            position.authenticity = Authenticity.unknown
+        sampled_positions = [
+            positions[index] for _, sampled in sample for index in sampled
+        ]
+        unsampled_number = len(positions) - len(sampled_positions)
+        positions = sampled_positions
+
+    # Second phase: contact Ublox-Api and compute the verdicts
+    counters = await authenticate_positions(
+        positions,
+        partial(
+            store_error_in_iota,
+            source_app=source_app,
+            client_id=client_id,
+            user_id=user_id,
+            msg_id=journey_id,
+            msg_time=timestamp,
+        )
+        if store
+        else None,
+    )
 
-    # Get Ublox-APi session
-    async with get_ublox_api_session() as session:
-
-        # Contact Ublox-Api for every position
-        for position in user_feed.trace_information:
-
-            # Set temporally the position as unknown
-            position_unknown = True
-
-            # Check if this position has auth data
-            if len(position.galileo_auth) == 0:
-                # Unset fullbiasnano
-                fullbiasnano = None
-                timenano = None
-
-            # Check if fullbiasnano and timenano are already set
-            elif fullbiasnano and timenano:
-                # extract current fullbiasnano and timenano
-                current_fullbiasnano = position.galileo_auth[0].fullbiasnano
-                current_timenano = position.galileo_auth[0].timenano
-                # check if the data aren't coherent
-                check_timenano = current_timenano - timenano
-                if check_timenano == 0:
-                    # Set the position not authentic
-                    position.authenticity = Authenticity.not_authentic
-                    position_unknown = False
-
-                elif (
-                    current_fullbiasnano - fullbiasnano
-                ) / check_timenano > meaconing_threshold:
-                    # Set the position not authentic
-                    position.authenticity = Authenticity.not_authentic
-                    position_unknown = False
+    # Extrapolate the verdict of the journey from the sample
+    authentic_ratio = None
+    if strata is not None:
+        authentic_ratio = estimate_authenticity(
+            [
+                (
+                    size,
+                    sum(
+                        position.authenticity == Authenticity.authentic
+                        for position in sampled
+                    ),
+                    sum(
+                        position.authenticity == Authenticity.not_authentic
+                        for position in sampled
+                    ),
+                )
+                for size, sampled in strata
+            ],
+            ublox_api_settings.sample_z,
+        )
 
-            else:
-                # Set fullbiasnano and timenano
-                fullbiasnano = position.galileo_auth[0].fullbiasnano
-                timenano = position.galileo_auth[0].timenano
-
-            if position_unknown:
-                # Find the location of the position (Sweden or Italy)
-                location = haversine(position.lat, position.lon)
-
-                for auth in position.galileo_auth:
-                    if len(auth.data) != 60:
-                        position.authenticity = Authenticity.not_authentic
-                        break
-                    galileo_auth_number += 1
-                    try:
-                        galileo_data = await get_galileo_message(
-                            auth.svid, auth.time, ublox_token, location, session
-                        )
-                    except HTTPException as exc:
-                        if store:
-                            await store_in_iota(
-                                source_app=f"{source_app}_error",
-                                client_id=client_id,
-                                user_id=user_id,
-                                msg_id=journey_id,
-                                msg_size=0,
-                                msg_time=timestamp,
-                                msg_malicious_position=0,
-                                msg_authenticated_position=0,
-                                msg_unknown_position=0,
-                                msg_total_position=0,
-                                msg_error=True,
-                                msg_error_description=exc.detail,
-                            )
-                            galileo_data = None
-                        else:
-                            raise exc
-
-                    if galileo_data is None:
-                        position.authenticity = Authenticity.unknown
-                        unknown_number += 1
-                        break
-
-                    elif galileo_data == auth.data:
-                        position.authenticity = Authenticity.authentic
-                        authentic_number += 1
-
-                    else:
-                        position.authenticity = Authenticity.not_authentic
-                        not_authentic_number += 1
-                        analyze = True
-
-                        try:
-                            # Remake the request
-                            galileo_data_list = await get_galileo_messages_list(
-                                auth.svid, auth.time, ublox_token, location, session
-                            )
-                        except HTTPException as exc:
-                            if store:
-                                await store_in_iota(
-                                    source_app=f"{source_app}_error",
-                                    client_id=client_id,
-                                    user_id=user_id,
-                                    msg_id=journey_id,
-                                    msg_size=0,
-                                    msg_time=timestamp,
-                                    msg_malicious_position=0,
-                                    msg_authenticated_position=0,
-                                    msg_unknown_position=0,
-                                    msg_total_position=0,
-                                    msg_error=True,
-                                    msg_error_description=exc.detail,
-                                )
-                                position.authenticity = Authenticity.not_authentic
-                                analyze = False
-                            else:
-                                raise exc
-
-                        if analyze:
-                            for data in galileo_data_list:
-                                if data.raw_data == auth.data:
-                                    position.authenticity = Authenticity.authentic
-                                    authentic_number += 1
-                                    not_authentic_number -= 1
-                                    break
-                            if position.authenticity == Authenticity.not_authentic:
-                                await logger.debug(
-                                    {
-                                        "message_timestamp": auth.time,
-                                        "android_message": auth.data,
-                                        "satellite_id": auth.svid,
-                                        "status": "Real Fake",
-                                        "ublox_api_messages": [
-                                            ublox_api.dict()
-                                            for ublox_api in galileo_data_list
-                                        ],
-                                    }
-                                )
-    await logger.info(
-        {
-            "host": host,
-            "source_app": source_app,
-            "journey_id": journey_id,
-            "galileo_auth": galileo_auth_number,
-            "authentic": authentic_number,
-            "not_authentic": not_authentic_number,
-            "unknown": unknown_number,
-            "analysis_time": f"{time.time() - start_analysis}",
-            "request_procession_time": f"{time.time() - timestamp}",
-        }
-    )
+    analysis = {
+        "host": host,
+        "source_app": source_app,
+        "journey_id": journey_id,
+        "galileo_auth": counters["galileo_auth"],
+        "authentic": counters["authentic"],
+        "not_authentic": counters["not_authentic"],
+        "unknown": counters["unknown"],
+        "analysis_time": f"{time.time() - start_analysis}",
+        "dedup_ratio": f"{dedup_ratio(counters)}",
+        "request_procession_time": f"{time.time() - timestamp}",
+    }
+    if strata is not None:
+        analysis.update(
+            {"unsampled": unsampled_number, "authentic_ratio": authentic_ratio}
+        )
+    await logger.info(analysis)
 
     if store:
         await store_in_iota(
@@ -244,15 +497,72 @@ async def end_to_end_position_authentication(
             msg_id=journey_id,
             msg_size=sys.getsizeof(user_feed.json()),
             msg_time=timestamp,
-            msg_malicious_position=not_authentic_number,
-            msg_authenticated_position=authentic_number,
-            msg_unknown_position=unknown_number,
-            msg_total_position=galileo_auth_number,
+            msg_malicious_position=counters["not_authentic"],
+            msg_authenticated_position=counters["authentic"],
+            msg_unknown_position=counters["unknown"],
+            msg_total_position=counters["galileo_auth"],
+            msg_unsampled_position=unsampled_number,
+            msg_authentic_ratio=authentic_ratio,
         )
 
     return user_feed
 
 
+async def forward_user_feed(
+    user_feed: UserFeed, journey_id: str, source_app: str
+) -> None:
+    """
+    Store the validated UserFeed in the IPT-Anonymizer and in the anonengine
+
+    :param user_feed: data validated
+    :param journey_id: uuid4 associated to the request
+    :param source_app: app that made the request
+    """
+    # Generate user feed internal
+    user_feed_internal = user_feed.dict(
+        exclude={"trace_information": {"__all__": {"galileo_auth"}}}
+    )
+    user_feed_internal.update({"source_app": source_app, "journey_id": journey_id})
+
+    # Store in the IPT-Anonymizer
+    await store_in_the_anonymizer(user_feed_internal, SETTINGS.store_user_data_url)
+
+    # Store in the anonengine
+    await store_in_the_anonengine(
+        UserFeedOutput.construct(
+            **{
+                "app_defined_behaviour": user_feed.behaviour.app_defined,
+                "tpv_defined_behaviour": user_feed.behaviour.tpv_defined,
+                "user_defined_behaviour": user_feed.behaviour.user_defined,
+                "company_code": user_feed.company_code,
+                "company_trip_type": user_feed.company_trip_type,
+                "deviceId": user_feed.id,
+                "journeyId": journey_id,
+                "startDate": user_feed.startDate,
+                "endDate": user_feed.endDate,
+                "distance": user_feed.distance,
+                "elapsedTime": user_feed.elapsedTime,
+                "positions": [
+                    PositionObject.construct(
+                        **{
+                            "authenticity": position.authenticity,
+                            "lat": position.lat,
+                            "lon": position.lon,
+                            "partialDistance": position.partialDistance,
+                            "time": position.time,
+                        }
+                    )
+                    for position in user_feed.trace_information
+                ],
+                "sensors": user_feed.sensors_information,
+                "mainTypeSpace": user_feed.mainTypeSpace,
+                "mainTypeTime": user_feed.mainTypeTime,
+                "sourceApp": source_app,
+            }
+        ).dict()
+    )
+
+
 async def store_android_data(
     user_feed_input: UserFeedInput,
     timestamp: float,
@@ -261,7 +571,7 @@ async def store_android_data(
     source_app: str,
     client_id: str,
     user_id: str,
-    semaphore: Semaphore,
+    semaphore: AdaptiveLimiter,
 ) -> None:
     """
     Store UserFeed data in the anonymizer in a correct format
@@ -275,65 +585,63 @@ async def store_android_data(
     :param semaphore: synchronize the requests and prevent starvation
     """
     try:
-        async with semaphore:
-            async with position_auth():
-                user_feed = await end_to_end_position_authentication(
-                    user_feed=user_feed_input,
-                    timestamp=timestamp,
-                    host=host,
-                    journey_id=journey_id,
-                    source_app=source_app,
-                    client_id=client_id,
-                    user_id=user_id,
-                    store=True,
-                )
+        await _store_android_data(
+            user_feed_input=user_feed_input,
+            timestamp=timestamp,
+            host=host,
+            journey_id=journey_id,
+            source_app=source_app,
+            client_id=client_id,
+            user_id=user_id,
+            semaphore=semaphore,
+        )
+    finally:
+        return
 
-            # Generate user feed internal
-            user_feed_internal = user_feed.dict(
-                exclude={"trace_information": {"__all__": {"galileo_auth"}}}
-            )
-            user_feed_internal.update(
-                {"source_app": source_app, "journey_id": journey_id}
-            )
 
-            # Store in the IPT-Anonymizer
-            await store_in_the_anonymizer(
-                user_feed_internal, SETTINGS.store_user_data_url
+async def _store_android_data(
+    user_feed_input: UserFeedInput,
+    timestamp: float,
+    host: str,
+    journey_id: str,
+    source_app: str,
+    client_id: str,
+    user_id: str,
+    semaphore: AdaptiveLimiter,
+) -> None:
+    """
+    Same as store_android_data, but the errors are raised so that the caller can retry
+    """
+    positions = len(user_feed_input.trace_information)
+    async with semaphore:
+        semaphore.weigh(positions)
+        async with position_auth():
+            position_auth().weigh(positions)
+            user_feed = await end_to_end_position_authentication(
+                user_feed=user_feed_input,
+                timestamp=timestamp,
+                host=host,
+                journey_id=journey_id,
+                source_app=source_app,
+                client_id=client_id,
+                user_id=user_id,
+                store=True,
             )
 
-            # Store in the anonengine
-            await store_in_the_anonengine(
-                UserFeedOutput.construct(
-                    **{
-                        "app_defined_behaviour": user_feed.behaviour.app_defined,
-                        "tpv_defined_behaviour": user_feed.behaviour.tpv_defined,
-                        "user_defined_behaviour": user_feed.behaviour.user_defined,
-                        "company_code": user_feed.company_code,
-                        "company_trip_type": user_feed.company_trip_type,
-                        "deviceId": user_feed.id,
-                        "journeyId": journey_id,
-                        "startDate": user_feed.startDate,
-                        "endDate": user_feed.endDate,
-                        "distance": user_feed.distance,
-                        "elapsedTime": user_feed.elapsedTime,
-                        "positions": [
-                            PositionObject.construct(
-                                **{
-                                    "authenticity": position.authenticity,
-                                    "lat": position.lat,
-                                    "lon": position.lon,
-                                    "partialDistance": position.partialDistance,
-                                    "time": position.time,
-                                }
-                            )
-                            for position in user_feed.trace_information
-                        ],
-                        "sensors": user_feed.sensors_information,
-                        "mainTypeSpace": user_feed.mainTypeSpace,
-                        "mainTypeTime": user_feed.mainTypeTime,
-                        "sourceApp": source_app,
-                    }
-                ).dict()
-            )
-    finally:
-        return
+        await forward_user_feed(user_feed, journey_id, source_app)
+
+
+async def store_queued_android_data(metadata: dict, body: bytes) -> None:
+    """
+    Store in the anonymizer UserFeed data taken from the work queue,
+    raising if it fails so that the item isn't acknowledged
+
+    :param metadata: timestamp, host, journey_id, source_app, client_id
+        and user_id of the request
+    :param body: body of the request
+    """
+    await _store_android_data(
+        user_feed_input=UserFeedInput.parse_raw(body),
+        semaphore=store_semaphore(),
+        **metadata,
+    )
@@ -29,9 +29,19 @@ from fastapi.openapi.docs import get_redoc_html
 from fastapi.staticfiles import StaticFiles
 
 # Internal
+from .concurrency.validation import VALIDATOR
+from .concurrency.work_queue import WORK_QUEUE
+from .config import get_concurrency_settings, get_ublox_api_settings
 from .internals.logger import get_logger
+from .internals.iot import store_queued_iot_data
+from .internals.journey_session import JOURNEY_SESSIONS
 from .internals.keycloak import KEYCLOAK
-from .routers import user_feed, journey, iot, administrator, statistics
+from .internals.prefetcher import PREFETCHER
+from .internals.reference_store import REFERENCE_BACKEND
+from .internals.sessions.ublox_api import UBLOX_API_SESSIONS
+from .internals.ublox_api import refresh_prefetched_messages
+from .internals.user_feed import store_queued_android_data
+from .routers import user_feed, journey, iot, administrator, statistics, metrics
 
 # --------------------------------------------------------------------------------------------
 
@@ -47,6 +57,7 @@ app.include_router(journey.router)
 app.include_router(iot.router)
 app.include_router(administrator.router)
 app.include_router(statistics.router)
+app.include_router(metrics.router)
 
 
 # Configure logger
@@ -54,13 +65,27 @@ app.include_router(statistics.router)
 async def startup_logger_and_sessions():
     get_logger()
     await KEYCLOAK.setup()
+    await UBLOX_API_SESSIONS.setup()
+    VALIDATOR.start()
+    if get_ublox_api_settings().prefetch:
+        PREFETCHER.start(refresh_prefetched_messages)
+    if get_concurrency_settings().work_queue:
+        WORK_QUEUE.start(
+            {"android": store_queued_android_data, "iot": store_queued_iot_data}
+        )
 
 
 # Shutdown logger
 @app.on_event("shutdown")
 async def shutdown_logger_and_sessions():
     logger = get_logger()
+    await PREFETCHER.stop()
+    await WORK_QUEUE.stop()
+    await JOURNEY_SESSIONS.stop()
+    VALIDATOR.close()
     await KEYCLOAK.close()
+    await UBLOX_API_SESSIONS.close()
+    REFERENCE_BACKEND.close()
     await logger.shutdown()
 
 
@@ -24,6 +24,7 @@ Accounting Manager model
 
 # Standard Library
 from datetime import datetime
+from typing import Optional
 
 # Internal
 from .model import OrjsonModel
@@ -43,6 +44,11 @@ class Obj(OrjsonModel):
     msg_total_position: int
     msg_error: bool
     msg_error_description: str
+    msg_sampled: bool = False
+    msg_unsampled_position: int = 0
+    msg_authentic_ratio: Optional[float] = None
+    msg_authentic_ratio_low: Optional[float] = None
+    msg_authentic_ratio_high: Optional[float] = None
 
 
 class Data(OrjsonModel):
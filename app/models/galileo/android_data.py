@@ -25,8 +25,8 @@ Galileo models
 # --------------------------------------------------------------------------------------------
 
 
-class AndroidData(str):
-    """AndroidData validation"""
+class AndroidData(bytes):
+    """AndroidData validation, the payload is kept as bytes"""
 
     @classmethod
     def __get_validators__(cls):
@@ -35,22 +35,25 @@ class AndroidData(str):
 
     @classmethod
     def validate(cls, v):
-        if isinstance(v, str):
+        if isinstance(v, bytes):
             return cls(v)
 
+        if isinstance(v, str):
+            try:
+                return cls(bytes.fromhex(v))
+            except ValueError as error:
+                raise ValueError(error.args)
+
         if not isinstance(v, list):
             raise TypeError("list of int required")
         try:
             # Convert in bytes
-            m = b"".join(
-                [
-                    int(element).to_bytes(1, byteorder="big", signed=True)
-                    for element in v
-                ]
-            ).hex()
+            m = [int(element) for element in v]
         except ValueError as error:
             raise ValueError(error.args)
-        return cls(m)
+        if any(element < -128 or element > 127 for element in m):
+            raise ValueError("signed byte required")
+        return cls(bytes(element & 0xFF for element in m))
 
 
 # --------------------------------------------------------------------------------------------
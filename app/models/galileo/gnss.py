@@ -62,11 +62,12 @@ class Gnss(List[Ublox]):
             raise TypeError("string required")
         try:
             m = [
-                Ublox.construct(
-                    **{"svid": bytes.fromhex(element)[5], "raw_data": element}
+                Ublox.construct(**{"svid": raw_data[5], "raw_data": raw_data})
+                for raw_data in (
+                    bytes.fromhex(element)
+                    for element in v.lower().split("b562")
+                    if element != ""
                 )
-                for element in v.lower().split("b562")
-                if element != ""
             ]
         except ValueError:
             raise ValueError("Invalid GNSS message")
@@ -31,11 +31,38 @@ from ..model import OrjsonModel
 # --------------------------------------------------------------------------------------------
 
 
+class RawData(bytes):
+    """Raw data of a message, decoded from hex only once"""
+
+    @classmethod
+    def __get_validators__(cls):
+        """Validate the RawData"""
+        yield cls.validate
+
+    @classmethod
+    def validate(cls, v):
+        if isinstance(v, bytes):
+            return v
+        if not isinstance(v, str):
+            raise TypeError("hex string required")
+        try:
+            return bytes.fromhex(v)
+        except ValueError as error:
+            raise ValueError(error.args)
+
+
 class UbloxAPI(OrjsonModel):
     """Model of single data from UbloxApi"""
 
     timestamp: int
-    raw_data: Optional[str]
+    raw_data: Optional[RawData]
+
+    def hex_dict(self) -> dict:
+        """Dict of the message with the raw data in hex, to be logged"""
+        return {
+            "timestamp": self.timestamp,
+            "raw_data": None if self.raw_data is None else self.raw_data.hex(),
+        }
 
 
 class UbloxAPIList(OrjsonModel):
@@ -45,11 +72,24 @@ class UbloxAPIList(OrjsonModel):
     info: List[UbloxAPI]
 
 
+class UbloxAPIWindow(List[UbloxAPI]):
+    """
+    Window of UbloxApi data around a timestamp, with the set of its payloads
+    to match a message in constant time
+    """
+
+    def __init__(self, info: List[UbloxAPI]):
+        super().__init__(info)
+        self.payloads = frozenset(
+            ublox_api.raw_data for ublox_api in info if ublox_api.raw_data is not None
+        )
+
+
 class Ublox(OrjsonModel):
     """Model of a Ublox message"""
 
     svid: int
-    raw_data: str
+    raw_data: RawData
 
 
 # --------------------------------------------------------------------------------------------
@@ -22,6 +22,9 @@ Response_class
     limitations under the License.
 """
 
+# Standard Library
+from typing import List
+
 # Third Party
 from pydantic import Field
 
@@ -48,3 +51,26 @@ class Resource(OrjsonModel):
         description="Id of the observation",
         example="9d007657-fe13-4bd7-ba3c-d609b110014a",
     )
+
+
+class BatchResource(OrjsonModel):
+    """Resource Model of a batch of observations"""
+
+    resource_type: str = Field(
+        default="PROTECTED SERENGETI",
+        title="Resource type",
+    )
+    url: str = Field(
+        default="https://galileocloud.goeasyproject.eu/serengeti/api/v1/goeasy/IoTauthenticate/batch",
+        description="Url of the resource",
+    )
+    method: str = Field(default="POST")
+    status: str = Field(default="correct")
+    batchGEPid: str = Field(
+        description="Id of the batch, under which it's accounted",
+        example="0b6c4f3e-2b0e-4a5e-9f3c-8a9d4c1e7b21",
+    )
+    observationGEPids: List[str] = Field(
+        description="Id of every observation, following the order of the batch",
+        example=["9d007657-fe13-4bd7-ba3c-d609b110014a"],
+    )
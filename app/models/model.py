@@ -40,3 +40,5 @@ class OrjsonModel(BaseModel):
         # Use orjson to improve performance
         json_loads = orjson.loads
         json_dumps = orjson_dumps
+        # Payloads are kept as bytes and serialized in hex
+        json_encoders = {bytes: bytes.hex}
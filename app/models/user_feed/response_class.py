@@ -47,3 +47,20 @@ class Resource(OrjsonModel):
     journey_id: str = Field(
         description="Id of the journey", example="9d007657-fe13-4bd7-ba3c-d609b110014a"
     )
+
+
+class JourneyStatus(OrjsonModel):
+    """Progress of a journey uploaded in chunks"""
+
+    journey_id: str = Field(
+        description="Id of the journey", example="9d007657-fe13-4bd7-ba3c-d609b110014a"
+    )
+    chunks: int = Field(
+        description="Number of chunks received, index of the next chunk to send",
+        example=3,
+    )
+    verified_chunks: int = Field(
+        description="Number of chunks already authenticated", example=2
+    )
+    positions: int = Field(description="Number of positions authenticated", example=200)
+    closed: bool = Field(description="True if the journey was closed", example=False)
@@ -39,8 +39,8 @@ from ..model import OrjsonModel
 # ------------------------------------------------------------------------------------------------------
 
 
-class UserFeed(OrjsonModel):
-    """UserFeed Input model"""
+class UserFeedHeader(OrjsonModel):
+    """UserFeed Input model without the trace, sent to open a journey session"""
 
     behaviour: Behaviour = Field(..., description="Behaviour of the user")
     company_code: str = Field(
@@ -93,6 +93,11 @@ class UserFeed(OrjsonModel):
     sensors_information: List[SensorInformation] = Field(
         ..., description="List of sensors information"
     )
+
+
+class UserFeed(UserFeedHeader):
+    """UserFeed Input model"""
+
     trace_information: List[PositionObject] = Field(
         ...,
         title="Trace Information",
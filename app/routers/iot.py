@@ -24,27 +24,46 @@ IoTFeed router package
 
 # Standard Library
 import time
+from typing import List
 
 # Third Party
-from fastapi import APIRouter, Body, Depends, Request, BackgroundTasks
+from fastapi import (
+    APIRouter,
+    BackgroundTasks,
+    Body,
+    Depends,
+    HTTPException,
+    Request,
+    Response,
+    status,
+)
 from fastapi.responses import ORJSONResponse
 from fastuuid import uuid4
 
 # Internal
 from ..concurrency.background import frequency_limiter
-from ..concurrency.position_authentication import store_semaphore, position_test_lock
+from ..concurrency.position_authentication import position_test_pool, store_semaphore
+from ..concurrency.work_queue import WORK_QUEUE
 from ..models.iot_feed.iot import IotInput
-from ..models.iot_feed.response_class import Resource
+from ..config import get_concurrency_settings, get_iot_settings
+from ..models.iot_feed.response_class import BatchResource, Resource
 from ..models.security import Requester
-from ..security.jwt_bearer import Signature
-from ..internals.iot import end_to_end_position_authentication, store_iot_data
+from ..security.jwt_bearer import Signature, get_source_app
+from ..internals.iot import (
+    end_to_end_position_authentication,
+    store_iot_batch,
+    store_iot_data,
+)
 
 # --------------------------------------------------------------------------------------------
 
 # JWT Signature
-test_auth = Signature(realm_access="Test")
+test_auth = Signature(realm_access="Test", return_requester=True)
 iot_auth = Signature(realm_access="IoTFeed", return_requester=True)
 
+# Hand the data to the durable work queue instead of the background tasks
+WORK_QUEUE_ENABLED = get_concurrency_settings().work_queue
+
 # Instantiate router
 router = APIRouter(prefix="/api/v1/goeasy/IoTauthenticate", tags=["IoT"])
 
@@ -75,17 +94,31 @@ async def iot_authentication(
     and exploited for the proper selection of the U-Blox Reference System instance.
     """
 
-    # Analyze requester
-    if requester.client == "get_token_client" and requester.user == "goeasy_bq_library":
-        source_app = "ApesMobility"
-    else:
-        source_app = requester.client
+    source_app = get_source_app(requester)
 
     # Generate GEPid
     obesrvation_gepid = str(uuid4())
 
+    if WORK_QUEUE_ENABLED:
+        # Store the data in the anonymizer through the durable work queue
+        await WORK_QUEUE.put(
+            "iot",
+            {
+                "timestamp": time.time(),
+                "host": request.client.host,
+                "obesrvation_gepid": obesrvation_gepid,
+                "source_app": source_app,
+                "client_id": requester.client,
+                "user_id": requester.user,
+            },
+            await request.body(),
+        )
+        return Resource(observationGEPid=obesrvation_gepid)
+
     # Wait some time before adding the background task
-    await frequency_limiter(store_semaphore())
+    await frequency_limiter(
+        store_semaphore(), source_app, requester.client, requester.user
+    )
 
     back_ground_tasks.add_task(
         store_iot_data,
@@ -101,14 +134,70 @@ async def iot_authentication(
     return Resource(observationGEPid=obesrvation_gepid)
 
 
+@router.post(
+    "/batch",
+    response_model=BatchResource,
+    response_class=ORJSONResponse,
+    summary="Validate a batch of data from IoT devices",
+)
+async def iot_batch_authentication(
+    back_ground_tasks: BackgroundTasks,
+    request: Request,
+    requester: Requester = Depends(iot_auth),
+    iot_inputs: List[IotInput] = Body(...),
+):
+    """
+    This endpoint lets IoT devices and LBS applications send a batch of observations in a single
+    https POST request, instead of one request for every observation.\n
+    The observations are authenticated together: the ones with the same region, satellite and
+    phenomenonTime share the requests to the U-Blox Reference System.\n
+    It responds with a unique, random, and anonymous id for every observation, following the order of the batch,
+    and with the id of the batch, under which it's accounted.
+    """
+    if len(iot_inputs) > get_iot_settings().iot_max_batch_size:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"At most {get_iot_settings().iot_max_batch_size} observations for every batch",
+        )
+
+    source_app = get_source_app(requester)
+
+    # Generate a GEPid for the batch and for every observation
+    batch_gepid = str(uuid4())
+    obesrvation_gepids = [str(uuid4()) for _ in iot_inputs]
+
+    # Wait some time before adding the background task
+    await frequency_limiter(
+        store_semaphore(), source_app, requester.client, requester.user
+    )
+
+    back_ground_tasks.add_task(
+        store_iot_batch,
+        iot_inputs,
+        time.time(),
+        request.client.host,
+        batch_gepid,
+        obesrvation_gepids,
+        source_app,
+        requester.client,
+        requester.user,
+        store_semaphore(),
+    )
+    return BatchResource(batchGEPid=batch_gepid, observationGEPids=obesrvation_gepids)
+
+
 @router.post(
     "/test",
     response_class=ORJSONResponse,
     summary="Test the authentication of IoT Data",
     response_description="Input with verified data",
-    dependencies=[Depends(test_auth)],
 )
-async def authenticate_test(request: Request, iot_feed: IotInput = Body(...)):
+async def authenticate_test(
+    request: Request,
+    response: Response,
+    requester: Requester = Depends(test_auth),
+    iot_feed: IotInput = Body(...),
+):
     """
     This endpoint provides ways to let IoT and applications to request for position data authentication services
     without the exploitation of other GEP features, such as the persistent collection.\n
@@ -118,8 +207,9 @@ async def authenticate_test(request: Request, iot_feed: IotInput = Body(...)):
     ![image](https:/serengeti/static/user_feed_authenticate_test.png)
     """
 
-    # Get a semaphore to synchronize this request and prevent starvation
-    async with position_test_lock():
+    # Wait for a slot of the test pool, fairly shared among the clients
+    async with position_test_pool().slot(requester.client) as waited:
+        response.headers["X-Queue-Wait"] = f"{waited:.3f}"
         iot_feed_test = await end_to_end_position_authentication(
             iot_input=iot_feed,
             timestamp=time.time(),
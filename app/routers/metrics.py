@@ -0,0 +1,88 @@
+"""
+Metrics router package
+
+:author: Angelo Cutaia
+:copyright: Copyright 2021, LINKS Foundation
+:version: 1.0.0
+
+..
+
+    Copyright 2021 LINKS Foundation
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+        https://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+# Third Party
+from fastapi import APIRouter, Depends
+from fastapi.responses import ORJSONResponse
+
+# Internal
+from ..concurrency.background import ADMISSION
+from ..concurrency.position_authentication import (
+    position_auth,
+    position_test_pool,
+    store_semaphore,
+)
+from ..concurrency.validation import VALIDATOR
+from ..concurrency.work_queue import WORK_QUEUE
+from ..internals.circuit_breaker import CIRCUIT_BREAKERS
+from ..internals.journey_session import JOURNEY_SESSIONS
+from ..internals.latency import LATENCY
+from ..internals.lookup_cache import LOOKUP_CACHE
+from ..internals.prefetcher import PREFETCHER
+from ..internals.reference_store import REFERENCE_BACKEND
+from ..internals.shared_cache import SHARED_CACHE
+from ..internals.timeout_policy import TIMEOUTS
+from ..internals.ublox_api import AGGREGATOR, HEDGING, SINGLE_FLIGHT
+from ..security.jwt_bearer import Signature
+
+# --------------------------------------------------------------------------------------------
+
+# JWT signature
+admin_auth = Signature(realm_access="Administration")
+
+# Instantiate router
+router = APIRouter(prefix="/api/v1/goeasy/getMetrics", tags=["Admin"])
+
+
+@router.get(
+    "",
+    response_class=ORJSONResponse,
+    summary="Extract Metrics of the worker",
+    dependencies=[Depends(admin_auth)],
+)
+async def extract_metrics():
+    """
+    This endpoint provides ways to let administrators to monitor the internals of the
+    worker that serves the request.\n
+    The counters are kept in memory by every worker and are reset when the worker restarts.
+    """
+    return {
+        "lookup_cache": LOOKUP_CACHE.stats(),
+        "shared_cache": SHARED_CACHE.stats(),
+        "single_flight": SINGLE_FLIGHT.stats(),
+        "hedging": HEDGING.stats(),
+        "aggregator": AGGREGATOR.stats(),
+        "latency": LATENCY.stats(),
+        "circuit_breakers": CIRCUIT_BREAKERS.stats(),
+        "timeouts": TIMEOUTS.stats(),
+        "reference_backend": REFERENCE_BACKEND.stats(),
+        "prefetcher": PREFETCHER.stats(),
+        "journey_sessions": JOURNEY_SESSIONS.stats(),
+        "test_pool": position_test_pool().stats(),
+        "admission": ADMISSION.stats(),
+        "store_limiter": store_semaphore().stats(),
+        "position_auth_limiter": position_auth().stats(),
+        "work_queue": WORK_QUEUE.stats(),
+        "validation": VALIDATOR.stats(),
+    }
@@ -24,43 +24,68 @@ UserFeed router package
 
 # Standard Library
 import time
+from typing import List
 
 # Third Party
-from fastapi import APIRouter, Body, Depends, BackgroundTasks, Request
+from fastapi import APIRouter, Body, Depends, BackgroundTasks, Path, Request, Response
 from fastapi.responses import ORJSONResponse
 from fastuuid import uuid4
 
 # Internal
 from ..concurrency.background import frequency_limiter
-from ..concurrency.position_authentication import position_test_lock, store_semaphore
+from ..concurrency.position_authentication import position_test_pool, store_semaphore
+from ..concurrency.validation import VALIDATOR
+from ..concurrency.work_queue import WORK_QUEUE
+from ..config import get_concurrency_settings
+from ..internals.journey_session import JOURNEY_SESSIONS
 from ..internals.user_feed import end_to_end_position_authentication, store_android_data
-from ..models.user_feed.user import UserFeedInput
+from ..models.user_feed.position import PositionObjectInput
+from ..models.user_feed.user import UserFeedHeader, UserFeedInput
 from ..models.security import Requester
-from ..models.user_feed.response_class import Resource
-from ..security.jwt_bearer import Signature
+from ..models.user_feed.response_class import JourneyStatus, Resource
+from ..security.jwt_bearer import Signature, get_source_app
 
 # --------------------------------------------------------------------------------------------
 
 # JWT  signature
-test_auth = Signature(realm_access="Test")
+test_auth = Signature(realm_access="Test", return_requester=True)
 user_feed_auth = Signature(realm_access="UserFeed", return_requester=True)
 
+# Hand the data to the durable work queue instead of the background tasks
+WORK_QUEUE_ENABLED = get_concurrency_settings().work_queue
+
 # Instantiate router
 router = APIRouter(prefix="/api/v1/goeasy/authenticate", tags=["User"])
 
 
+async def user_feed_input(request: Request) -> UserFeedInput:
+    """Validate the UserFeed of the request, in a separate process if it's large"""
+    return await VALIDATOR.validate(UserFeedInput, await request.body())
+
+
 @router.post(
     "",
     response_model=Resource,
     response_class=ORJSONResponse,
     summary="Authenticate User data and store them",
     response_description="Resource created",
+    # The body is validated by user_feed_input, document it anyway
+    openapi_extra={
+        "requestBody": {
+            "content": {
+                "application/json": {
+                    "schema": {"$ref": "#/components/schemas/UserFeedInput"}
+                }
+            },
+            "required": True,
+        }
+    },
 )
 async def authenticate(
     back_ground_tasks: BackgroundTasks,
     request: Request,
     requester: Requester = Depends(user_feed_auth),
-    user_feed: UserFeedInput = Body(...),
+    user_feed: UserFeedInput = Depends(user_feed_input),
 ):
     """
     This endpoint provides a unique point of access to let external users and applications to send standardized data
@@ -77,17 +102,31 @@ async def authenticate(
     U-Blox Reference System instance.\n
     ![image](https:/serengeti/static/user_feed_authenticate.png)
     """
-    # Analyze requester
-    if requester.client == "get_token_client" and requester.user == "goeasy_bq_library":
-        source_app = "ApesMobility"
-    else:
-        source_app = requester.client
+    source_app = get_source_app(requester)
 
     # Generate an unique id for the journey
     journey_id = str(uuid4())
 
+    if WORK_QUEUE_ENABLED:
+        # Store the data in the anonengine through the durable work queue
+        await WORK_QUEUE.put(
+            "android",
+            {
+                "timestamp": time.time(),
+                "host": request.client.host,
+                "journey_id": journey_id,
+                "source_app": source_app,
+                "client_id": requester.client,
+                "user_id": requester.user,
+            },
+            await request.body(),
+        )
+        return Resource(journey_id=journey_id)
+
     # Wait some time before adding the background task
-    await frequency_limiter(store_semaphore())
+    await frequency_limiter(
+        store_semaphore(), source_app, requester.client, requester.user
+    )
 
     # Store the data in the anonengine in the background
     back_ground_tasks.add_task(
@@ -111,9 +150,13 @@ async def authenticate(
     response_class=ORJSONResponse,
     summary="Test the authentication of User Data",
     response_description="Input with verified data",
-    dependencies=[Depends(test_auth)],
 )
-async def authenticate_test(request: Request, user_feed: UserFeedInput = Body(...)):
+async def authenticate_test(
+    request: Request,
+    response: Response,
+    requester: Requester = Depends(test_auth),
+    user_feed: UserFeedInput = Body(...),
+):
     """
     This endpoint provides ways to let users and applications to request for position data authentication services
     without the exploitation of other GEP features, such as the persistent collection.\n
@@ -123,8 +166,9 @@ async def authenticate_test(request: Request, user_feed: UserFeedInput = Body(..
     ![image](https:/serengeti/static/user_feed_authenticate_test.png)
     """
 
-    # Get a semaphore to synchronize this request and prevent starvation
-    async with position_test_lock():
+    # Wait for a slot of the test pool, fairly shared among the clients
+    async with position_test_pool().slot(requester.client) as waited:
+        response.headers["X-Queue-Wait"] = f"{waited:.3f}"
         user_feed_test = await end_to_end_position_authentication(
             user_feed=user_feed,
             timestamp=time.time(),
@@ -136,3 +180,104 @@ async def authenticate_test(request: Request, user_feed: UserFeedInput = Body(..
     )
     user_feed_internal.update({"source_app": "TEST", "journey_id": "TEST"})
     return user_feed_internal
+
+
+@router.post(
+    "/journeys",
+    response_model=Resource,
+    response_class=ORJSONResponse,
+    summary="Open a journey uploaded in chunks",
+    response_description="Journey opened",
+)
+async def open_journey(
+    request: Request,
+    requester: Requester = Depends(user_feed_auth),
+    header: UserFeedHeader = Body(...),
+):
+    """
+    This endpoint opens a journey whose positions are sent in chunks, instead of
+    embedding the whole trace in a single JSON payload.\n
+    It responds with the unique, random, and anonymous id of the journey. The chunks of positions
+    are then sent to `/journeys/{journey_id}/chunks/{chunk}` and the journey is closed through
+    `/journeys/{journey_id}/close`. Every chunk is authenticated as soon as it arrives.
+    """
+    journey = await JOURNEY_SESSIONS.open(
+        header,
+        request.client.host,
+        get_source_app(requester),
+        requester.client,
+        requester.user,
+    )
+    return Resource(journey_id=journey.journey_id)
+
+
+@router.get(
+    "/journeys/{journey_id}",
+    response_model=JourneyStatus,
+    response_class=ORJSONResponse,
+    summary="Progress of a journey uploaded in chunks",
+    response_description="Progress of the journey",
+)
+async def journey_status(
+    journey_id: str = Path(..., description="Id of the journey"),
+    requester: Requester = Depends(user_feed_auth),
+):
+    """
+    This endpoint provides the number of chunks received for a journey,
+    so that an interrupted upload can be resumed from the next chunk.
+    """
+    return await JOURNEY_SESSIONS.get(journey_id, requester.client, requester.user)
+
+
+@router.put(
+    "/journeys/{journey_id}/chunks/{chunk}",
+    response_model=JourneyStatus,
+    response_class=ORJSONResponse,
+    summary="Append a chunk of positions to a journey",
+    response_description="Progress of the journey",
+)
+async def append_chunk(
+    request: Request,
+    journey_id: str = Path(..., description="Id of the journey"),
+    chunk: int = Path(..., ge=0, description="Index of the chunk, starting from 0"),
+    requester: Requester = Depends(user_feed_auth),
+    trace_information: List[PositionObjectInput] = Body(...),
+):
+    """
+    This endpoint appends a chunk of positions to a journey. The chunks must be sent
+    following the order of the trace; a chunk already received is ignored, so the
+    upload can be safely retried. The positions are authenticated in the background,
+    carrying the meaconing detection across the chunks.
+    """
+    return await JOURNEY_SESSIONS.append(
+        journey_id,
+        requester.client,
+        requester.user,
+        chunk,
+        trace_information,
+        int(request.headers.get("content-length", 0)),
+    )
+
+
+@router.post(
+    "/journeys/{journey_id}/close",
+    response_model=Resource,
+    response_class=ORJSONResponse,
+    summary="Close a journey uploaded in chunks and store it",
+    response_description="Resource created",
+)
+async def close_journey(
+    back_ground_tasks: BackgroundTasks,
+    journey_id: str = Path(..., description="Id of the journey"),
+    requester: Requester = Depends(user_feed_auth),
+):
+    """
+    This endpoint closes a journey. Once the pending chunks are authenticated
+    the journey is stored in the background, as the ones sent in a single payload.
+    """
+    await JOURNEY_SESSIONS.close(journey_id, requester.client, requester.user)
+
+    # Store the data in the anonengine in the background
+    back_ground_tasks.add_task(JOURNEY_SESSIONS.finalize, journey_id, store_semaphore())
+
+    return Resource(journey_id=journey_id)
@@ -89,3 +89,10 @@ class Signature(HTTPBearer):
                 requester = Requester(client=token["azp"])
 
             return requester
+
+
+def get_source_app(requester: Requester) -> str:
+    """Analyze the requester and find the app that made the request"""
+    if requester.client == "get_token_client" and requester.user == "goeasy_bq_library":
+        return "ApesMobility"
+    return requester.client
@@ -0,0 +1,127 @@
+"""
+Journey latency benchmark
+
+Run it from the root of the repository with ``python -m benchmarks.journey_latency``
+
+:author: Angelo Cutaia
+:copyright: Copyright 2021, LINKS Foundation
+:version: 1.0.0
+
+..
+
+    Copyright 2021 LINKS Foundation
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+        https://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+# Standard Library
+from asyncio import run, sleep
+import re
+import time
+
+# Third Party
+from aioresponses import aioresponses, CallbackResult
+import orjson
+
+# Internal
+from app.config import get_ublox_api_settings
+from app.internals.keycloak import KEYCLOAK
+from app.internals.logger import get_logger
+from app.internals.lookup_cache import LOOKUP_CACHE
+from app.internals.sessions.ublox_api import UBLOX_API_SESSIONS
+from app.internals.user_feed import end_to_end_position_authentication
+from app.models.user_feed.user import UserFeedInput
+
+# --------------------------------------------------------------------------------------------
+
+USER_INPUT_PATH = "tests/internals/user_feed/fake_user_feed.json"
+"""Template of the journey"""
+
+POSITIONS = 200
+"""Number of positions of the synthetic journey"""
+
+RTT = 0.01
+"""Simulated round trip time of Ublox-Api in seconds"""
+
+RAW_GALILEO = "021b05b6415009b9c96a3edc8e7500867e588f6792c86aaaaa62bc4c7f40"
+"""Galileo message of every position"""
+
+
+async def _ublox_api(url, **kwargs) -> CallbackResult:
+    """Simulate Ublox-Api latency"""
+    await sleep(RTT)
+    return CallbackResult(
+        body=orjson.dumps({"timestamp": 0, "raw_data": RAW_GALILEO}).decode()
+    )
+
+
+def _synthetic_journey() -> UserFeedInput:
+    """Build a journey whose positions ask every one a different message"""
+    with open(USER_INPUT_PATH, "r") as fp:
+        user_feed = UserFeedInput.parse_raw(fp.read())
+
+    template = user_feed.trace_information[0]
+    trace_information = []
+    for index in range(POSITIONS):
+        position = template.copy(deep=True)
+        auth = position.galileo_auth[0]
+        auth.time += index * 1000
+        auth.timenano += index * 1_000_000_000
+        auth.fullbiasnano += index
+        trace_information.append(position)
+    user_feed.trace_information = trace_information
+
+    return user_feed
+
+
+async def _measure(journey_concurrency: int) -> float:
+    """Authenticate the synthetic journey and measure its latency"""
+    settings = get_ublox_api_settings()
+    settings.journey_concurrency = journey_concurrency
+    # Measure only the GET path
+    settings.batch_lookup_threshold = POSITIONS + 1
+    LOOKUP_CACHE.clear()
+
+    user_feed = _synthetic_journey()
+    start = time.perf_counter()
+    await end_to_end_position_authentication(
+        user_feed=user_feed, timestamp=time.time(), host="benchmark"
+    )
+    return time.perf_counter() - start
+
+
+async def main():
+    get_logger().disabled = True
+
+    # Avoid the request to Keycloak
+    KEYCLOAK.last_token = "BENCHMARK"
+    KEYCLOAK.last_token_reception_time = time.time()
+
+    await UBLOX_API_SESSIONS.setup()
+    with aioresponses() as m:
+        m.get(re.compile(r"^https?://.*$"), callback=_ublox_api, repeat=True)
+
+        sequential = await _measure(journey_concurrency=1)
+        print(f"journey_concurrency=1: {sequential:.3f} s")
+
+        for journey_concurrency in (4, 8, 16):
+            latency = await _measure(journey_concurrency)
+            print(
+                f"journey_concurrency={journey_concurrency}: {latency:.3f} s "
+                f"({sequential / latency:.1f}x)"
+            )
+    await UBLOX_API_SESSIONS.close()
+
+
+if __name__ == "__main__":
+    run(main())
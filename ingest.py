@@ -0,0 +1,69 @@
+"""
+Ingest Ublox-Api dumps in the local reference store
+
+Usage: ``python ingest.py --location Italy --kind galileo dump.json [dump.json ...]``
+
+Every dump is a recorded UbloxAPIList response, or a list of them.
+
+:author: Angelo Cutaia
+:copyright: Copyright 2021, LINKS Foundation
+:version: 1.0.0
+
+..
+
+    Copyright 2021 LINKS Foundation
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+        https://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+# Standard Library
+from argparse import ArgumentParser
+from collections import defaultdict
+
+# Third Party
+import orjson
+
+# Internal
+from app.config import get_ublox_api_settings
+from app.internals.reference_store import ingest
+from app.models.galileo.ublox_api import UbloxAPIList
+
+# -------------------------------------------------------------------------------
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("dumps", nargs="+", help="Ublox-Api dumps to ingest")
+    parser.add_argument("--location", choices=("Italy", "Sweden"), required=True)
+    parser.add_argument("--kind", choices=("galileo", "ublox"), required=True)
+    parser.add_argument(
+        "--store",
+        default=get_ublox_api_settings().reference_store_path,
+        help="directory of the reference store",
+    )
+    args = parser.parse_args()
+
+    # Group the grids of every satellite
+    satellites = defaultdict(list)
+    for dump in args.dumps:
+        with open(dump, "rb") as fp:
+            responses = orjson.loads(fp.read())
+        if isinstance(responses, dict):
+            responses = [responses]
+        for response in responses:
+            ublox_api_list = UbloxAPIList.parse_obj(response)
+            satellites[ublox_api_list.satellite_id].append(ublox_api_list.info)
+
+    for svid, grids in sorted(satellites.items()):
+        count = ingest(args.store, (args.location, args.kind, svid), grids)
+        print(f"{args.location}/{args.kind}/{svid}: {count} messages")
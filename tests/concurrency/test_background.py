@@ -0,0 +1,193 @@
+"""
+Tests app.concurrency.background module
+
+:author: Angelo Cutaia
+:copyright: Copyright 2021, LINKS Foundation
+:version: 1.0.0
+
+..
+
+    Copyright 2021 LINKS Foundation
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+        https://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+# Standard Library
+from asyncio import ensure_future, gather, sleep
+from typing import Optional
+
+# Test
+from fastapi import HTTPException
+import pytest
+import uvloop
+
+# Internal
+from app.concurrency.background import _AdmissionController
+from app.concurrency.position_authentication import AdaptiveLimiter
+
+# ------------------------------------------------------------------------------
+
+
+@pytest.fixture()
+def event_loop():
+    """
+    Set uvloop as the default event loop
+    """
+    loop = uvloop.Loop()
+    yield loop
+    loop.close()
+
+
+def admission_controller(**kwargs) -> _AdmissionController:
+    """Admission controller with the settings of the test"""
+    settings = {
+        "rate": 100,
+        "burst": 100,
+        "weights": {},
+        "timeout": 1,
+        "max_retry_after": 30,
+    }
+    settings.update(kwargs)
+    return _AdmissionController(**settings)
+
+
+def semaphore(limit: int = 1) -> AdaptiveLimiter:
+    """Limiter of the background tasks with a fixed limit"""
+    return AdaptiveLimiter(
+        initial=limit,
+        min_limit=limit,
+        max_limit=limit,
+        tolerance=2,
+        backoff=0.5,
+        window=10,
+    )
+
+
+class TestAdmissionController:
+    """
+    Test the admission of the requests
+    """
+
+    @pytest.mark.asyncio
+    async def test_token_bucket(self):
+        """A client over its rate is rejected with the time to wait"""
+        admission = admission_controller(rate=0.5, burst=1, timeout=0.1)
+
+        await admission.admit("TEST", "noisy", None, semaphore())
+        with pytest.raises(HTTPException) as exc:
+            await admission.admit("TEST", "noisy", None, semaphore())
+        assert exc.value.status_code == 503
+        assert exc.value.headers["Retry-After"] == "2", "One token every two seconds"
+
+        # The other clients have their own bucket, even inside the same app
+        await admission.admit("TEST", "polite", None, semaphore())
+        await admission.admit("TEST", "noisy", "user", semaphore())
+        assert admission.throttled == {("TEST", "noisy", None): 1}
+        assert admission.stats()["clients"]["TEST/noisy/None"]["throttled"] == 1
+
+    @pytest.mark.asyncio
+    async def test_weighted_fair_queue(self):
+        """A noisy app can't starve the others"""
+        admission = admission_controller(weights={"ApesMobility": 2})
+        limiter = semaphore()
+        admitted = []
+
+        async def admit(source_app: str) -> None:
+            await admission.admit(source_app, "client", None, limiter)
+            # The background task uses the reserved slot
+            async with limiter:
+                admitted.append(source_app)
+
+        async with limiter:
+            tasks = [ensure_future(admit("noisy")) for _ in range(4)]
+            await sleep(0)
+            tasks.append(ensure_future(admit("polite")))
+            tasks += [ensure_future(admit("ApesMobility")) for _ in range(2)]
+            await sleep(0)
+            assert admission.stats()["waiting"] == 7, "Every request must wait"
+
+        await gather(*tasks)
+        assert admitted[:4] == ["ApesMobility", "noisy", "polite", "ApesMobility"]
+        assert admitted[4:] == ["noisy"] * 3
+        assert limiter.stats()["in_flight"] == 0, "No slot must leak"
+
+    @pytest.mark.asyncio
+    async def test_clients_of_an_app(self):
+        """A noisy client can't starve the other clients of its app"""
+        admission = admission_controller()
+        limiter = semaphore()
+        admitted = []
+
+        async def admit(client_id: str, user_id: Optional[str]) -> None:
+            await admission.admit("TEST", client_id, user_id, limiter)
+            async with limiter:
+                admitted.append((client_id, user_id))
+
+        async with limiter:
+            tasks = [ensure_future(admit("noisy", None)) for _ in range(3)]
+            await sleep(0)
+            tasks.append(ensure_future(admit("noisy", "user")))
+            tasks.append(ensure_future(admit("polite", None)))
+            await sleep(0)
+
+        await gather(*tasks)
+        assert admitted[:3] == [("noisy", None), ("noisy", "user"), ("polite", None)]
+        assert admitted[3:] == [("noisy", None)] * 2
+
+    @pytest.mark.asyncio
+    async def test_burst(self):
+        """Every admitted request holds a slot, so a burst can't exceed the limiter"""
+        admission = admission_controller()
+        limiter = semaphore()
+
+        tasks = [
+            ensure_future(admission.admit("TEST", "client", None, limiter))
+            for _ in range(3)
+        ]
+        await sleep(0)
+        assert tasks[0].done(), "The first request must be admitted"
+        assert admission.stats()["waiting"] == 2, "The burst must wait"
+        assert limiter.stats()["reserved"] == 1
+
+        for task in tasks[1:]:
+            # The background task of the previous request frees the slot
+            async with limiter:
+                assert limiter.stats()["in_flight"] == 1
+            await task
+            assert limiter.stats()["in_flight"] == 1, "Only one slot must be held"
+
+        async with limiter:
+            pass
+        assert limiter.stats()["in_flight"] == 0, "No slot must leak"
+
+    @pytest.mark.asyncio
+    async def test_queue_timeout(self):
+        """A request waiting too long is rejected considering its position"""
+        admission = admission_controller(timeout=0.05)
+        limiter = semaphore()
+
+        async with limiter:
+            results = await gather(
+                *[admission.admit("TEST", "client", None, limiter) for _ in range(3)],
+                return_exceptions=True,
+            )
+
+        for result in results:
+            assert isinstance(result, HTTPException), "Every request must be rejected"
+            assert int(result.headers["Retry-After"]) >= 1
+        assert admission.rejected == {("TEST", "client", None): 3}
+        assert admission.stats()["waiting"] == 0, "No request must wait"
+
+        # The dispatcher gives back the slot nobody is waiting for
+        await sleep(0)
+        assert limiter.stats()["in_flight"] == 0, "No slot must leak"
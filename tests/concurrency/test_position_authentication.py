@@ -0,0 +1,263 @@
+"""
+Tests app.concurrency.position_authentication module
+
+:author: Angelo Cutaia
+:copyright: Copyright 2021, LINKS Foundation
+:version: 1.0.0
+
+..
+
+    Copyright 2021 LINKS Foundation
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+        https://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+# Standard Library
+from asyncio import Event, ensure_future, gather, sleep
+
+# Test
+from fastapi import HTTPException
+import pytest
+import uvloop
+
+# Internal
+from app.concurrency.position_authentication import AdaptiveLimiter, PositionTestPool
+
+# ------------------------------------------------------------------------------
+
+
+@pytest.fixture()
+def event_loop():
+    """
+    Set uvloop as the default event loop
+    """
+    loop = uvloop.Loop()
+    yield loop
+    loop.close()
+
+
+class TestPositionTestPool:
+    """
+    Test the pool of the tests on the position authentication
+    """
+
+    @pytest.mark.asyncio
+    async def test_fairness(self):
+        """The free slots are handed to the clients in round robin"""
+        pool = PositionTestPool(size=1, max_queue=10)
+        release = Event()
+        served = []
+
+        async def run(client: str) -> float:
+            async with pool.slot(client) as waited:
+                served.append(client)
+                await release.wait()
+            return waited
+
+        # A greedy client queues many tests before a second client
+        tasks = [ensure_future(run("greedy")) for _ in range(4)]
+        await sleep(0)
+        tasks.append(ensure_future(run("polite")))
+        await sleep(0)
+        assert pool.stats()["running"] == 1, "Only one test must run"
+        assert pool.stats()["waiting"] == 4, "Four tests must wait"
+
+        release.set()
+        waited = await gather(*tasks)
+
+        assert served[:3] == ["greedy", "greedy", "polite"], "Round robin expected"
+        assert waited[0] == 0, "The first test must not wait"
+        assert pool.stats()["running"] == 0, "The pool must be empty"
+        assert pool.stats()["served"] == 5
+
+    @pytest.mark.asyncio
+    async def test_bounded_queue(self):
+        """A full queue rejects the tests with a Retry-After"""
+        pool = PositionTestPool(size=1, max_queue=1)
+        release = Event()
+
+        async def run(client: str) -> None:
+            async with pool.slot(client):
+                await release.wait()
+
+        tasks = [ensure_future(run("TEST")) for _ in range(2)]
+        await sleep(0)
+
+        with pytest.raises(HTTPException) as exc:
+            await pool.acquire("TEST")
+        assert exc.value.status_code == 503
+        assert int(exc.value.headers["Retry-After"]) >= 1
+
+        # A cancelled test leaves the queue
+        tasks[1].cancel()
+        await sleep(0)
+        assert pool.stats()["waiting"] == 0, "The queue must be empty"
+
+        release.set()
+        await tasks[0]
+        assert pool.stats()["running"] == 0, "The pool must be empty"
+        assert pool.stats()["rejected"] == 1
+
+    @pytest.mark.asyncio
+    async def test_release_cancelled(self):
+        """A slot released while a waiter is being cancelled goes to the next one"""
+        pool = PositionTestPool(size=1, max_queue=2)
+        await pool.acquire("TEST")
+
+        waiters = [ensure_future(pool.acquire(client)) for client in ("A", "B")]
+        await sleep(0)
+        assert pool.stats()["waiting"] == 2
+
+        # The slot is released before the cancelled waiter runs again
+        waiters[0].cancel()
+        pool.release()
+        assert await waiters[1] >= 0, "The next waiter must get the slot"
+        await gather(waiters[0], return_exceptions=True)
+        assert waiters[0].cancelled()
+
+        assert pool.stats()["running"] == 1 and pool.stats()["waiting"] == 0
+        pool.release()
+        assert pool.stats()["running"] == 0, "No slot must leak"
+
+
+def adaptive_limiter(**kwargs) -> AdaptiveLimiter:
+    """Adaptive limiter with the settings of the test"""
+    settings = {
+        "initial": 2,
+        "min_limit": 1,
+        "max_limit": 4,
+        "tolerance": 2,
+        "backoff": 0.5,
+        "window": 10,
+    }
+    settings.update(kwargs)
+    return AdaptiveLimiter(**settings)
+
+
+class TestAdaptiveLimiter:
+    """
+    Test the limiter that adapts the concurrency to the latency
+    """
+
+    @pytest.mark.asyncio
+    async def test_limit(self):
+        """No more than limit works run concurrently"""
+        limiter = adaptive_limiter()
+        release = Event()
+
+        async def work() -> None:
+            async with limiter:
+                await release.wait()
+
+        tasks = [ensure_future(work()) for _ in range(3)]
+        await sleep(0)
+        assert limiter.stats()["in_flight"] == 2, "Two works must run"
+        assert limiter.stats()["waiting"] == 1, "One work must wait"
+        assert limiter.locked()
+
+        release.set()
+        await gather(*tasks)
+        assert limiter.stats()["in_flight"] == 0, "The limiter must be empty"
+        assert not limiter.locked()
+
+    @pytest.mark.asyncio
+    async def test_release_cancelled(self):
+        """A slot released while a waiter is being cancelled goes to the next one"""
+        limiter = adaptive_limiter(initial=1)
+        await limiter.acquire()
+
+        waiters = [ensure_future(limiter.acquire()) for _ in range(2)]
+        await sleep(0)
+        assert limiter.stats()["waiting"] == 2
+
+        # The slot is released before the cancelled waiter runs again
+        waiters[0].cancel()
+        limiter.release()
+        assert await waiters[1], "The next waiter must get the slot"
+        await gather(waiters[0], return_exceptions=True)
+        assert waiters[0].cancelled(), "The cancellation must be re-raised"
+
+        assert limiter.stats()["in_flight"] == 1
+        assert limiter.stats()["waiting"] == 0
+        limiter.release()
+        assert limiter.stats()["in_flight"] == 0, "No slot must leak"
+
+    @pytest.mark.asyncio
+    async def test_reserve(self):
+        """A reserved slot is used by the next work or freed when it expires"""
+        limiter = adaptive_limiter(initial=1)
+
+        await limiter.reserve(1)
+        assert limiter.locked(), "The reserved slot must be held"
+        async with limiter:
+            assert limiter.stats()["in_flight"] == 1, "The work must use the slot"
+            assert limiter.stats()["reserved"] == 0
+        assert limiter.stats()["in_flight"] == 0, "The work must free the slot"
+
+        await limiter.reserve(0.01)
+        await sleep(0.05)
+        assert limiter.stats()["in_flight"] == 0, "The expired slot must be freed"
+        assert limiter.stats()["reserved"] == 0
+
+    @pytest.mark.asyncio
+    async def test_increase(self):
+        """The limit grows while the latency stays flat"""
+        limiter = adaptive_limiter()
+
+        async def work() -> None:
+            async with limiter:
+                await sleep(0.01)
+
+        for _ in range(10):
+            await gather(*[work() for _ in range(int(limiter.limit))])
+
+        assert limiter.stats()["limit"] == 4, "The limit must reach the max"
+        assert limiter.decreases == 0
+
+    @pytest.mark.asyncio
+    async def test_decrease(self):
+        """The limit is cut when the latency rises or the work fails"""
+        limiter = adaptive_limiter(initial=4)
+
+        async def work(seconds: float) -> None:
+            async with limiter:
+                await sleep(seconds)
+
+        await work(0.01)
+        # The slow works started together are considered once
+        await gather(*[work(0.05) for _ in range(3)])
+        assert limiter.stats()["limit"] == 2, "The limit must be halved once"
+
+        with pytest.raises(ValueError):
+            async with limiter:
+                raise ValueError("Failed")
+        assert limiter.stats()["limit"] == 1, "The limit must be halved"
+        assert limiter.decreases == 2
+
+    @pytest.mark.asyncio
+    async def test_weigh(self):
+        """The latency is measured per position"""
+        limiter = adaptive_limiter(initial=4)
+
+        async def work(seconds: float, positions: int) -> None:
+            async with limiter:
+                limiter.weigh(positions)
+                await sleep(seconds)
+
+        await work(0.01, 1)
+        await work(0.1, 10)
+        assert limiter.decreases == 0, "A long journey isn't congestion"
+        assert limiter.latency < 0.02
+
+        await work(0.1, 1)
+        assert limiter.decreases == 1
@@ -0,0 +1,135 @@
+"""
+Tests app.concurrency.validation module
+
+:author: Angelo Cutaia
+:copyright: Copyright 2021, LINKS Foundation
+:version: 1.0.0
+
+..
+
+    Copyright 2021 LINKS Foundation
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+        https://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+# Standard Library
+from asyncio import sleep
+import time
+
+# Test
+from fastapi import HTTPException
+import pytest
+import uvloop
+
+# Internal
+from app.concurrency.validation import _Validator
+from app.models.user_feed.user import UserFeedInput
+
+from ..internals.user_feed.constants import USER_INPUT_PATH
+
+# ------------------------------------------------------------------------------
+
+with open(USER_INPUT_PATH, "rb") as fp:
+    BODY = fp.read()
+    """Body of a UserFeed request"""
+
+# ------------------------------------------------------------------------------
+
+
+def new_validator(**kwargs) -> _Validator:
+    """Started validator with the settings of the test"""
+    settings = {
+        "processes": 1,
+        "threshold": len(BODY),
+        "min_offload": 0,
+        "lag_target": 0.05,
+        "lag_interval": 0.01,
+    }
+    settings.update(kwargs)
+    validator = _Validator(**settings)
+    validator.start()
+    return validator
+
+
+@pytest.fixture()
+def event_loop():
+    """
+    Set uvloop as the default event loop
+    """
+    loop = uvloop.Loop()
+    yield loop
+    loop.close()
+
+
+class TestValidator:
+    """
+    Test the validation of the bodies
+    """
+
+    @pytest.mark.asyncio
+    async def test_validate(self):
+        """Large bodies are validated in the pool, the others in the event loop"""
+        validator = new_validator()
+
+        try:
+            inline = await validator.validate(UserFeedInput, BODY[:-1])
+            offloaded = await validator.validate(UserFeedInput, BODY)
+        finally:
+            validator.close()
+
+        assert inline == offloaded, "The model must not change"
+        assert isinstance(offloaded, UserFeedInput)
+        assert validator.stats()["inline"] == 1
+        assert validator.stats()["offloaded"] == 1
+
+    @pytest.mark.asyncio
+    async def test_invalid_body(self):
+        """The errors follow the format of FastAPI"""
+        validator = new_validator(threshold=0)
+
+        try:
+            with pytest.raises(HTTPException) as exc:
+                await validator.validate(UserFeedInput, b'{"Wrong": "Body"}')
+            assert exc.value.status_code == 422
+            assert exc.value.detail[0]["loc"][0] == "body"
+
+            with pytest.raises(HTTPException) as exc:
+                await validator.validate(UserFeedInput, b"Not a JSON")
+            assert exc.value.detail[0]["type"] == "value_error.jsondecode"
+        finally:
+            validator.close()
+
+    @pytest.mark.asyncio
+    async def test_lag(self):
+        """The lag of the event loop is measured and kept under the target"""
+        validator = new_validator()
+
+        try:
+            # The event loop is blocked
+            await sleep(0.02)
+            time.sleep(0.1)
+            await sleep(0.02)
+            assert validator.stats()["max_loop_lag"] >= 0.05
+            assert validator.stats()["loop_lag"] > 0
+
+            # Validating the body in the event loop would exceed the target
+            validator.seconds_per_byte = 1
+            await validator.validate(UserFeedInput, BODY[:-1])
+            assert validator.stats()["offloaded"] == 1
+
+            # Small bodies are always validated in the event loop
+            validator.min_offload = len(BODY)
+            await validator.validate(UserFeedInput, BODY[:-1])
+            assert validator.stats()["inline"] == 1
+        finally:
+            validator.close()
@@ -0,0 +1,216 @@
+"""
+Tests app.concurrency.work_queue module
+
+:author: Angelo Cutaia
+:copyright: Copyright 2021, LINKS Foundation
+:version: 1.0.0
+
+..
+
+    Copyright 2021 LINKS Foundation
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+        https://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+# Standard Library
+from asyncio import sleep
+
+# Test
+import pytest
+import uvloop
+
+# Internal
+from app.concurrency.work_queue import _WorkQueue
+
+from ..internals.logger import disable_logger
+
+# ------------------------------------------------------------------------------
+
+
+@pytest.fixture()
+def event_loop():
+    """
+    Set uvloop as the default event loop
+    """
+    loop = uvloop.Loop()
+    yield loop
+    loop.close()
+
+
+@pytest.fixture
+def work_queue(tmp_path):
+    queue = _WorkQueue(
+        path=str(tmp_path / "work_queue.sqlite"),
+        consumers=2,
+        lease=0.1,
+        max_attempts=2,
+        poll_interval=0.01,
+        max_poll_interval=0.02,
+        retry_backoff=0.01,
+    )
+    yield queue
+    queue.close()
+
+
+async def wait_for_empty(queue: _WorkQueue) -> None:
+    """Wait until every item is processed"""
+    for _ in range(100):
+        if (await queue.depth())[0] == 0:
+            return
+        await sleep(0.01)
+    raise AssertionError("The queue must be empty")
+
+
+class TestWorkQueue:
+    """
+    Test the durable work queue
+    """
+
+    @pytest.mark.asyncio
+    async def test_consume(self, work_queue):
+        """The consumers process every item once"""
+        disable_logger()
+        processed = []
+
+        async def handler(metadata: dict, body: bytes) -> None:
+            processed.append((metadata["id"], body))
+
+        for index in range(5):
+            await work_queue.put("test", {"id": index}, b"body")
+        assert await work_queue.depth() == (5, 0), "Five items must be queued"
+
+        work_queue.start({"test": handler})
+        await wait_for_empty(work_queue)
+        await work_queue.stop()
+
+        assert sorted(processed) == [(index, b"body") for index in range(5)]
+        assert work_queue.stats()["completed"] == 5
+
+    @pytest.mark.asyncio
+    async def test_replay(self, work_queue):
+        """The items of a consumer that died are replayed when the lease expires"""
+        disable_logger()
+        processed = []
+
+        async def handler(metadata: dict, body: bytes) -> None:
+            processed.append(metadata["id"])
+
+        await work_queue.put("test", {"id": 1}, b"body")
+        # A consumer takes the item and dies before the acknowledgment
+        assert (await work_queue.take())[0] == 1
+        assert await work_queue.take() is None, "The item must be leased"
+
+        # The queue survives the restart of the worker
+        work_queue.close()
+        work_queue.start({"test": handler})
+        await wait_for_empty(work_queue)
+        await work_queue.stop()
+
+        assert processed == [1], "The item must be replayed"
+        assert work_queue.replayed == 1
+
+    @pytest.mark.asyncio
+    async def test_drop(self, work_queue):
+        """Unknown items and items that failed too many times are dropped"""
+        disable_logger()
+
+        async def handler(metadata: dict, body: bytes) -> None:
+            raise ValueError("Failed")
+
+        await work_queue.put("unknown", {}, b"body")
+        await work_queue.put("test", {}, b"body")
+
+        work_queue.start({"test": handler})
+        await wait_for_empty(work_queue)
+        await work_queue.stop()
+
+        assert work_queue.dropped == 2, "Both items must be dropped"
+        assert work_queue.completed == 0
+
+    @pytest.mark.asyncio
+    async def test_wakeup(self, work_queue):
+        """An idle consumer backs off but is woken up by the items of its worker"""
+        disable_logger()
+        work_queue.poll_interval = work_queue.max_poll_interval = 60
+        processed = []
+
+        async def handler(metadata: dict, body: bytes) -> None:
+            processed.append(metadata["id"])
+
+        work_queue.start({"test": handler})
+        await sleep(0.1)
+
+        await work_queue.put("test", {"id": 1}, b"body")
+        await wait_for_empty(work_queue)
+        await work_queue.stop()
+
+        assert processed == [1], "The item must be processed without polling"
+
+    @pytest.mark.asyncio
+    async def test_heartbeat(self, work_queue):
+        """The lease of an item is renewed while it's processed"""
+        disable_logger()
+        processed = []
+
+        async def handler(metadata: dict, body: bytes) -> None:
+            processed.append(metadata["id"])
+            # Longer than the lease
+            await sleep(0.3)
+
+        await work_queue.put("test", {"id": 1}, b"body")
+        work_queue.start({"test": handler})
+        await wait_for_empty(work_queue)
+        await work_queue.stop()
+
+        assert processed == [1], "The item must be processed once"
+        assert work_queue.replayed == 0
+
+    @pytest.mark.asyncio
+    async def test_retry(self, work_queue):
+        """A failed item is released after a backoff, without waiting the lease"""
+        disable_logger()
+        work_queue.lease = 60
+        attempts = []
+
+        async def handler(metadata: dict, body: bytes) -> None:
+            attempts.append(metadata["id"])
+            if len(attempts) == 1:
+                raise ValueError("Failed")
+
+        await work_queue.put("test", {"id": 1}, b"body")
+        work_queue.start({"test": handler})
+        await wait_for_empty(work_queue)
+        await work_queue.stop()
+
+        assert attempts == [1, 1], "The item must be retried"
+        assert work_queue.completed == 1
+
+    @pytest.mark.asyncio
+    async def test_depth(self, work_queue):
+        """The depth reported by stats is refreshed while there is a backlog"""
+        disable_logger()
+        work_queue.consumers = 1
+        work_queue.lease = 60
+
+        async def handler(metadata: dict, body: bytes) -> None:
+            await sleep(0.02)
+
+        for index in range(10):
+            await work_queue.put("test", {"id": index}, b"body")
+
+        work_queue.start({"test": handler})
+        await sleep(0.1)
+        depth = work_queue.stats()["depth"]
+        assert 0 < depth < 10, "The depth must follow the backlog"
+        await wait_for_empty(work_queue)
+        await work_queue.stop()
@@ -23,7 +23,6 @@ Tests app.internals.iot module
 """
 
 # Standard Library
-from asyncio import Semaphore
 import time
 
 # Test
@@ -33,8 +32,17 @@ import pytest
 import uvloop
 
 # Internal
-from app.internals.iot import end_to_end_position_authentication, store_iot_data
+from app.concurrency.position_authentication import store_semaphore
+from app.internals.iot import (
+    end_to_end_position_authentication,
+    SharedLookups,
+    store_iot_batch,
+    store_iot_data,
+)
 from app.internals.keycloak import KEYCLOAK
+from app.internals.lookup_cache import LOOKUP_CACHE
+from app.internals.position_alteration_detection import haversine
+from app.internals.sessions.ublox_api import UBLOX_API_SESSIONS
 from app.models.iot_feed.iot import IotInput
 
 from app.models.security import Authenticity
@@ -91,13 +99,15 @@ class TestIotFeed:
     async def test_end_to_end_position_authentication(self, mock_aioresponse):
         """Test the behaviour of end_to_end_position_authentication"""
 
-        # Disable the logger of the app
+        # Disable the logger of the app and empty the lookup cache
         disable_logger()
+        LOOKUP_CACHE.clear()
 
         # Setup KEYCLOAK and mock the request
         correct_get_blox_token(mock_aioresponse)
         # during the setup we'll obtain a token that will be stored in cls.last_token
         await KEYCLOAK.setup()
+        await UBLOX_API_SESSIONS.setup()
 
         # Position authentic
         correct_get_raw_data(mock_aioresponse, url=URL_GET_UBLOX, raw_data=RaW_Ublox)
@@ -119,6 +129,7 @@ class TestIotFeed:
         ), "The position is authentic"
 
         # Position Unknown
+        LOOKUP_CACHE.clear()
         correct_get_raw_data(mock_aioresponse, url=URL_GET_UBLOX, raw_data=None)
 
         iot_output = await end_to_end_position_authentication(
@@ -137,7 +148,8 @@ class TestIotFeed:
         ), "The position is unknown"
 
         # Position false fake
-        correct_get_raw_data(mock_aioresponse, url=URL_GET_UBLOX, raw_data="FALSE_FAKE")
+        LOOKUP_CACHE.clear()
+        correct_get_raw_data(mock_aioresponse, url=URL_GET_UBLOX, raw_data="FA15EFA4E0")
         correct_get_ublox_api_list(
             mock_aioresponse, url=URL_POST_UBLOX, raw_data=RaW_Ublox
         )
@@ -158,9 +170,10 @@ class TestIotFeed:
         ), "The position is authentic"
 
         # Position real fake
-        correct_get_raw_data(mock_aioresponse, url=URL_GET_UBLOX, raw_data="FAKE")
+        LOOKUP_CACHE.clear()
+        correct_get_raw_data(mock_aioresponse, url=URL_GET_UBLOX, raw_data="FA4E")
         correct_get_ublox_api_list(
-            mock_aioresponse, url=URL_POST_UBLOX, raw_data="REAL_FAKE"
+            mock_aioresponse, url=URL_POST_UBLOX, raw_data="4EA1FA4E"
         )
 
         iot_output = await end_to_end_position_authentication(
@@ -180,7 +193,8 @@ class TestIotFeed:
 
         # Something went wrong during the request of a single raw_data
         with pytest.raises(HTTPException):
-            # Mock the request
+            # Clear the lookup cache and mock the request
+            LOOKUP_CACHE.clear()
             unreachable_get_raw_data(mock_aioresponse, url=URL_GET_UBLOX)
             await end_to_end_position_authentication(
                 iot_input=IOT_INPUT,
@@ -194,9 +208,10 @@ class TestIotFeed:
 
         # Something went wrong during the request of a List[UbloxApi]
         with pytest.raises(HTTPException):
-            # Mock the requests
+            # Clear the lookup cache and mock the requests
+            LOOKUP_CACHE.clear()
             correct_get_raw_data(
-                mock_aioresponse, url=URL_GET_UBLOX, raw_data="FALSE_FAKE"
+                mock_aioresponse, url=URL_GET_UBLOX, raw_data="FA15EFA4E0"
             )
             unreachable_get_ublox_api_list(mock_aioresponse, url=URL_POST_UBLOX)
             await end_to_end_position_authentication(
@@ -209,20 +224,23 @@ class TestIotFeed:
                 obesrvation_gepid="TEST",
             )
 
-        # Close KEYCLOAK session
+        # Close KEYCLOAK and Ublox-Api sessions
         await KEYCLOAK.close()
+        await UBLOX_API_SESSIONS.close()
 
     @pytest.mark.asyncio
     async def test_store_iot_data(self, mock_aioresponse):
         """Test the behaviour of store_iot_data"""
 
-        # Disable the logger of the app
+        # Disable the logger of the app and empty the lookup cache
         disable_logger()
+        LOOKUP_CACHE.clear()
 
         # Setup KEYCLOAK and mock the request
         correct_get_blox_token(mock_aioresponse)
         # during the setup we'll obtain a token that will be stored in cls.last_token
         await KEYCLOAK.setup()
+        await UBLOX_API_SESSIONS.setup()
 
         # Mock the other requests
         correct_get_raw_data(mock_aioresponse, url=URL_GET_UBLOX, raw_data=RaW_Ublox)
@@ -238,8 +256,81 @@ class TestIotFeed:
             source_app="TEST",
             client_id="TEST",
             user_id="TEST",
-            semaphore=Semaphore(2),
+            semaphore=store_semaphore(),
+        )
+
+        # Close KEYCLOAK and Ublox-Api sessions
+        await KEYCLOAK.close()
+        await UBLOX_API_SESSIONS.close()
+
+    @pytest.mark.asyncio
+    async def test_shared_lookups(self, mock_aioresponse):
+        """Test the lookups shared by the observations"""
+
+        # Disable the logger of the app and empty the lookup cache
+        disable_logger()
+        LOOKUP_CACHE.clear()
+
+        # Setup KEYCLOAK and mock the request
+        correct_get_blox_token(mock_aioresponse)
+        await KEYCLOAK.setup()
+        await UBLOX_API_SESSIONS.setup()
+
+        # Only one request is mocked, the other observations must reuse its answer
+        correct_get_raw_data(mock_aioresponse, url=URL_GET_UBLOX, raw_data=RaW_Ublox)
+
+        location = haversine(
+            IOT_INPUT.result.Position.coordinate[0],
+            IOT_INPUT.result.Position.coordinate[1],
+        )
+        iot_time = int(IOT_INPUT.phenomenonTime.timestamp() * 1000)
+        gnss = IOT_INPUT.result.gnss[0]
+
+        lookups = SharedLookups(KEYCLOAK.last_token)
+        answers = [
+            await lookups.message(gnss.svid, iot_time, location) for _ in range(3)
+        ]
+        assert answers[0] is not None
+        assert answers.count(answers[0]) == 3
+        assert lookups.lookups == 1
+        assert lookups.references == 3
+
+        # Close KEYCLOAK and Ublox-Api sessions
+        await KEYCLOAK.close()
+        await UBLOX_API_SESSIONS.close()
+
+    @pytest.mark.asyncio
+    async def test_store_iot_batch(self, mock_aioresponse):
+        """Test the behaviour of store_iot_batch"""
+
+        # Disable the logger of the app and empty the lookup cache
+        disable_logger()
+        LOOKUP_CACHE.clear()
+
+        # Setup KEYCLOAK and mock the request
+        correct_get_blox_token(mock_aioresponse)
+        await KEYCLOAK.setup()
+        await UBLOX_API_SESSIONS.setup()
+
+        # The observations share the lookup, but are stored one by one
+        correct_get_raw_data(mock_aioresponse, url=URL_GET_UBLOX, raw_data=RaW_Ublox)
+        correct_store_in_iota(mock_aioresponse)
+        correct_store_in_ipt_anonymizer(mock_aioresponse, URL_STORE_IOT_DATA)
+        correct_store_in_ipt_anonymizer(mock_aioresponse, URL_STORE_IOT_DATA)
+
+        # Check if everything went ok
+        await store_iot_batch(
+            iot_inputs=[IOT_INPUT, IOT_INPUT],
+            timestamp=time.time(),
+            host="localhost",
+            batch_id="TEST",
+            obesrvation_gepids=["TEST_1", "TEST_2"],
+            source_app="TEST",
+            client_id="TEST",
+            user_id="TEST",
+            semaphore=store_semaphore(),
         )
 
-        # Close KEYCLOAK session
+        # Close KEYCLOAK and Ublox-Api sessions
         await KEYCLOAK.close()
+        await UBLOX_API_SESSIONS.close()
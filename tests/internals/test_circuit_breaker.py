@@ -0,0 +1,177 @@
+"""
+Tests app.internals.circuit_breaker module
+
+:author: Angelo Cutaia
+:copyright: Copyright 2021, LINKS Foundation
+:version: 1.0.0
+
+..
+
+    Copyright 2021 LINKS Foundation
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+        https://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+# Standard Library
+import asyncio
+
+# Test
+import pytest
+import uvloop
+
+# Internal
+from app.internals.circuit_breaker import _CircuitBreaker, CLOSED, HALF_OPEN, OPEN
+
+from .logger import disable_logger
+
+# ------------------------------------------------------------------------------
+
+
+@pytest.fixture()
+def event_loop():
+    """
+    Set uvloop as the default event loop
+    """
+    loop = uvloop.Loop()
+    yield loop
+    loop.close()
+
+
+def new_breaker(open_time: float) -> _CircuitBreaker:
+    """Circuit breaker that opens after 2 failed calls out of 4"""
+    return _CircuitBreaker(
+        name="Italy",
+        window=4,
+        min_calls=4,
+        failure_rate=0.5,
+        slow_call=1,
+        open_time=open_time,
+        probes=1,
+    )
+
+
+class TestCircuitBreaker:
+    """
+    Test the circuit_breaker module
+    """
+
+    @pytest.mark.asyncio
+    async def test_open(self):
+        """Test the opening of the circuit"""
+        disable_logger()
+        breaker = new_breaker(open_time=60)
+
+        for _ in range(3):
+            assert await breaker.allow(), "The circuit is closed"
+            await breaker.record(success=True, seconds=0.1)
+        assert breaker.state == CLOSED
+
+        # A slow call is a failure
+        await breaker.record(success=True, seconds=2)
+        assert breaker.state == CLOSED, "Only one failure out of 4"
+        await breaker.record(success=False, seconds=0.1)
+        assert breaker.state == OPEN, "Two failures out of 4"
+
+        assert not await breaker.allow(), "The circuit is open"
+        assert breaker.stats()["rejected"] == 1
+
+    @pytest.mark.asyncio
+    async def test_half_open(self):
+        """Test the probes of the half open circuit"""
+        disable_logger()
+        breaker = new_breaker(open_time=0)
+
+        for _ in range(4):
+            await breaker.record(success=False, seconds=0.1)
+        assert breaker.state == OPEN
+
+        # The cool down is over, only one probe at a time
+        assert await breaker.allow(), "The probe must be allowed"
+        assert breaker.state == HALF_OPEN
+        assert not await breaker.allow(), "Only one probe allowed"
+
+        # A failed probe opens the circuit again
+        await breaker.record(success=False, seconds=0.1)
+        assert breaker.state == OPEN
+        assert breaker.stats()["opened"] == 2
+
+        # A cancelled probe frees its slot
+        assert await breaker.allow()
+        breaker.release()
+        assert await breaker.allow()
+
+        # A successful probe closes the circuit
+        await breaker.record(success=True, seconds=0.1)
+        assert breaker.state == CLOSED
+        assert breaker.stats()["calls"] == 0, "The outcomes are forgotten"
+
+    @pytest.mark.asyncio
+    async def test_concurrent_probes(self):
+        """Test that concurrent callers run the transition only once"""
+        disable_logger()
+        breaker = new_breaker(open_time=0)
+
+        for _ in range(4):
+            await breaker.record(success=False, seconds=0.1)
+        assert breaker.state == OPEN
+
+        release = asyncio.Event()
+
+        async def call() -> bool:
+            if not await breaker.allow():
+                return False
+            await release.wait()
+            await breaker.record(success=False, seconds=0.1)
+            return True
+
+        calls = [asyncio.ensure_future(call()) for _ in range(5)]
+        await asyncio.sleep(0)
+        assert breaker.probes_in_flight == 1, "Only one probe allowed"
+        assert breaker.stats()["rejected"] == 4
+
+        release.set()
+        allowed = await asyncio.gather(*calls)
+        assert allowed.count(True) == 1
+        assert breaker.state == OPEN
+        assert breaker.stats()["opened"] == 2, "Opened once by the probe"
+
+    @pytest.mark.asyncio
+    async def test_late_call(self):
+        """Test that a call allowed while closed isn't taken for a probe"""
+        disable_logger()
+        breaker = new_breaker(open_time=0)
+        release = asyncio.Event()
+
+        async def late_call() -> None:
+            assert await breaker.allow()
+            await release.wait()
+            await breaker.record(success=True, seconds=0.1)
+
+        late = asyncio.ensure_future(late_call())
+        await asyncio.sleep(0)
+        for _ in range(4):
+            await breaker.record(success=False, seconds=0.1)
+        assert breaker.state == OPEN
+
+        # The probe is in flight when the late call ends
+        assert await breaker.allow()
+        assert breaker.state == HALF_OPEN
+        release.set()
+        await late
+        assert breaker.state == HALF_OPEN, "Only the probe closes the circuit"
+        assert breaker.probes_in_flight == 1
+        assert not await breaker.allow(), "The probe slot is still taken"
+
+        await breaker.record(success=True, seconds=0.1)
+        assert breaker.state == CLOSED
+        assert breaker.probes_in_flight == 0
@@ -22,6 +22,9 @@ Tests app.internals.keycloak module
     limitations under the License.
 """
 
+# Standard Library
+from asyncio import gather, sleep
+
 # Test
 from aioresponses import aioresponses
 from fastapi import HTTPException
@@ -29,10 +32,12 @@ import pytest
 import uvloop
 
 # Internal
+from app.config import get_keycloak_settings
 from app.internals.keycloak import KEYCLOAK
 from .logger import disable_logger
 from ..mock.keycloak.keycloak import (
     correct_get_blox_token,
+    jwt_get_blox_token,
     new_correct_get_blox_token,
     unreachable_get_ublox_token,
     unauthorized_get_ublox_token,
@@ -101,3 +106,45 @@ class TestKEYCLOAK:
             await KEYCLOAK.get_ublox_token()
 
         await KEYCLOAK.close()
+
+    @pytest.mark.asyncio
+    async def test_refresh_ahead(self, mock_aioresponse, monkeypatch):
+        """Test the background refresh of the token ahead of its expiration"""
+
+        # Disable the logger of the app
+        disable_logger()
+
+        # Refresh almost immediately
+        monkeypatch.setattr(get_keycloak_settings(), "token_refresh_ratio", 0.001)
+
+        # The lifetime is read from the token
+        jwt_get_blox_token(mock_aioresponse, lifetime=100)
+        await KEYCLOAK.setup()
+        expected = 100 - get_keycloak_settings().token_expiry_margin
+        assert KEYCLOAK.token_lifetime == expected, "Lifetime from the exp claim"
+
+        # The token is swapped in background
+        new_correct_get_blox_token(mock_aioresponse)
+        await sleep(0.5)
+        assert KEYCLOAK.last_token == "NEW_TOKEN", "Token must be refreshed"
+        assert KEYCLOAK.token_lifetime == 150, "Default lifetime expected"
+
+        await KEYCLOAK.close()
+
+    @pytest.mark.asyncio
+    async def test_single_refresh(self, mock_aioresponse):
+        """Test that the waiters of an expired token share one keycloak request"""
+
+        # Disable the logger of the app
+        disable_logger()
+
+        correct_get_blox_token(mock_aioresponse)
+        await KEYCLOAK.setup()
+
+        # Expire the token, only one request is mocked
+        KEYCLOAK.last_token_reception_time = 0
+        new_correct_get_blox_token(mock_aioresponse)
+        tokens = await gather(*[KEYCLOAK.get_ublox_token() for _ in range(5)])
+        assert tokens == ["NEW_TOKEN"] * 5, "Token must be shared"
+
+        await KEYCLOAK.close()
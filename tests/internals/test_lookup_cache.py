@@ -0,0 +1,169 @@
+"""
+Tests app.internals.lookup_cache module
+
+:author: Angelo Cutaia
+:copyright: Copyright 2021, LINKS Foundation
+:version: 1.0.0
+
+..
+
+    Copyright 2021 LINKS Foundation
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+        https://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+# Standard Library
+import time
+
+# Internal
+from app.internals.lookup_cache import _LookupCache
+from app.models.galileo.ublox_api import UbloxAPI, UbloxAPIWindow
+
+# ------------------------------------------------------------------------------
+
+KEY = ("Italy", "galileo", 12, 1611819619151)
+""" Key of the message of interest """
+
+
+class TestLookupCache:
+    """
+    Test the lookup_cache module
+    """
+
+    def test_lookup_and_store(self):
+        """Test hits and misses of the cache"""
+        cache = _LookupCache(max_size=10, ttl=60, negative_ttl=60, max_timeline_size=10)
+
+        assert cache.lookup(KEY) == (False, None), "The cache is empty"
+
+        cache.store(KEY, b"RAW_DATA")
+        assert cache.lookup(KEY) == (True, b"RAW_DATA"), "Raw data must be cached"
+
+        # None answers are cached too
+        cache.store(KEY, None)
+        assert cache.lookup(KEY) == (True, None), "None answer must be cached"
+
+        assert cache.stats()["hits"] == 2, "Two hits expected"
+        assert cache.stats()["misses"] == 1, "One miss expected"
+
+    def test_eviction(self):
+        """Test the LRU eviction policy"""
+        cache = _LookupCache(max_size=2, ttl=60, negative_ttl=60, max_timeline_size=10)
+
+        cache.store(("Italy", "galileo", 1, 0), b"FIRST")
+        cache.store(("Italy", "galileo", 2, 0), b"SECOND")
+
+        # Use the first one so that the second becomes the least recently used
+        cache.lookup(("Italy", "galileo", 1, 0))
+        cache.store(("Italy", "galileo", 3, 0), b"THIRD")
+
+        assert cache.lookup(("Italy", "galileo", 1, 0))[0], "Recently used"
+        assert not cache.lookup(("Italy", "galileo", 2, 0))[0], "Must be evicted"
+        assert cache.stats()["evictions"] == 1, "One eviction expected"
+
+    def test_negative_ttl(self):
+        """Test that None answers expire before the raw data"""
+        cache = _LookupCache(
+            max_size=10, ttl=60, negative_ttl=0.01, max_timeline_size=10
+        )
+
+        cache.store(KEY, None)
+        cache.store(("Italy", "galileo", 1, 0), b"RAW_DATA")
+        time.sleep(0.02)
+
+        assert cache.lookup(KEY) == (False, None), "None answer must be expired"
+        assert cache.lookup(("Italy", "galileo", 1, 0)) == (
+            True,
+            b"RAW_DATA",
+        ), "Raw data must be still valid"
+        assert cache.stats()["expirations"] == 1, "One expiration expected"
+
+        cache.clear()
+        assert cache.stats()["size"] == 0, "The cache must be empty"
+
+    def test_window(self):
+        """Test the timeline of a satellite fed by the window requests"""
+        cache = _LookupCache(max_size=10, ttl=60, negative_ttl=60, max_timeline_size=10)
+        key = ("Italy", "galileo", 12)
+
+        # Nothing was fetched yet
+        assert cache.window_missing(key, [1000, 2000, 3000]) == [1000, 2000, 3000]
+        cache.window_store(
+            key,
+            [1000, 2000, 3000],
+            [
+                UbloxAPI(timestamp=1000, raw_data=b"FIRST"),
+                UbloxAPI(timestamp=2000, raw_data=None),
+                UbloxAPI(timestamp=3000, raw_data=b"THIRD"),
+            ],
+        )
+
+        # An overlapping window asks only the new timestamps
+        assert cache.window_missing(key, [2000, 3000, 4000]) == [4000]
+        assert cache.stats()["window_reused"] == 2, "Two timestamps reused"
+
+        window = UbloxAPIWindow(cache.window(key, [1000, 2000]))
+        assert window == [
+            {"timestamp": 1000, "raw_data": b"FIRST"}
+        ], "Only the stored raw data in the window"
+        assert b"FIRST" in window.payloads and b"THIRD" not in window.payloads
+
+    def test_window_trim(self):
+        """Test that the timeline keeps only the most recent timestamps"""
+        cache = _LookupCache(max_size=10, ttl=60, negative_ttl=60, max_timeline_size=4)
+        key = ("Italy", "galileo", 12)
+
+        timestamps = [1000, 2000, 3000, 4000, 5000]
+        cache.window_store(
+            key,
+            timestamps,
+            [
+                UbloxAPI(timestamp=time, raw_data=str(time).encode())
+                for time in timestamps
+            ],
+        )
+
+        assert cache.window_missing(key, timestamps) == [
+            1000,
+            2000,
+            3000,
+        ], "Oldest timestamps must be dropped"
+        assert cache.window(key, timestamps) == [
+            {"timestamp": 4000, "raw_data": b"4000"},
+            {"timestamp": 5000, "raw_data": b"5000"},
+        ]
+
+    def test_window_overlapping_grids(self):
+        """Test that a window serves only its own grid, not the one of another position"""
+        cache = _LookupCache(
+            max_size=10, ttl=60, negative_ttl=60, max_timeline_size=100
+        )
+        key = ("Italy", "galileo", 12)
+
+        first = [-3000, -1000, 3000, 5000, 7000]
+        cache.window_store(
+            key,
+            first,
+            [UbloxAPI(timestamp=time, raw_data=str(time).encode()) for time in first],
+        )
+
+        second = [-3500, -1500, 500, 4500, 6500, 8500]
+        assert cache.window_missing(key, second) == second, "Different grid"
+        assert cache.window(key, second) == [], "Nothing of the other grid"
+
+        # Ublox-Api answered with a timestamp near the requested one
+        cache.window_store(key, second, [UbloxAPI(timestamp=600, raw_data=b"NEAR")])
+        assert cache.window(key, second) == [{"timestamp": 600, "raw_data": b"NEAR"}]
+        assert cache.window(key, first) == [
+            {"timestamp": time, "raw_data": str(time).encode()} for time in first
+        ], "The first grid is untouched"
@@ -22,8 +22,11 @@ Tests app.internals.position_alteration_detection module
     limitations under the License.
 """
 
+# Standard Library
+from array import array
+
 # Internal
-from app.internals.position_alteration_detection import haversine
+from app.internals.position_alteration_detection import haversine, meaconing
 
 # -------------------------------------------------------------------------------
 
@@ -40,3 +43,19 @@ def test_haversine():
     assert (
         haversine(STOCKHOLM["lat"], STOCKHOLM["lon"]) == "Sweden"
     ), "Stockholm is in Sweden"
+
+
+def test_meaconing():
+    """Test meaconing"""
+    auth = bytearray([1, 1, 0, 1, 1, 1])
+    fullbiasnano = array("q", [-100, -100, 0, -100, 99_900, -90])
+    timenano = array("q", [1_000, 1_000, 0, 1_000, 2_000, 2_000])
+    assert meaconing(auth, fullbiasnano, timenano, 50) == [
+        False,
+        True,
+        False,
+        False,
+        True,
+        False,
+    ], "Wrong meaconing verdicts"
+    assert meaconing(bytearray(), array("q"), array("q"), 50) == [], "Empty trace"
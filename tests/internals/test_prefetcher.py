@@ -0,0 +1,190 @@
+"""
+Tests app.internals.prefetcher module
+
+:author: Angelo Cutaia
+:copyright: Copyright 2021, LINKS Foundation
+:version: 1.0.0
+
+..
+
+    Copyright 2021 LINKS Foundation
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+        https://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+# Standard Library
+import time
+
+# Test
+from aioresponses import aioresponses
+import pytest
+import uvloop
+
+# Internal
+from app.internals.keycloak import KEYCLOAK
+from app.internals.lookup_cache import LOOKUP_CACHE
+from app.internals.prefetcher import _Prefetcher, PREFETCHER
+from app.internals.sessions.ublox_api import UBLOX_API_SESSIONS
+from app.internals.ublox_api import get_galileo_message, refresh_prefetched_messages
+from app.models.galileo.ublox_api import UbloxAPI
+
+from .logger import disable_logger
+from ..mock.keycloak.keycloak import correct_get_blox_token
+from ..mock.ublox_api.constants import (
+    RaW_Galileo,
+    RaW_Galileo_Bytes,
+    SvID,
+    LOCATION,
+    URL_POST_GALILEO,
+)
+from ..mock.ublox_api.get_ublox_api_list import echo_get_ublox_api_list
+
+# ------------------------------------------------------------------------------
+
+KEY = (LOCATION, "galileo", SvID)
+""" Satellite of interest """
+
+
+@pytest.fixture()
+def event_loop():
+    """
+    Set uvloop as the default event loop
+    """
+    loop = uvloop.Loop()
+    yield loop
+    loop.close()
+
+
+@pytest.fixture
+def mock_aioresponse():
+    with aioresponses() as m:
+        yield m
+
+
+async def idle() -> int:
+    """Refresh that never contacts Ublox-Api"""
+    return 0
+
+
+class TestPrefetcher:
+    """
+    Test the prefetcher module
+    """
+
+    @pytest.mark.asyncio
+    async def test_store(self):
+        """Test that only the exact grid timestamps reach the lookup cache"""
+        LOOKUP_CACHE.clear()
+        prefetcher = _Prefetcher(interval=60, horizon=60, step=1000, budget=1)
+
+        # Not running, nothing is observed
+        prefetcher.observe(KEY)
+        assert not prefetcher.visible
+
+        prefetcher.start(idle)
+        try:
+            prefetcher.store(
+                KEY,
+                [1000, 2000, 3000],
+                [
+                    UbloxAPI(timestamp=1000, raw_data=b"PAGE_1"),
+                    UbloxAPI(timestamp=2000, raw_data=b"PAGE_1"),
+                    UbloxAPI(timestamp=2500, raw_data=b"PAGE_2"),
+                ],
+            )
+
+            assert LOOKUP_CACHE.lookup((*KEY, 1000)) == (True, b"PAGE_1")
+            assert LOOKUP_CACHE.lookup((*KEY, 3000)) == (True, None), "No answer"
+            assert LOOKUP_CACHE.lookup((*KEY, 1500)) == (False, None), "Not inferred"
+            assert LOOKUP_CACHE.lookup((*KEY, 2500)) == (False, None), "Not requested"
+            assert LOOKUP_CACHE.window_missing(KEY, [1000, 2000, 4000]) == [4000]
+            assert LOOKUP_CACHE.window(KEY, [1000, 2000, 3000]) == [
+                {"timestamp": 1000, "raw_data": b"PAGE_1"},
+                {"timestamp": 2000, "raw_data": b"PAGE_1"},
+            ]
+            assert prefetcher.stats()["stored"] == 3
+
+            # A prefetched message served by the lookup cache is a hit, once
+            prefetcher.hit((*KEY, 1000))
+            prefetcher.hit((*KEY, 1000))
+            prefetcher.hit((*KEY, 2500))
+            assert prefetcher.stats()["hits"] == 1
+            assert prefetcher.stats()["hit_ratio"] == 1 / 3
+        finally:
+            await prefetcher.stop()
+            LOOKUP_CACHE.clear()
+
+    @pytest.mark.asyncio
+    async def test_due(self):
+        """Test the grid timestamps to fetch within the budget"""
+        prefetcher = _Prefetcher(interval=60, horizon=60, step=1000, budget=1)
+        prefetcher.start(idle)
+
+        try:
+            prefetcher.observe(KEY)
+            prefetcher.observe((LOCATION, "ublox", SvID))
+            due = prefetcher.due()
+            assert len(due) == 1, "Only one request allowed by the budget"
+            assert prefetcher.stats()["skipped"] == 1
+
+            key, timestamps = due[0]
+            assert len(timestamps) in (60, 61), "The whole horizon is due"
+            assert timestamps[-1] <= time.time() * 1000
+
+            # Only the new grid timestamps are due once stored
+            prefetcher.store(key, timestamps, [])
+            for other_key, other_timestamps in prefetcher.due():
+                if other_key == key:
+                    assert len(other_timestamps) <= 1
+        finally:
+            await prefetcher.stop()
+            assert not prefetcher.visible, "Stop must forget the satellites"
+
+    @pytest.mark.asyncio
+    async def test_refresh(self, mock_aioresponse):
+        """Test the refresh of the visible satellites through the list endpoint"""
+        disable_logger()
+        LOOKUP_CACHE.clear()
+
+        correct_get_blox_token(mock_aioresponse)
+        await KEYCLOAK.setup()
+        await UBLOX_API_SESSIONS.setup()
+        PREFETCHER.start(idle)
+
+        try:
+            PREFETCHER.observe(KEY)
+            echo_get_ublox_api_list(
+                mock_aioresponse, url=URL_POST_GALILEO, raw_data=RaW_Galileo
+            )
+            assert await refresh_prefetched_messages() == 1, "One request expected"
+
+            # A recent grid timestamp is answered without contacting Ublox-Api
+            now = int(time.time() * 1000)
+            assert (
+                await get_galileo_message(
+                    svid=SvID,
+                    timestamp=now - now % 1000 - 10000,
+                    ublox_token="TOKEN",
+                    location=LOCATION,
+                    session=UBLOX_API_SESSIONS.get(LOCATION),
+                )
+                == RaW_Galileo_Bytes
+            )
+            assert LOOKUP_CACHE.stats()["hits"] == 1
+            assert PREFETCHER.stats()["hits"] == 1, "The prefetch must pay off"
+            assert 0 < PREFETCHER.stats()["hit_ratio"] < 1
+        finally:
+            LOOKUP_CACHE.clear()
+            await PREFETCHER.stop()
+            await UBLOX_API_SESSIONS.close()
+            await KEYCLOAK.close()
@@ -0,0 +1,159 @@
+"""
+Tests app.internals.reference_store module
+
+:author: Angelo Cutaia
+:copyright: Copyright 2021, LINKS Foundation
+:version: 1.0.0
+
+..
+
+    Copyright 2021 LINKS Foundation
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+        https://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+# Test
+from aioresponses import aioresponses
+import pytest
+import uvloop
+
+# Internal
+from app.internals import ublox_api
+from app.internals.lookup_cache import LOOKUP_CACHE
+from app.internals.reference_store import _LocalReferenceStore, ingest
+from app.internals.sessions.ublox_api import get_ublox_api_session
+from app.models.galileo.ublox_api import UbloxAPI
+
+from ..mock.ublox_api.constants import (
+    RaW_Galileo,
+    RaW_Galileo_Bytes,
+    RaW_Ublox,
+    RaW_Ublox_Bytes,
+    SvID,
+    LOCATION,
+)
+
+# ------------------------------------------------------------------------------
+
+KEY = (LOCATION, "galileo", SvID)
+""" Satellite of interest """
+
+
+@pytest.fixture()
+def event_loop():
+    """
+    Set uvloop as the default event loop
+    """
+    loop = uvloop.Loop()
+    yield loop
+    loop.close()
+
+
+@pytest.fixture
+def store(tmp_path):
+    """Reference store with the messages of a satellite between 1000 and 5000"""
+    ingest(
+        str(tmp_path),
+        KEY,
+        [
+            [
+                UbloxAPI(timestamp=1000, raw_data=RaW_Galileo),
+                UbloxAPI(timestamp=3000, raw_data=None),
+                UbloxAPI(timestamp=5000, raw_data=RaW_Ublox),
+            ]
+        ],
+    )
+    store = _LocalReferenceStore(root=str(tmp_path), refresh=0)
+    yield store
+    store.close()
+
+
+class TestReferenceStore:
+    """
+    Test the reference_store module
+    """
+
+    def test_lookup(self, store):
+        """Test the lookup of a single message"""
+        assert store.lookup((*KEY, 1000)) == (True, RaW_Galileo_Bytes)
+        assert store.lookup((*KEY, 5000)) == (True, RaW_Ublox_Bytes), "Variable width"
+        assert store.lookup((*KEY, 2000)) == (True, RaW_Galileo_Bytes), "Valid at 2000"
+
+        # Ublox-Api had no message, it's asked again
+        assert store.lookup((*KEY, 3000)) == (False, None)
+        assert store.lookup((*KEY, 4000)) == (False, None)
+
+        # Outside of the ingested range or of the ingested satellites
+        assert store.lookup((*KEY, 7000)) == (False, None)
+        assert store.lookup((LOCATION, "galileo", SvID + 1, 1000)) == (False, None)
+        assert store.stats()["hits"] == 3 and store.stats()["misses"] == 4
+
+    def test_window(self, store):
+        """Test the lookup of a window of messages"""
+        assert store.window(KEY, [1000, 2000, 5000]) == [
+            {"timestamp": 1000, "raw_data": RaW_Galileo_Bytes},
+            {"timestamp": 2000, "raw_data": RaW_Galileo_Bytes},
+            {"timestamp": 5000, "raw_data": RaW_Ublox_Bytes},
+        ]
+        assert store.window(KEY, [1000, 3000]) is None, "Message missing"
+        assert store.window(KEY, [0, 1000]) is None, "Window not covered"
+
+    def test_ingest(self, store, tmp_path):
+        """Test that a new ingestion is merged and mapped again"""
+        assert (
+            ingest(
+                str(tmp_path),
+                KEY,
+                [
+                    [
+                        UbloxAPI(timestamp=3000, raw_data=RaW_Galileo),
+                        UbloxAPI(timestamp=7000, raw_data=None),
+                    ],
+                    [
+                        UbloxAPI(timestamp=20000, raw_data=RaW_Ublox),
+                        UbloxAPI(timestamp=22000, raw_data=None),
+                    ],
+                ],
+            )
+            == 4
+        ), "Messages must be merged"
+
+        assert store.lookup((*KEY, 3000)) == (True, RaW_Galileo_Bytes)
+        assert store.lookup((*KEY, 1000)) == (True, RaW_Galileo_Bytes)
+        assert store.lookup((*KEY, 6000)) == (True, RaW_Ublox_Bytes), "Range extended"
+        assert store.lookup((*KEY, 21000)) == (True, RaW_Ublox_Bytes)
+
+        # The gap between the grids isn't covered
+        assert store.lookup((*KEY, 10000)) == (False, None)
+
+    @pytest.mark.asyncio
+    async def test_backend(self, store, monkeypatch):
+        """Test that Ublox-Api isn't contacted when the store covers the lookup"""
+        LOOKUP_CACHE.clear()
+        monkeypatch.setattr(ublox_api, "REFERENCE_BACKEND", store)
+        monkeypatch.setattr(ublox_api.SETTINGS, "window", 2000)
+
+        # Any request to Ublox-Api would fail
+        with aioresponses():
+            async with get_ublox_api_session() as session:
+                assert (
+                    await ublox_api.get_galileo_message(
+                        SvID, 1000, "TOKEN", LOCATION, session
+                    )
+                    == RaW_Galileo_Bytes
+                )
+                window = await ublox_api.get_galileo_messages_list(
+                    SvID, 3000, "TOKEN", LOCATION, session
+                )
+                assert RaW_Galileo_Bytes in window.payloads
+                assert RaW_Ublox_Bytes in window.payloads
@@ -0,0 +1,83 @@
+"""
+Tests app.internals.sampling module
+
+:author: Angelo Cutaia
+:copyright: Copyright 2021, LINKS Foundation
+:version: 1.0.0
+
+..
+
+    Copyright 2021 LINKS Foundation
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+        https://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+
+# Standard Library
+import random
+
+# Internal
+from app.internals.sampling import estimate_authenticity, stratified_sample
+
+# ------------------------------------------------------------------------------
+
+
+class TestSampling:
+    """
+    Test the sampling module
+    """
+
+    def test_stratified_sample(self):
+        """Test the positions picked along the trace"""
+        trace_indexes = list(range(1000))
+        meaconed = [False] * 1000
+
+        sample = stratified_sample(
+            trace_indexes, meaconed, 100, 10, 2, rng=random.Random(0)
+        )
+        assert [size for size, _ in sample] == [100] * 10, "Strata of equal size"
+        assert [len(sampled) for _, sampled in sample] == [10] * 10
+        for stratum, (_, sampled) in enumerate(sample):
+            assert all(
+                stratum * 100 <= index < (stratum + 1) * 100 for index in sampled
+            )
+
+        # The first stratum is suspicious, so it gets more positions
+        meaconed[50] = True
+        sample = stratified_sample(
+            trace_indexes, meaconed, 100, 10, 2, rng=random.Random(0)
+        )
+        assert len(sample[0][1]) == 18, "Suspicious stratum oversampled"
+        assert sum(len(sampled) for _, sampled in sample) <= 100, "Bounded cost"
+
+        # Every stratum gets at least one position
+        sample = stratified_sample(trace_indexes, meaconed, 1, 10, 2)
+        assert all(len(sampled) == 1 for _, sampled in sample)
+
+        assert stratified_sample([], [], 100, 10, 2) == [], "Nothing to sample"
+
+    def test_estimate_authenticity(self):
+        """Test the extrapolation of the verdict of the journey"""
+        assert estimate_authenticity([(100, 0, 0)], 1.96) is None, "Nothing verified"
+
+        # Every position was verified, no uncertainty
+        assert estimate_authenticity([(10, 7, 3)], 1.96) == (0.7, 0.7, 0.7)
+
+        # The strata are weighted by their size
+        ratio, low, high = estimate_authenticity([(900, 10, 0), (100, 0, 10)], 1.96)
+        assert ratio == 0.9, "Weighted ratio expected"
+        assert low == high == 0.9, "Homogeneous strata"
+
+        ratio, low, high = estimate_authenticity([(1000, 5, 5)], 1.96)
+        assert ratio == 0.5
+        assert 0 <= low < 0.5 < high <= 1, "Confidence bounds expected"
@@ -0,0 +1,113 @@
+"""
+Tests app.internals.shared_cache module
+
+:author: Angelo Cutaia
+:copyright: Copyright 2021, LINKS Foundation
+:version: 1.0.0
+
+..
+
+    Copyright 2021 LINKS Foundation
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+        https://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+# Standard Library
+import multiprocessing
+import time
+
+# Internal
+from app.internals.shared_cache import _SharedMemoryCache, SharedCache
+
+# ------------------------------------------------------------------------------
+
+KEY = ("Italy", "galileo", 12, 1611819619151)
+""" Key of the message of interest """
+
+
+def shared_cache(**kwargs) -> _SharedMemoryCache:
+    """Shared cache with the settings of the test"""
+    settings = {
+        "slots": 16,
+        "slot_size": 32,
+        "probe": 4,
+        "ttl": 60,
+        "negative_ttl": 60,
+    }
+    settings.update(kwargs)
+    return _SharedMemoryCache(**settings)
+
+
+class TestSharedCache:
+    """
+    Test the shared_cache module
+    """
+
+    def test_disabled(self):
+        """The default cache stores nothing"""
+        cache = SharedCache()
+        cache.store(KEY, b"FA4E")
+        assert cache.lookup(KEY) == (False, None)
+
+    def test_lookup(self):
+        """Raw data and None answers are found"""
+        cache = shared_cache()
+        assert cache.lookup(KEY) == (False, None), "Empty cache"
+
+        cache.store(KEY, b"FA4E")
+        assert cache.lookup(KEY) == (True, b"FA4E")
+
+        # Overwrite the same key
+        cache.store(KEY, None)
+        assert cache.lookup(KEY) == (True, None)
+        assert cache.stats()["hits"] == 2
+
+        # Too large for a slot
+        other = (*KEY[:3], KEY[3] + 1)
+        cache.store(other, bytes(33))
+        assert cache.lookup(other) == (False, None)
+        assert cache.stats()["skipped"] == 1
+
+    def test_expiration(self):
+        """Expired entries are not found"""
+        cache = shared_cache(ttl=0.01)
+        cache.store(KEY, b"FA4E")
+        time.sleep(0.02)
+        assert cache.lookup(KEY) == (False, None)
+
+    def test_clock_eviction(self):
+        """The entries not referenced since the last sweep are evicted first"""
+        cache = shared_cache(slots=2, probe=2)
+        keys = [(*KEY[:3], KEY[3] + index) for index in range(4)]
+
+        cache.store(keys[0], b"0")
+        cache.store(keys[1], b"1")
+        # The sweep clears both bits and evicts one of the two entries
+        cache.store(keys[2], b"2")
+        # Only the entry just stored has the bit set, so the other one is evicted
+        cache.store(keys[3], b"3")
+
+        assert [cache.lookup(key)[0] for key in keys] == [False, False, True, True]
+        assert cache.stats()["evictions"] == 2
+
+    def test_shared_between_processes(self):
+        """An entry stored by a forked worker is found by the others"""
+        cache = shared_cache()
+
+        context = multiprocessing.get_context("fork")
+        worker = context.Process(target=cache.store, args=(KEY, b"FA4E"))
+        worker.start()
+        worker.join()
+
+        assert worker.exitcode == 0
+        assert cache.lookup(KEY) == (True, b"FA4E")
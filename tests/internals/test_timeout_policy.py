@@ -0,0 +1,132 @@
+"""
+Tests app.internals.timeout_policy module
+
+:author: Angelo Cutaia
+:copyright: Copyright 2021, LINKS Foundation
+:version: 1.0.0
+
+..
+
+    Copyright 2021 LINKS Foundation
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+        https://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+# Test
+import pytest
+
+# Internal
+from app.internals import timeout_policy
+from app.internals.latency import _LatencyTracker
+from app.internals.timeout_policy import _TimeoutPolicy
+
+# ------------------------------------------------------------------------------
+
+
+def new_policy() -> _TimeoutPolicy:
+    """Timeout policy that trusts the latencies after 4 samples"""
+    return _TimeoutPolicy(
+        bounds={"ublox_api": (6, 1, 20)},
+        percentile=99,
+        factor=3,
+        latency=_LatencyTracker(window=4, min_samples=4),
+    )
+
+
+class TestTimeoutPolicy:
+    """
+    Test the timeout_policy module
+    """
+
+    def test_timeout(self):
+        """Test the deadlines derived from the latencies"""
+        policy = new_policy()
+
+        # Too few latencies, the default is used
+        assert policy.timeout("ublox_api") == 6, "Default deadline expected"
+
+        # Healthy period, fail fast
+        for _ in range(4):
+            policy.latency.observe("ublox_api", 0.5)
+        assert policy.timeout("ublox_api") == 1.5, "p99 x factor expected"
+
+        # Even healthier, the minimum applies
+        for _ in range(4):
+            policy.latency.observe("ublox_api", 0.1)
+        assert policy.timeout("ublox_api") == 1, "Min deadline expected"
+
+        # Slow but alive, the maximum applies
+        for _ in range(4):
+            policy.latency.observe("ublox_api", 10)
+        assert policy.timeout("ublox_api") == 20, "Max deadline expected"
+
+        # The latencies of a server use the bounds of its endpoint
+        assert policy.timeout("ublox_api", "https://italy") == 6
+        assert policy.stats() == {"ublox_api": 20, "https://italy": 6}
+
+    def test_deadline(self):
+        """Test that the latencies of the successful and failed calls are recorded"""
+        policy = new_policy()
+
+        with policy.deadline("ublox_api") as timeout:
+            assert timeout == 6, "Default deadline expected"
+        assert policy.latency.stats()["ublox_api"]["samples"] == 1
+
+        with pytest.raises(TimeoutError):
+            with policy.deadline("ublox_api"):
+                raise TimeoutError
+        assert policy.latency.stats()["ublox_api"]["samples"] == 2
+
+    def test_deadline_growth(self, monkeypatch):
+        """Test that the deadline grows when the upstream gets slower than it"""
+        policy = new_policy()
+        clock = [0.0]
+        monkeypatch.setattr(timeout_policy.time, "monotonic", lambda: clock[0])
+
+        def call(seconds: float) -> None:
+            """Call lasting the given seconds, or timing out"""
+            with policy.deadline("ublox_api") as timeout:
+                clock[0] += min(seconds, timeout)
+                if seconds > timeout:
+                    raise TimeoutError
+
+        for _ in range(4):
+            call(0.5)
+        assert policy.timeout("ublox_api") == 1.5
+
+        # Slow but alive, the calls time out at first
+        timeouts = 0
+        while policy.timeout("ublox_api") <= 10:
+            with pytest.raises(TimeoutError):
+                call(10)
+            timeouts += 1
+            assert timeouts < 10, "The deadline must grow above the latency"
+
+        # Then they succeed again
+        call(10)
+        assert policy.timeout("ublox_api") == 20, "Max deadline expected"
+
+    def test_percentile_refresh(self):
+        """Test that the percentiles are computed again only after some latencies"""
+        latency = _LatencyTracker(window=100, min_samples=10, refresh=5)
+
+        for _ in range(10):
+            latency.observe("ublox_api", 1)
+        assert latency.percentile("ublox_api", 99) == 1
+
+        for _ in range(4):
+            latency.observe("ublox_api", 10)
+        assert latency.percentile("ublox_api", 99) == 1, "Not refreshed yet"
+
+        latency.observe("ublox_api", 10)
+        assert latency.percentile("ublox_api", 99) == 10, "Refreshed"
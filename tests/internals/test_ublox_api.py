@@ -22,6 +22,9 @@ Tests app.internals.ublox_api module
     limitations under the License.
 """
 
+# Standard Library
+from asyncio import gather
+
 # Test
 from aioresponses import aioresponses
 from fastapi import HTTPException
@@ -35,9 +38,22 @@ from app.internals.ublox_api import (
     get_galileo_messages_list,
     get_ublox_messages_list,
     construct_request,
+    prefetch_galileo_messages,
+    AGGREGATOR,
+    HEDGING,
+    SETTINGS,
+    SINGLE_FLIGHT,
+    URL_GALILEO,
+    URL_UBLOX,
 )
+from app.internals.circuit_breaker import CIRCUIT_BREAKERS, OPEN
 from app.internals.keycloak import KEYCLOAK
-from app.internals.sessions.ublox_api import get_ublox_api_session
+from app.internals.lookup_cache import LOOKUP_CACHE
+from app.internals.shared_cache import _SharedMemoryCache
+from app.internals.sessions.ublox_api import (
+    get_ublox_api_session,
+    UBLOX_API_SESSIONS,
+)
 
 from .logger import disable_logger
 from ..mock.ublox_api.constants import (
@@ -46,21 +62,27 @@ from ..mock.ublox_api.constants import (
     URL_POST_UBLOX,
     URL_POST_GALILEO,
     RaW_Galileo,
+    RaW_Galileo_Bytes,
     RaW_Ublox,
+    RaW_Ublox_Bytes,
     SvID,
     TIMESTAMP,
     LOCATION,
     NUMBER_REQUESTED_DATA,
+    URL_SWEDEN_GALILEO,
+    URL_SWEDEN_UBLOX,
 )
 
 from ..mock.keycloak.constants import FAKE_TOKEN_FOR_TESTING
 from ..mock.ublox_api.get_raw_data import (
     correct_get_raw_data,
     unreachable_get_raw_data,
+    slow_get_raw_data,
     token_expired_get_raw_data,
 )
 from ..mock.ublox_api.get_ublox_api_list import (
     correct_get_ublox_api_list,
+    echo_get_ublox_api_list,
     unreachable_get_ublox_api_list,
     token_expired_get_ublox_api_list,
 )
@@ -93,8 +115,9 @@ class TestUbloxApi:
     async def test_get_galileo_message(self, mock_aioresponse):
         """Test the behaviour of get_galileo_message"""
 
-        # Disable the logger of the app
+        # Disable the logger of the app and empty the lookup cache
         disable_logger()
+        LOOKUP_CACHE.clear()
 
         # Obtain a session
         async with get_ublox_api_session() as session:
@@ -110,9 +133,10 @@ class TestUbloxApi:
                 ublox_token=FAKE_TOKEN_FOR_TESTING,
                 session=session,
             )
-            assert raw_data == RaW_Galileo, "Raw Galileo data must be the same"
+            assert raw_data == RaW_Galileo_Bytes, "Raw Galileo data must be the same"
 
-            # Mock the request
+            # Clear the lookup cache and mock the request
+            LOOKUP_CACHE.clear()
             token_expired_get_raw_data(
                 mock_aioresponse, url=URL_GET_GALILEO, raw_data=RaW_Galileo
             )
@@ -124,9 +148,10 @@ class TestUbloxApi:
                 ublox_token=FAKE_TOKEN_FOR_TESTING,
                 session=session,
             )
-            assert raw_data == RaW_Galileo, "Raw Galileo data must be the same"
+            assert raw_data == RaW_Galileo_Bytes, "Raw Galileo data must be the same"
 
-            # Mock the request
+            # Clear the lookup cache and mock the request
+            LOOKUP_CACHE.clear()
             KEYCLOAK.last_token_reception_time = 0
             unreachable_get_raw_data(mock_aioresponse, URL_GET_GALILEO)
             # Check if raises an exception in case of unreachable host
@@ -145,8 +170,9 @@ class TestUbloxApi:
     async def test_get_ublox_message(self, mock_aioresponse):
         """Test the behaviour of get_ublox_message"""
 
-        # Disable the logger of the app
+        # Disable the logger of the app and empty the lookup cache
         disable_logger()
+        LOOKUP_CACHE.clear()
 
         # Obtain a session
         async with get_ublox_api_session() as session:
@@ -162,9 +188,10 @@ class TestUbloxApi:
                 ublox_token=FAKE_TOKEN_FOR_TESTING,
                 session=session,
             )
-            assert raw_data == RaW_Ublox, "Raw Ublox data must be the same"
+            assert raw_data == RaW_Ublox_Bytes, "Raw Ublox data must be the same"
 
-            # Mock the request
+            # Clear the lookup cache and mock the request
+            LOOKUP_CACHE.clear()
             token_expired_get_raw_data(
                 mock_aioresponse, url=URL_GET_UBLOX, raw_data=RaW_Ublox
             )
@@ -176,9 +203,10 @@ class TestUbloxApi:
                 ublox_token=FAKE_TOKEN_FOR_TESTING,
                 session=session,
             )
-            assert raw_data == RaW_Ublox, "Raw Ublox data must be the same"
+            assert raw_data == RaW_Ublox_Bytes, "Raw Ublox data must be the same"
 
-            # Mock the request
+            # Clear the lookup cache and mock the request
+            LOOKUP_CACHE.clear()
             KEYCLOAK.last_token_reception_time = 0
             unreachable_get_raw_data(mock_aioresponse, URL_GET_UBLOX)
             # Check if raises an exception in case of unreachable host
@@ -213,8 +241,9 @@ class TestUbloxApi:
     async def test_get_galileo_messages_list(self, mock_aioresponse):
         """Test the behaviour of get_galileo_messages_list"""
 
-        # Disable the logger of the app
+        # Disable the logger of the app and empty the lookup cache
         disable_logger()
+        LOOKUP_CACHE.clear()
 
         # Obtain a session
         async with get_ublox_api_session() as session:
@@ -231,10 +260,11 @@ class TestUbloxApi:
                 session=session,
             )
             assert [
-                {"timestamp": TIMESTAMP, "raw_data": RaW_Galileo}
+                {"timestamp": TIMESTAMP, "raw_data": RaW_Galileo_Bytes}
             ] == ublox_api_list, "List of UbloxApi data must be the same"
 
-            # Mock the request
+            # Clear the lookup cache and mock the request
+            LOOKUP_CACHE.clear()
             token_expired_get_ublox_api_list(
                 mock_aioresponse, url=URL_POST_GALILEO, raw_data=RaW_Galileo
             )
@@ -248,10 +278,11 @@ class TestUbloxApi:
             )
 
             assert [
-                {"timestamp": TIMESTAMP, "raw_data": RaW_Galileo}
+                {"timestamp": TIMESTAMP, "raw_data": RaW_Galileo_Bytes}
             ] == ublox_api_list, "List of UbloxApi data must be the same"
 
-            # Mock the request
+            # Clear the lookup cache and mock the request
+            LOOKUP_CACHE.clear()
             unreachable_get_ublox_api_list(mock_aioresponse, url=URL_POST_GALILEO)
             with pytest.raises(HTTPException):
                 await get_galileo_messages_list(
@@ -268,8 +299,9 @@ class TestUbloxApi:
     async def test_get_ublox_messages_list(self, mock_aioresponse):
         """Test the behaviour of get_ublox_messages_list"""
 
-        # Disable the logger of the app
+        # Disable the logger of the app and empty the lookup cache
         disable_logger()
+        LOOKUP_CACHE.clear()
 
         # Obtain a session
         async with get_ublox_api_session() as session:
@@ -286,10 +318,11 @@ class TestUbloxApi:
                 session=session,
             )
             assert [
-                {"timestamp": TIMESTAMP, "raw_data": RaW_Ublox}
+                {"timestamp": TIMESTAMP, "raw_data": RaW_Ublox_Bytes}
             ] == ublox_api_list, "List of UbloxApi data must be the same"
 
-            # Mock the request
+            # Clear the lookup cache and mock the request
+            LOOKUP_CACHE.clear()
             token_expired_get_ublox_api_list(
                 mock_aioresponse, url=URL_POST_UBLOX, raw_data=RaW_Ublox
             )
@@ -303,10 +336,11 @@ class TestUbloxApi:
             )
 
             assert [
-                {"timestamp": TIMESTAMP, "raw_data": RaW_Ublox}
+                {"timestamp": TIMESTAMP, "raw_data": RaW_Ublox_Bytes}
             ] == ublox_api_list, "List of UbloxApi data must be the same"
 
-            # Mock the request
+            # Clear the lookup cache and mock the request
+            LOOKUP_CACHE.clear()
             KEYCLOAK.last_token_reception_time = 0
             unreachable_get_ublox_api_list(mock_aioresponse, url=URL_POST_UBLOX)
             with pytest.raises(HTTPException):
@@ -319,3 +353,348 @@ class TestUbloxApi:
                 )
 
         await KEYCLOAK.close()
+
+    @pytest.mark.asyncio
+    async def test_single_flight(self, mock_aioresponse):
+        """Test the coalescing of identical requests made concurrently"""
+
+        # Disable the logger of the app and empty the lookup cache
+        disable_logger()
+        LOOKUP_CACHE.clear()
+
+        # Obtain a session
+        async with get_ublox_api_session() as session:
+
+            # Mock only one request, a second call would fail
+            correct_get_raw_data(
+                mock_aioresponse, url=URL_GET_GALILEO, raw_data=RaW_Galileo
+            )
+            followers = SINGLE_FLIGHT.followers
+            raw_data_list = await gather(
+                *[
+                    get_galileo_message(
+                        svid=SvID,
+                        timestamp=TIMESTAMP,
+                        location=LOCATION,
+                        ublox_token=FAKE_TOKEN_FOR_TESTING,
+                        session=session,
+                    )
+                    for _ in range(5)
+                ]
+            )
+            assert raw_data_list == [RaW_Galileo_Bytes] * 5, "Result must be shared"
+            assert SINGLE_FLIGHT.followers - followers == 4, "Four followers expected"
+            assert not SINGLE_FLIGHT.requests, "No request must be in flight"
+
+            # Errors reach every waiter
+            unreachable_get_ublox_api_list(mock_aioresponse, url=URL_POST_GALILEO)
+            results = await gather(
+                *[
+                    get_galileo_messages_list(
+                        svid=SvID,
+                        timestamp=TIMESTAMP,
+                        ublox_token=FAKE_TOKEN_FOR_TESTING,
+                        location=LOCATION,
+                        session=session,
+                    )
+                    for _ in range(5)
+                ],
+                return_exceptions=True,
+            )
+            for result in results:
+                assert isinstance(result, HTTPException), "Every waiter must fail"
+
+    @pytest.mark.asyncio
+    async def test_aggregator(self, mock_aioresponse, monkeypatch):
+        """Test the aggregation of the lookups made concurrently"""
+
+        # Disable the logger of the app and empty the lookup cache
+        disable_logger()
+        LOOKUP_CACHE.clear()
+        monkeypatch.setattr(SETTINGS, "aggregate_lookups", True)
+
+        # Obtain a session
+        async with get_ublox_api_session() as session:
+
+            # Mock only one list request, a second call would fail
+            echo_get_ublox_api_list(
+                mock_aioresponse, url=URL_POST_GALILEO, raw_data=RaW_Galileo
+            )
+            requests = AGGREGATOR.requests
+            raw_data_list = await gather(
+                *[
+                    get_galileo_message(
+                        svid=SvID,
+                        timestamp=TIMESTAMP + index * 1000,
+                        location=LOCATION,
+                        ublox_token=FAKE_TOKEN_FOR_TESTING,
+                        session=session,
+                    )
+                    for index in range(5)
+                ]
+            )
+            assert raw_data_list == [RaW_Galileo_Bytes] * 5, "Every lookup answered"
+            assert AGGREGATOR.requests - requests == 1, "One list request expected"
+
+            # A full batch is dispatched without waiting the window
+            monkeypatch.setattr(AGGREGATOR, "window", 10)
+            monkeypatch.setattr(AGGREGATOR, "max_size", 3)
+            echo_get_ublox_api_list(
+                mock_aioresponse, url=URL_POST_UBLOX, raw_data=RaW_Ublox
+            )
+            raw_data_list = await gather(
+                *[
+                    get_ublox_message(
+                        svid=SvID,
+                        timestamp=TIMESTAMP + index * 1000,
+                        location=LOCATION,
+                        ublox_token=FAKE_TOKEN_FOR_TESTING,
+                        session=session,
+                    )
+                    for index in range(3)
+                ]
+            )
+            assert raw_data_list == [RaW_Ublox_Bytes] * 3, "Every lookup answered"
+
+            # Errors reach every lookup of the batch
+            LOOKUP_CACHE.clear()
+            unreachable_get_ublox_api_list(mock_aioresponse, url=URL_POST_UBLOX)
+            results = await gather(
+                *[
+                    get_ublox_message(
+                        svid=SvID,
+                        timestamp=TIMESTAMP + index * 1000,
+                        location=LOCATION,
+                        ublox_token=FAKE_TOKEN_FOR_TESTING,
+                        session=session,
+                    )
+                    for index in range(3)
+                ],
+                return_exceptions=True,
+            )
+            for result in results:
+                assert isinstance(result, HTTPException), "Every lookup must fail"
+            assert not AGGREGATOR.stats()["pending"], "No lookup must be pending"
+
+    @pytest.mark.asyncio
+    async def test_shared_cache(self, mock_aioresponse, monkeypatch):
+        """Test the lookups answered by the messages fetched by the other workers"""
+
+        # Disable the logger of the app and empty the lookup cache
+        disable_logger()
+        LOOKUP_CACHE.clear()
+        shared_cache = _SharedMemoryCache(
+            slots=16, slot_size=64, probe=4, ttl=60, negative_ttl=60
+        )
+        monkeypatch.setattr("app.internals.ublox_api.SHARED_CACHE", shared_cache)
+
+        # Obtain a session
+        async with get_ublox_api_session() as session:
+
+            # Mock only one request, the second lookup is answered by the shared cache
+            correct_get_raw_data(
+                mock_aioresponse, url=URL_GET_GALILEO, raw_data=RaW_Galileo
+            )
+            for _ in range(2):
+                assert (
+                    await get_galileo_message(
+                        svid=SvID,
+                        timestamp=TIMESTAMP,
+                        location=LOCATION,
+                        ublox_token=FAKE_TOKEN_FOR_TESTING,
+                        session=session,
+                    )
+                    == RaW_Galileo_Bytes
+                )
+                # Forget what this worker fetched
+                LOOKUP_CACHE.clear()
+
+            assert shared_cache.stats()["stores"] == 1
+            assert shared_cache.stats()["hits"] == 1
+
+    @pytest.mark.asyncio
+    async def test_prefetch(self, mock_aioresponse, monkeypatch):
+        """Test the batch prefetch through the lookup chain and the single flight"""
+
+        # Disable the logger of the app and empty the lookup cache
+        disable_logger()
+        LOOKUP_CACHE.clear()
+        shared_cache = _SharedMemoryCache(
+            slots=16, slot_size=64, probe=4, ttl=60, negative_ttl=60
+        )
+        monkeypatch.setattr("app.internals.ublox_api.SHARED_CACHE", shared_cache)
+
+        # Fetched by another worker
+        shared_cache.store((LOCATION, "galileo", SvID, TIMESTAMP), RaW_Galileo_Bytes)
+
+        # Obtain a session
+        async with get_ublox_api_session() as session:
+
+            # Mock only one list request, a second call would fail
+            echo_get_ublox_api_list(
+                mock_aioresponse, url=URL_POST_GALILEO, raw_data=RaW_Galileo
+            )
+            leaders = SINGLE_FLIGHT.leaders
+            timestamps = [TIMESTAMP, TIMESTAMP + 1000]
+            await gather(
+                *[
+                    prefetch_galileo_messages(
+                        svid=SvID,
+                        timestamps=timestamps,
+                        ublox_token=FAKE_TOKEN_FOR_TESTING,
+                        location=LOCATION,
+                        session=session,
+                    )
+                    for _ in range(2)
+                ]
+            )
+            assert SINGLE_FLIGHT.leaders - leaders == 1, "One batch request expected"
+            (calls,) = mock_aioresponse.requests.values()
+            assert [info["timestamp"] for info in calls[0].kwargs["json"]["info"]] == [
+                TIMESTAMP + 1000
+            ], "Only the message missing everywhere must be requested"
+            assert LOOKUP_CACHE.lookup((LOCATION, "galileo", SvID, TIMESTAMP + 1000))[
+                0
+            ], "The missing message must be stored"
+            assert shared_cache.stats()["stores"] == 2, "Shared with the other workers"
+
+            # Everything is stored, Ublox-Api isn't contacted
+            await prefetch_galileo_messages(
+                svid=SvID,
+                timestamps=timestamps,
+                ublox_token=FAKE_TOKEN_FOR_TESTING,
+                location=LOCATION,
+                session=session,
+            )
+            assert SINGLE_FLIGHT.leaders - leaders == 1
+        LOOKUP_CACHE.clear()
+
+    @pytest.mark.asyncio
+    async def test_hedging(self, mock_aioresponse, monkeypatch):
+        """Test the hedging of the requests towards the secondary region"""
+
+        # Disable the logger of the app and empty the lookup cache
+        disable_logger()
+        LOOKUP_CACHE.clear()
+
+        # Enable hedging towards a distinct swedish server
+        monkeypatch.setattr(SETTINGS, "hedge_requests", True)
+        monkeypatch.setattr(SETTINGS, "hedge_delay", 0.05)
+        monkeypatch.setitem(URL_GALILEO, "Sweden", URL_SWEDEN_GALILEO)
+        monkeypatch.setitem(URL_UBLOX, "Sweden", URL_SWEDEN_UBLOX)
+        await UBLOX_API_SESSIONS.setup()
+
+        try:
+            # The primary region is slow, the secondary wins
+            slow_get_raw_data(
+                mock_aioresponse, url=URL_GET_GALILEO, raw_data=RaW_Galileo, delay=1
+            )
+            correct_get_raw_data(
+                mock_aioresponse,
+                url=f"{URL_SWEDEN_GALILEO}/{SvID}/{TIMESTAMP}",
+                raw_data=RaW_Galileo,
+            )
+            stats = HEDGING.stats()
+            assert (
+                await get_galileo_message(
+                    svid=SvID,
+                    timestamp=TIMESTAMP,
+                    location=LOCATION,
+                    ublox_token=FAKE_TOKEN_FOR_TESTING,
+                    session=UBLOX_API_SESSIONS.get(LOCATION),
+                )
+                == RaW_Galileo_Bytes
+            ), "The secondary region must answer"
+            assert HEDGING.hedged - stats["hedged"] == 1, "Request must be hedged"
+            assert HEDGING.secondary_wins - stats["secondary_wins"] == 1
+
+            # The primary region is unreachable, fallback to the secondary
+            unreachable_get_raw_data(mock_aioresponse, url=URL_GET_UBLOX)
+            correct_get_raw_data(
+                mock_aioresponse,
+                url=f"{URL_SWEDEN_UBLOX}/{SvID}/{TIMESTAMP}",
+                raw_data=RaW_Ublox,
+            )
+            assert (
+                await get_ublox_message(
+                    svid=SvID,
+                    timestamp=TIMESTAMP,
+                    location=LOCATION,
+                    ublox_token=FAKE_TOKEN_FOR_TESTING,
+                    session=UBLOX_API_SESSIONS.get(LOCATION),
+                )
+                == RaW_Ublox_Bytes
+            ), "The secondary region must answer"
+            assert HEDGING.fallbacks - stats["fallbacks"] == 1, "Fallback expected"
+
+            # Both regions are unreachable
+            LOOKUP_CACHE.clear()
+            unreachable_get_raw_data(mock_aioresponse, url=URL_GET_UBLOX)
+            unreachable_get_raw_data(
+                mock_aioresponse, url=f"{URL_SWEDEN_UBLOX}/{SvID}/{TIMESTAMP}"
+            )
+            with pytest.raises(HTTPException):
+                await get_ublox_message(
+                    svid=SvID,
+                    timestamp=TIMESTAMP,
+                    location=LOCATION,
+                    ublox_token=FAKE_TOKEN_FOR_TESTING,
+                    session=UBLOX_API_SESSIONS.get(LOCATION),
+                )
+        finally:
+            await UBLOX_API_SESSIONS.close()
+
+    @pytest.mark.asyncio
+    async def test_circuit_breaker(self, mock_aioresponse, monkeypatch):
+        """Test the fast-fail of the lookups while the circuit is open"""
+
+        # Disable the logger of the app and empty the lookup cache
+        disable_logger()
+        LOOKUP_CACHE.clear()
+
+        # Open the circuit after 2 failures
+        CIRCUIT_BREAKERS.clear()
+        monkeypatch.setattr(SETTINGS, "breaker_min_calls", 2)
+
+        try:
+            async with get_ublox_api_session() as session:
+                for _ in range(2):
+                    unreachable_get_raw_data(mock_aioresponse, url=URL_GET_GALILEO)
+                    with pytest.raises(HTTPException):
+                        await get_galileo_message(
+                            svid=SvID,
+                            timestamp=TIMESTAMP,
+                            location=LOCATION,
+                            ublox_token=FAKE_TOKEN_FOR_TESTING,
+                            session=session,
+                        )
+                breaker = CIRCUIT_BREAKERS.get(URL_GALILEO[LOCATION])
+                assert breaker.state == OPEN, "The circuit must be open"
+
+                # Ublox-Api is not contacted anymore, the message is unknown
+                assert (
+                    await get_galileo_message(
+                        svid=SvID,
+                        timestamp=TIMESTAMP,
+                        location=LOCATION,
+                        ublox_token=FAKE_TOKEN_FOR_TESTING,
+                        session=session,
+                    )
+                    is None
+                ), "Fast-fail expected"
+                assert (
+                    await get_galileo_messages_list(
+                        svid=SvID,
+                        timestamp=TIMESTAMP,
+                        location=LOCATION,
+                        ublox_token=FAKE_TOKEN_FOR_TESTING,
+                        session=session,
+                    )
+                    == []
+                ), "Fast-fail expected"
+                assert breaker.stats()["rejected"] == 2, "Two lookups rejected"
+                assert not LOOKUP_CACHE.contains(
+                    (LOCATION, "galileo", SvID, TIMESTAMP)
+                ), "Fast-fail must not be cached"
+        finally:
+            CIRCUIT_BREAKERS.clear()
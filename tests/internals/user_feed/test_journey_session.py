@@ -0,0 +1,235 @@
+"""
+Tests app.internals.journey_session module
+
+:author: Angelo Cutaia
+:copyright: Copyright 2021, LINKS Foundation
+:version: 1.0.0
+
+..
+
+    Copyright 2021 LINKS Foundation
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+        https://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+# Standard Library
+from asyncio import gather
+from typing import List
+import zlib
+
+# Test
+from aioresponses import aioresponses
+from fastapi import HTTPException
+from pydantic import parse_raw_as
+import pytest
+import uvloop
+
+# Internal
+from app.concurrency.position_authentication import store_semaphore
+from app.internals.journey_session import _JourneySessions, _dump_positions
+from app.internals.keycloak import KEYCLOAK
+from app.internals.lookup_cache import LOOKUP_CACHE
+from app.internals.sessions.ublox_api import UBLOX_API_SESSIONS
+from app.models.security import Authenticity
+from app.models.user_feed.position import PositionObject
+from app.models.user_feed.user import UserFeedHeader, UserFeedInput
+
+from tests.mock.accounting_manager.iota import correct_store_in_iota
+from tests.mock.anonymizer.anonengine import correct_store_user_in_the_anonengine
+from tests.mock.anonymizer.constants import URL_STORE_USER_DATA
+from tests.mock.anonymizer.ipt import correct_store_in_ipt_anonymizer
+from tests.mock.keycloak.keycloak import correct_get_blox_token
+from tests.mock.ublox_api.constants import RaW_Galileo, URL_GET_GALILEO
+from tests.mock.ublox_api.get_raw_data import correct_get_raw_data
+from .constants import USER_INPUT_PATH
+from ..logger import disable_logger
+
+# ---------------------------------------------------------------------------------------------
+
+with open(USER_INPUT_PATH, "r") as fp:
+    USER_INPUT = UserFeedInput.parse_raw(fp.read())
+    """UserFeedInput Data"""
+
+HEADER = UserFeedHeader(**USER_INPUT.dict(exclude={"trace_information"}))
+"""Data of the journey without the trace"""
+
+# ---------------------------------------------------------------------------------------------
+
+
+@pytest.fixture()
+def event_loop():
+    """
+    Set uvloop as the default event loop
+    """
+    loop = uvloop.Loop()
+    yield loop
+    loop.close()
+
+
+@pytest.fixture
+def mock_aioresponse():
+    with aioresponses() as m:
+        yield m
+
+
+def position(timenano_drift: int):
+    """Copy of the position of the input with a drift of timenano"""
+    new_position = USER_INPUT.trace_information[0].copy(deep=True)
+    new_position.galileo_auth[0].timenano += timenano_drift
+    return new_position
+
+
+def _journey_sessions(tmp_path, **limits) -> _JourneySessions:
+    """Sessions stored in a temporary database"""
+    settings = dict(
+        path=str(tmp_path / "journeys.sqlite"),
+        ttl=60,
+        max_sessions=10,
+        max_chunk_size=1,
+        max_pending_chunks=1,
+        lease=60,
+        poll_interval=0.01,
+        max_retry_after=30,
+    )
+    settings.update(limits)
+    return _JourneySessions(**settings)
+
+
+class TestJourneySession:
+    """
+    Test the journey_session module
+    """
+
+    @pytest.mark.asyncio
+    async def test_limits(self, tmp_path):
+        """Test the limits of the sessions"""
+        sessions = _journey_sessions(tmp_path, max_sessions=1, max_chunk_size=1)
+        journey = await sessions.open(HEADER, "localhost", "TEST", "client", "user")
+
+        # Too many sessions, the client retries once the oldest one expires
+        with pytest.raises(HTTPException) as error:
+            await sessions.open(HEADER, "localhost", "TEST", "client", "user")
+        assert error.value.headers["Retry-After"] == "30"
+
+        # Only the requester that opened the journey can use it
+        with pytest.raises(HTTPException):
+            await sessions.get(journey.journey_id, "client", "other_user")
+        assert await sessions.get(journey.journey_id, "client", "user") == journey
+
+        # Too many positions in a chunk
+        with pytest.raises(HTTPException):
+            await sessions.append(
+                journey.journey_id, "client", "user", 0, [position(0), position(1)], 0
+            )
+
+        # Idle sessions expire
+        sessions.ttl = -1
+        with pytest.raises(HTTPException):
+            await sessions.get(journey.journey_id, "client", "user")
+        assert sessions.stats()["expired"] == 1
+        await sessions.stop()
+
+    @pytest.mark.asyncio
+    async def test_shared(self, tmp_path):
+        """Test the sessions shared by the workers"""
+        worker = _journey_sessions(tmp_path, max_pending_chunks=1)
+        other_worker = _journey_sessions(tmp_path, max_pending_chunks=1)
+        journey = await worker.open(HEADER, "localhost", "TEST", "client", "user")
+
+        # The chunks can reach any worker, the first one is leased to be authenticated
+        await other_worker._run(
+            other_worker._transaction,
+            other_worker._append,
+            journey.journey_id,
+            "client",
+            "user",
+            0,
+            _dump_positions([position(0)]),
+            100,
+        )
+        assert await other_worker._run(other_worker._lease, journey.journey_id)
+        assert not await worker._run(worker._lease, journey.journey_id)
+
+        # Too many pending chunks, the client retries once a chunk is authenticated
+        with pytest.raises(HTTPException) as error:
+            await worker.append(
+                journey.journey_id, "client", "user", 1, [position(1000)], 100
+            )
+        assert error.value.headers["Retry-After"] == "1"
+
+        status = await worker.get(journey.journey_id, "client", "user")
+        assert status.chunks == 1 and status.verified_chunks == 0
+        await worker.stop()
+        await other_worker.stop()
+
+    @pytest.mark.asyncio
+    async def test_finalize(self, mock_aioresponse, tmp_path):
+        """Test the authentication of the chunks and the finalization"""
+
+        # Disable the logger of the app and empty the lookup cache
+        disable_logger()
+        LOOKUP_CACHE.clear()
+
+        # Setup KEYCLOAK and mock the requests
+        correct_get_blox_token(mock_aioresponse)
+        await KEYCLOAK.setup()
+        await UBLOX_API_SESSIONS.setup()
+        correct_get_raw_data(
+            mock_aioresponse, url=URL_GET_GALILEO, raw_data=RaW_Galileo
+        )
+        correct_store_in_iota(mock_aioresponse)
+        correct_store_user_in_the_anonengine(mock_aioresponse)
+        correct_store_in_ipt_anonymizer(mock_aioresponse, URL_STORE_USER_DATA)
+
+        sessions = _journey_sessions(tmp_path, max_chunk_size=2, max_pending_chunks=2)
+        journey = await sessions.open(HEADER, "localhost", "TEST", "client", "user")
+        journey_id = journey.journey_id
+
+        await sessions.append(journey_id, "client", "user", 0, [position(0)], 100)
+        # The same timenano in the next chunk is meaconing
+        await sessions.append(
+            journey_id, "client", "user", 1, [position(0), position(1000)], 100
+        )
+        # A chunk already received is ignored
+        await sessions.append(journey_id, "client", "user", 1, [position(0)], 100)
+
+        # The chunks must follow the order of the trace
+        with pytest.raises(HTTPException):
+            await sessions.append(journey_id, "client", "user", 3, [position(0)], 100)
+
+        await sessions.close(journey_id, "client", "user")
+        with pytest.raises(HTTPException):
+            await sessions.append(journey_id, "client", "user", 2, [position(0)], 100)
+
+        # Only the verdicts of the positions are kept
+        await gather(*sessions._tasks)
+        journey, chunks = await sessions._run(sessions._load, journey_id)
+        assert [
+            position.authenticity
+            for chunk in chunks
+            for position in parse_raw_as(List[PositionObject], zlib.decompress(chunk))
+        ] == [
+            Authenticity.authentic,
+            Authenticity.not_authentic,
+            Authenticity.authentic,
+        ], "Wrong verdicts"
+        assert journey[6:8] == (2, 200)
+
+        await sessions.finalize(journey_id, store_semaphore())
+        assert await sessions._run(sessions._progress, journey_id) is None
+        assert sessions.stats()["finalized"] == 1
+        await sessions.stop()
+
+        # Close KEYCLOAK and Ublox-Api sessions
+        await KEYCLOAK.close()
+        await UBLOX_API_SESSIONS.close()
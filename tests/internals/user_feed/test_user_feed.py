@@ -23,7 +23,7 @@ Tests app.internals.user_feed module
 """
 
 # Standard Library
-from asyncio import Semaphore
+from asyncio import current_task, sleep
 import time
 
 # Test
@@ -33,11 +33,19 @@ import pytest
 import uvloop
 
 # Internal
+from app.concurrency.position_authentication import store_semaphore
 from app.internals.keycloak import KEYCLOAK
+from app.internals.lookup_cache import LOOKUP_CACHE
+from app.internals.sessions.ublox_api import UBLOX_API_SESSIONS
+from app.internals import user_feed
 from app.internals.user_feed import (
+    detect_meaconing,
     end_to_end_position_authentication,
+    lookup_trace,
+    plan_trace_lookups,
     store_android_data,
 )
+from app.config import get_ublox_api_settings
 from app.models.user_feed.user import UserFeedInput, UserFeedOutput, PositionObject
 
 from app.models.track import TrackSegmentsOutput
@@ -56,7 +64,10 @@ from tests.mock.ublox_api.get_ublox_api_list import (
 from tests.mock.keycloak.keycloak import correct_get_blox_token
 
 from tests.mock.ublox_api.constants import (
+    LOCATION,
     RaW_Galileo,
+    SvID,
+    TIMESTAMP,
     URL_GET_GALILEO,
     URL_POST_GALILEO,
 )
@@ -102,13 +113,15 @@ class TestUserFeed:
     async def test_end_to_end_position_authentication(self, mock_aioresponse):
         """Test the behaviour of end_to_end_position_authentication"""
 
-        # Disable the logger of the app
+        # Disable the logger of the app and empty the lookup cache
         disable_logger()
+        LOOKUP_CACHE.clear()
 
         # Setup KEYCLOAK and mock the request
         correct_get_blox_token(mock_aioresponse)
         # during the setup we'll obtain a token that will be stored in cls.last_token
         await KEYCLOAK.setup()
+        await UBLOX_API_SESSIONS.setup()
 
         # Position authentic
         correct_get_raw_data(
@@ -125,6 +138,7 @@ class TestUserFeed:
         ), "The position is authentic"
 
         # Position Unknown
+        LOOKUP_CACHE.clear()
         correct_get_raw_data(mock_aioresponse, url=URL_GET_GALILEO, raw_data=None)
 
         user_feed_validated = await end_to_end_position_authentication(
@@ -136,8 +150,9 @@ class TestUserFeed:
         ), "The position is unknown"
 
         # Position false fake
+        LOOKUP_CACHE.clear()
         correct_get_raw_data(
-            mock_aioresponse, url=URL_GET_GALILEO, raw_data="FALSE_FAKE"
+            mock_aioresponse, url=URL_GET_GALILEO, raw_data="FA15EFA4E0"
         )
         correct_get_ublox_api_list(
             mock_aioresponse, url=URL_POST_GALILEO, raw_data=RaW_Galileo
@@ -152,9 +167,10 @@ class TestUserFeed:
         ), "The position is authentic"
 
         # Position real fake
-        correct_get_raw_data(mock_aioresponse, url=URL_GET_GALILEO, raw_data="FAKE")
+        LOOKUP_CACHE.clear()
+        correct_get_raw_data(mock_aioresponse, url=URL_GET_GALILEO, raw_data="FA4E")
         correct_get_ublox_api_list(
-            mock_aioresponse, url=URL_POST_GALILEO, raw_data="REAL_FAKE"
+            mock_aioresponse, url=URL_POST_GALILEO, raw_data="4EA1FA4E"
         )
 
         user_feed_validated = await end_to_end_position_authentication(
@@ -167,7 +183,8 @@ class TestUserFeed:
 
         # Something went wrong during the request of a single raw_data
         with pytest.raises(HTTPException):
-            # Mock the request
+            # Clear the lookup cache and mock the request
+            LOOKUP_CACHE.clear()
             unreachable_get_raw_data(mock_aioresponse, url=URL_GET_GALILEO)
             await end_to_end_position_authentication(
                 user_feed=USER_INPUT, timestamp=time.time(), host="localhost"
@@ -175,29 +192,243 @@ class TestUserFeed:
 
         # Something went wrong during the request of a List[UbloxApi]
         with pytest.raises(HTTPException):
-            # Mock the requests
+            # Clear the lookup cache and mock the requests
+            LOOKUP_CACHE.clear()
             correct_get_raw_data(
-                mock_aioresponse, url=URL_GET_GALILEO, raw_data="FALSE_FAKE"
+                mock_aioresponse, url=URL_GET_GALILEO, raw_data="FA15EFA4E0"
             )
             unreachable_get_ublox_api_list(mock_aioresponse, url=URL_POST_GALILEO)
             await end_to_end_position_authentication(
                 user_feed=USER_INPUT, timestamp=time.time(), host="localhost"
             )
 
-        # Close KEYCLOAK session
+        # Close KEYCLOAK and Ublox-Api sessions
         await KEYCLOAK.close()
+        await UBLOX_API_SESSIONS.close()
+
+    def test_detect_meaconing(self):
+        """Test the continuity check of fullbiasnano and timenano"""
+        template = USER_INPUT.trace_information[0]
+        auth = template.galileo_auth[0]
+
+        def position(fullbiasnano_drift: int, timenano_drift: int):
+            new_position = template.copy(deep=True)
+            new_position.galileo_auth[0].fullbiasnano = (
+                auth.fullbiasnano + fullbiasnano_drift
+            )
+            new_position.galileo_auth[0].timenano = auth.timenano + timenano_drift
+            return new_position
+
+        empty_position = template.copy(deep=True)
+        empty_position.galileo_auth = []
+
+        trace_information = [
+            # Set fullbiasnano and timenano
+            position(0, 0),
+            # Same timenano
+            position(0, 0),
+            # Reset
+            empty_position,
+            # Set fullbiasnano and timenano
+            position(0, 0),
+            # fullbiasnano drifts too much
+            position(100_000, 1_000),
+            # Coherent data
+            position(10, 1_000),
+        ]
+        assert detect_meaconing(trace_information, meaconing_threshold=50) == [
+            False,
+            True,
+            False,
+            False,
+            True,
+            False,
+        ], "Wrong meaconing verdicts"
+
+    @pytest.mark.asyncio
+    async def test_lookup_trace(self, monkeypatch):
+        """
+        Test that the repeated GalileoAuth of a trace are looked up once and that
+        the GalileoAuth after an unknown one aren't looked up
+        """
+        looked_up = []
+
+        async def lookup_auth(auth, location, ublox_token, semaphore):
+            looked_up.append(auth.time)
+            # The first message is unknown
+            return (None if auth.time == TIMESTAMP else auth.data), None
+
+        monkeypatch.setattr(user_feed, "_lookup_auth", lookup_auth)
+
+        template = USER_INPUT.trace_information[0].copy(deep=True)
+        auth = template.galileo_auth[0]
+        other_auth = auth.copy(deep=True)
+        other_auth.time = TIMESTAMP + 1000
+        unknown = template.copy(deep=True)
+        unknown.galileo_auth = [auth, other_auth]
+        known = template.copy(deep=True)
+        known.galileo_auth = [other_auth, other_auth]
+
+        lookups, references = await lookup_trace(
+            [(unknown, LOCATION), (template, LOCATION), (known, LOCATION)], "TOKEN", 2
+        )
+        assert sorted(looked_up) == [TIMESTAMP, TIMESTAMP + 1000], "Looked up once"
+        assert references == 4, "Wrong number of GalileoAuth referenced"
+        assert list(lookups) == [
+            (LOCATION, SvID, TIMESTAMP, auth.data),
+            (LOCATION, SvID, TIMESTAMP + 1000, auth.data),
+        ], "Wrong unique lookup keys"
+
+        # The message after an unknown one is never requested
+        looked_up.clear()
+        lookups, references = await lookup_trace([(unknown, LOCATION)], "TOKEN", 2)
+        assert looked_up == [TIMESTAMP] and references == 1
+
+    @pytest.mark.asyncio
+    async def test_lookup_trace_failure(self, monkeypatch):
+        """Test that the pending lookups are cancelled when one of them fails"""
+        pending = []
+
+        async def lookup_auth(auth, location, ublox_token, semaphore):
+            if auth.time == TIMESTAMP:
+                await sleep(0)
+                raise ValueError("Failed")
+            pending.append(current_task())
+            await sleep(10)
+
+        monkeypatch.setattr(user_feed, "_lookup_auth", lookup_auth)
+
+        failing = USER_INPUT.trace_information[0].copy(deep=True)
+        slow = failing.copy(deep=True)
+        slow.galileo_auth[0].time = TIMESTAMP + 1000
+
+        with pytest.raises(ValueError):
+            await lookup_trace([(failing, LOCATION), (slow, LOCATION)], "TOKEN", 2)
+        assert len(pending) == 1
+        assert pending[0].cancelled(), "The slow lookup must be cancelled"
+
+    @pytest.mark.asyncio
+    async def test_batch_lookup(self, mock_aioresponse):
+        """Test the trace-level batch lookup through the list endpoint"""
+
+        # Disable the logger of the app and empty the lookup cache
+        disable_logger()
+        LOOKUP_CACHE.clear()
+
+        # The trace is grouped by region and satellite
+        assert plan_trace_lookups(
+            [(position, LOCATION) for position in USER_INPUT.trace_information]
+        ) == {(LOCATION, SvID): {TIMESTAMP}}, "Wrong plan"
+
+        # Setup KEYCLOAK and mock the request
+        correct_get_blox_token(mock_aioresponse)
+        await KEYCLOAK.setup()
+        await UBLOX_API_SESSIONS.setup()
+
+        # Batch every trace
+        settings = get_ublox_api_settings()
+        batch_lookup_threshold = settings.batch_lookup_threshold
+        settings.batch_lookup_threshold = 1
+
+        # Only the list endpoint is mocked
+        correct_get_ublox_api_list(
+            mock_aioresponse, url=URL_POST_GALILEO, raw_data=RaW_Galileo
+        )
+        user_feed_validated = await end_to_end_position_authentication(
+            user_feed=USER_INPUT, timestamp=time.time(), host="localhost"
+        )
+        assert (
+            user_feed_validated.trace_information[0].authenticity
+            == Authenticity.authentic
+        ), "The position is authentic"
+
+        # If the batch lookup fails the data are requested one by one
+        LOOKUP_CACHE.clear()
+        unreachable_get_ublox_api_list(mock_aioresponse, url=URL_POST_GALILEO)
+        correct_get_raw_data(mock_aioresponse, url=URL_GET_GALILEO, raw_data=None)
+        user_feed_validated = await end_to_end_position_authentication(
+            user_feed=USER_INPUT, timestamp=time.time(), host="localhost"
+        )
+        assert (
+            user_feed_validated.trace_information[0].authenticity
+            == Authenticity.unknown
+        ), "The position is unknown"
+
+        # Restore the settings and close KEYCLOAK and Ublox-Api sessions
+        settings.batch_lookup_threshold = batch_lookup_threshold
+        await KEYCLOAK.close()
+        await UBLOX_API_SESSIONS.close()
+
+    @pytest.mark.asyncio
+    async def test_sampled_authentication(self, mock_aioresponse):
+        """Test that only a sample of the positions of a long journey is verified"""
+
+        # Disable the logger of the app and empty the lookup cache
+        disable_logger()
+        LOOKUP_CACHE.clear()
+
+        # Setup KEYCLOAK and mock the request
+        correct_get_blox_token(mock_aioresponse)
+        await KEYCLOAK.setup()
+        await UBLOX_API_SESSIONS.setup()
+
+        # Sample 2 positions of the journeys longer than 4 positions
+        settings = get_ublox_api_settings()
+        previous = settings.copy()
+        settings.sampled_source_apps = ["SAMPLED"]
+        settings.sample_threshold = 4
+        settings.sample_size = 2
+        settings.sample_strata = 2
+
+        # A coherent trace of 6 positions carrying the same subframe
+        user_feed = USER_INPUT.copy(deep=True)
+        template = user_feed.trace_information[0]
+        user_feed.trace_information = []
+        for index in range(6):
+            position = template.copy(deep=True)
+            position.galileo_auth[0].timenano += index * 1000
+            user_feed.trace_information.append(position)
+
+        correct_get_raw_data(
+            mock_aioresponse, url=URL_GET_GALILEO, raw_data=RaW_Galileo
+        )
+        user_feed_validated = await end_to_end_position_authentication(
+            user_feed=user_feed,
+            timestamp=time.time(),
+            host="localhost",
+            source_app="SAMPLED",
+        )
+        verdicts = [
+            position.authenticity for position in user_feed_validated.trace_information
+        ]
+        assert verdicts.count(Authenticity.authentic) == 2, "Two positions sampled"
+        assert verdicts.count(Authenticity.unknown) == 4, "The others are unknown"
+        assert (
+            Authenticity.authentic in verdicts[:3]
+            and Authenticity.authentic in verdicts[3:]
+        ), "One position for every stratum"
+
+        # Restore the settings and close KEYCLOAK and Ublox-Api sessions
+        settings.sampled_source_apps = previous.sampled_source_apps
+        settings.sample_threshold = previous.sample_threshold
+        settings.sample_size = previous.sample_size
+        settings.sample_strata = previous.sample_strata
+        await KEYCLOAK.close()
+        await UBLOX_API_SESSIONS.close()
 
     @pytest.mark.asyncio
     async def test_store_android_data(self, mock_aioresponse):
         """Test the behaviour of store_android_data"""
 
-        # Disable the logger of the app
+        # Disable the logger of the app and empty the lookup cache
         disable_logger()
+        LOOKUP_CACHE.clear()
 
         # Setup KEYCLOAK and mock the request
         correct_get_blox_token(mock_aioresponse)
         # during the setup we'll obtain a token that will be stored in cls.last_token
         await KEYCLOAK.setup()
+        await UBLOX_API_SESSIONS.setup()
 
         # Mock the other requests
         correct_get_raw_data(
@@ -279,8 +510,9 @@ class TestUserFeed:
             source_app="TEST",
             client_id="TEST",
             user_id="TEST",
-            semaphore=Semaphore(2),
+            semaphore=store_semaphore(),
         )
 
-        # Close KEYCLOAK session
+        # Close KEYCLOAK and Ublox-Api sessions
         await KEYCLOAK.close()
+        await UBLOX_API_SESSIONS.close()
@@ -24,10 +24,12 @@ Mocked keycloak http requests
 
 # Standard Library
 from asyncio import TimeoutError
+import time
 
 # Third Party
 from aioresponses import aioresponses
 from fastapi import status
+from jose import jwt
 import orjson
 
 # Internal
@@ -54,6 +56,22 @@ def new_correct_get_blox_token(m: aioresponses):
     )
 
 
+def jwt_get_blox_token(m: aioresponses, lifetime: int):
+    """Mock the request made to keycloak to obtain a JWT token with an expiration"""
+    now = int(time.time())
+    m.post(
+        TOKEN_REQUEST_URL,
+        status=status.HTTP_200_OK,
+        body=orjson.dumps(
+            {
+                "access_token": jwt.encode(
+                    {"iat": now, "exp": now + lifetime}, "secret", algorithm="HS256"
+                )
+            }
+        ).decode(),
+    )
+
+
 def unauthorized_get_ublox_token(m: aioresponses):
     """Mock the request made to keycloak to obtain a valid token"""
 
@@ -46,6 +46,12 @@ URL_POST_UBLOX = f"{URL_UBLOX['Italy']}"
 URL_POST_GALILEO = f"{URL_GALILEO['Italy']}"
 """ Url to get a list of ublox messages """
 
+URL_SWEDEN_UBLOX = "https://sweden.ublox-api:8001/api/v1/galileo/ublox/request"
+""" Url of a swedish server distinct from the italian one, to get ublox messages """
+
+URL_SWEDEN_GALILEO = "https://sweden.ublox-api:8001/api/v1/galileo/request"
+""" Url of a swedish server distinct from the italian one, to get galileo messages """
+
 LOCATION = "Italy"
 """ Location of the Ublox-Api server """
 
@@ -57,5 +63,11 @@ RaW_Ublox = "02133000000c00000a0102392a34c022408c238a04b389169ebc400e228044bfe80
 RaW_Galileo = "021b05b6415009b9c96a3edc8e7500867e588f6792c86aaaaa62bc4c7f40"
 """ Galileo Raw Message """
 
+RaW_Ublox_Bytes = bytes.fromhex(RaW_Ublox)
+""" Ublox Raw Message decoded """
+
+RaW_Galileo_Bytes = bytes.fromhex(RaW_Galileo)
+""" Galileo Raw Message decoded """
+
 NUMBER_REQUESTED_DATA = (SETTINGS.window / SETTINGS.window_step) * 2
 """ Number of data requested to Ublox-Api """
@@ -23,11 +23,11 @@ Mocked Ublox Api http get requests
 """
 
 # Standard Library
-from asyncio import TimeoutError
+from asyncio import TimeoutError, sleep
 from typing import Optional
 
 # Third Party
-from aioresponses import aioresponses
+from aioresponses import aioresponses, CallbackResult
 from fastapi import status
 import orjson
 
@@ -54,6 +54,27 @@ def correct_get_raw_data(m: aioresponses, url: str, raw_data: Optional[str]):
     )
 
 
+def slow_get_raw_data(m: aioresponses, url: str, raw_data: Optional[str], delay: float):
+    """
+    Mock the behaviour in case of Ublox-Api is slow to answer
+
+    :param m: aioresponses mock
+    :param url: Galileo or Ublox
+    :param raw_data: data that we want to receive
+    :param delay: seconds to wait before answering
+    :return:
+    """
+
+    async def answer(*args, **kwargs) -> CallbackResult:
+        await sleep(delay)
+        return CallbackResult(
+            status=status.HTTP_200_OK,
+            body=orjson.dumps({"timestamp": TIMESTAMP, "raw_data": raw_data}).decode(),
+        )
+
+    m.get(url, callback=answer)
+
+
 def token_expired_get_raw_data(m: aioresponses, url: str, raw_data: Optional[str]):
     """
     Mock the behaviour in case of token expired
@@ -27,7 +27,7 @@ from asyncio import TimeoutError
 from typing import Optional
 
 # Third Party
-from aioresponses import aioresponses
+from aioresponses import aioresponses, CallbackResult
 from fastapi import status
 import orjson
 
@@ -59,6 +59,38 @@ def correct_get_ublox_api_list(m: aioresponses, url: str, raw_data: Optional[str
     )
 
 
+def echo_get_ublox_api_list(
+    m: aioresponses, url: str, raw_data: Optional[str], repeat: bool = False
+):
+    """
+    Mock the request made to obtain a list of UbloxApi data answering
+    every requested timestamp with the same raw data
+
+    :param m: aioresponses mock
+    :param url: Galileo or Ublox
+    :param raw_data: data that we want to receive
+    :param repeat: True if the mock must answer more than one request
+    :return:
+    """
+
+    def answer(*args, **kwargs) -> CallbackResult:
+        data = kwargs["json"]
+        return CallbackResult(
+            status=status.HTTP_200_OK,
+            body=orjson.dumps(
+                {
+                    "satellite_id": data["satellite_id"],
+                    "info": [
+                        {"timestamp": info["timestamp"], "raw_data": raw_data}
+                        for info in data["info"]
+                    ],
+                }
+            ).decode(),
+        )
+
+    m.post(url, callback=answer, repeat=repeat)
+
+
 def token_expired_get_ublox_api_list(
     m: aioresponses, url: str, raw_data: Optional[str]
 ):
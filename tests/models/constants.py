@@ -73,12 +73,14 @@ InputAndoidData = [
     64,
 ]
 
-InputAndoidDataConverted = (
+InputAndoidDataConverted = bytes.fromhex(
     "021b05b6415009b9c96a3edc8e7500867e588f6792c86aaaaa62bc4c7f40"
 )
 
 InputGnssData = "B56202133000000C00000A0102392A34C022408C238A04B389169EBC400E228044BFE80F43A8E604821235344582F90FD29628100086B197"
 
-InputGnssDataConverted = "02133000000c00000a0102392a34c022408c238a04b389169ebc400e228044bfe80f43a8e604821235344582f90fd29628100086b197"
+InputGnssDataConverted = bytes.fromhex(
+    "02133000000c00000a0102392a34c022408c238a04b389169ebc400e228044bfe80f43a8e604821235344582f90fd29628100086b197"
+)
 
 SvID = 12
@@ -34,6 +34,8 @@ import orjson
 from fastapi import status
 
 # Internal
+from app.concurrency.work_queue import WORK_QUEUE
+from app.internals.journey_session import JOURNEY_SESSIONS
 from app.main import app
 from app.models.extraction.data_extraction import RequestType
 
@@ -79,6 +81,16 @@ def mock_aioresponse():
         yield m
 
 
+@pytest.fixture(autouse=True)
+def sqlite_databases(tmp_path, monkeypatch):
+    """Keep the SQLite databases of the app in a temporary directory"""
+    monkeypatch.setattr(JOURNEY_SESSIONS, "path", str(tmp_path / "journeys.sqlite"))
+    monkeypatch.setattr(WORK_QUEUE, "path", str(tmp_path / "work_queue.sqlite"))
+    yield
+    JOURNEY_SESSIONS.close_database()
+    WORK_QUEUE.close()
+
+
 def clear_test():
     """Clear tests"""
     disable_logger()
@@ -151,6 +163,39 @@ class TestAdmin:
         clear_test()
 
 
+class TestMetrics:
+    """Test metrics router"""
+
+    def test_metrics(self, mock_aioresponse):
+        """Test the behaviour of metrics router"""
+
+        clear_test()
+
+        # Obtain tokens
+        valid_token = generate_valid_token(realm=RolesEnum.admin)
+        valid_token_role_not_present = generate_valid_token(realm=RolesEnum.fake)
+
+        correct_get_blox_token(mock_aioresponse)
+
+        with TestClient(app) as client:
+            # Try to use a valid token but without the requested role
+            response = client.get(
+                "http://serengeti/api/v1/goeasy/getMetrics",
+                headers={"Authorization": f"Bearer {valid_token_role_not_present}"},
+            )
+            assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+            # Use a valid token
+            response = client.get(
+                "http://serengeti/api/v1/goeasy/getMetrics",
+                headers={"Authorization": f"Bearer {valid_token}"},
+            )
+            assert response.status_code == status.HTTP_200_OK
+            assert "lookup_cache" in response.json()
+
+        clear_test()
+
+
 class TestIoT:
     """Test IoT router"""
 
@@ -235,6 +280,57 @@ class TestIoT:
 
         clear_test()
 
+    def test_iot_batch_authentication(self, mock_aioresponse):
+        """Test the behaviour of the iot batch authentication endpoint"""
+
+        # Setup
+        clear_test()
+        with open(IOT_INPUT_PATH, "r") as fp:
+            IOT_INPUT = orjson.loads(fp.read())
+
+        # Mock the request
+        correct_get_blox_token(mock_aioresponse)
+        correct_get_raw_data(mock_aioresponse, url=URL_GET_UBLOX, raw_data=RaW_Ublox)
+        correct_store_in_iota(mock_aioresponse)
+        for _ in range(3):
+            correct_store_in_ipt_anonymizer(mock_aioresponse, URL_STORE_IOT_DATA)
+
+        # Obtain tokens
+        valid_token = generate_valid_token(realm=RolesEnum.iot)
+        valid_token_role_not_present = generate_valid_token(realm=RolesEnum.fake)
+
+        with TestClient(app) as client:
+            # Try to use a valid token but without the requested role
+            response = client.post(
+                "http://serengeti/api/v1/goeasy/IoTauthenticate/batch",
+                headers={"Authorization": f"Bearer {valid_token_role_not_present}"},
+                json=[IOT_INPUT],
+            )
+            assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+            # Every observation receives its GEPid
+            response = client.post(
+                "http://serengeti/api/v1/goeasy/IoTauthenticate/batch",
+                headers={"Authorization": f"Bearer {valid_token}"},
+                json=[IOT_INPUT, IOT_INPUT, IOT_INPUT],
+            )
+            assert response.status_code == status.HTTP_200_OK
+            assert len(response.json()["observationGEPids"]) == 3
+            assert (
+                response.json()["batchGEPid"]
+                not in response.json()["observationGEPids"]
+            ), "The batch has its own id"
+
+            # Use a valid token with a wrong body
+            response = client.post(
+                "http://serengeti/api/v1/goeasy/IoTauthenticate/batch",
+                headers={"Authorization": f"Bearer {valid_token}"},
+                json=IOT_INPUT,
+            )
+            assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+        clear_test()
+
     def test_authenticate_test(self, mock_aioresponse):
         """Test the behaviour of  iot authentication endpoint"""
 
@@ -284,6 +380,7 @@ class TestIoT:
                 json=IOT_INPUT,
             )
             assert response.status_code == status.HTTP_200_OK
+            assert float(response.headers["X-Queue-Wait"]) >= 0
             # we don't check the response value cause we've already tested end_to_end authentication
 
             # Use a valid token with a wrong body
@@ -559,6 +656,86 @@ class TestUser:
 
         clear_test()
 
+    def test_journey_session(self, mock_aioresponse):
+        """Test the behaviour of the journey session endpoints"""
+
+        # Setup
+        clear_test()
+        JOURNEY_SESSIONS.clear()
+        with open(USER_INPUT_PATH, "r") as fp:
+            USER_INPUT = orjson.loads(fp.read())
+        trace_information = USER_INPUT.pop("trace_information")
+
+        # Mock the request
+        correct_get_blox_token(mock_aioresponse)
+        correct_get_raw_data(
+            mock_aioresponse, url=URL_GET_GALILEO, raw_data=RaW_Galileo
+        )
+        correct_store_in_iota(mock_aioresponse)
+        correct_store_user_in_the_anonengine(mock_aioresponse)
+        correct_store_in_ipt_anonymizer(mock_aioresponse, URL_STORE_USER_DATA)
+
+        # Obtain tokens
+        valid_token = generate_valid_token(realm=RolesEnum.user)
+        other_user_token = generate_valid_token(
+            realm=RolesEnum.user,
+            client=Azp.get_token_client,
+            user_name=UserName.goeasy_bq_library,
+        )
+        url = "http://serengeti/api/v1/goeasy/authenticate/journeys"
+        headers = {"Authorization": f"Bearer {valid_token}"}
+
+        with TestClient(app) as client:
+            # Open the journey
+            response = client.post(url, headers=headers, json=USER_INPUT)
+            assert response.status_code == status.HTTP_200_OK
+            journey_id = response.json()["journey_id"]
+
+            # Only the requester that opened the journey can use it
+            response = client.get(
+                f"{url}/{journey_id}",
+                headers={"Authorization": f"Bearer {other_user_token}"},
+            )
+            assert response.status_code == status.HTTP_404_NOT_FOUND
+
+            # Send the first chunk
+            response = client.put(
+                f"{url}/{journey_id}/chunks/0", headers=headers, json=trace_information
+            )
+            assert response.status_code == status.HTTP_200_OK
+            assert response.json()["chunks"] == 1
+
+            # A chunk already received is ignored
+            response = client.put(
+                f"{url}/{journey_id}/chunks/0", headers=headers, json=trace_information
+            )
+            assert response.status_code == status.HTTP_200_OK
+            assert response.json()["chunks"] == 1
+
+            # The chunks must follow the order of the trace
+            response = client.put(
+                f"{url}/{journey_id}/chunks/2", headers=headers, json=trace_information
+            )
+            assert response.status_code == status.HTTP_409_CONFLICT
+
+            # Resume the upload
+            response = client.get(f"{url}/{journey_id}", headers=headers)
+            assert response.status_code == status.HTTP_200_OK
+            assert response.json()["chunks"] == 1
+
+            # Close the journey, it is stored in the background
+            response = client.post(f"{url}/{journey_id}/close", headers=headers)
+            assert response.status_code == status.HTTP_200_OK
+            assert response.json()["journey_id"] == journey_id
+
+            response = client.get(f"{url}/{journey_id}", headers=headers)
+            assert response.status_code == status.HTTP_404_NOT_FOUND
+
+            assert JOURNEY_SESSIONS.stats()["finalized"] == 1
+
+        JOURNEY_SESSIONS.clear()
+        clear_test()
+
 
 class TestStatistics:
     """Test Statistic Router"""